@@ -7,12 +7,18 @@ from dotenv import load_dotenv
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 INDEX_PATH = os.getenv("INDEX_PATH", "data/faiss_index")
-METADATA_PATH = os.getenv("METADATA_PATH", "data/github_issues.jsonl")
+# Defaults to the metadata the Indexer saved in INDEX_PATH, whose FAISS ids
+# the index and its sidecars use.
+METADATA_PATH = os.getenv("METADATA_PATH")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache")
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "data/response_cache.sqlite")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
 
+from context_packer import ContextPacker
 from indexer import Indexer
-from retriever import Retriever
-from llm_agent import LLMAgent
-from patch_parser import parse_llm_output
+from patch_parser import StreamingPatchParser
+from pipeline import build_prompt
+from resources import get_registry
 
 def main():
     st.set_page_config(layout="wide")
@@ -40,46 +46,68 @@ def main():
         else:
             with st.spinner("Running debugger..."):
                 try:
-                    # 1. Instantiate components
-                    # Note: Indexer might not be needed if an index already exists.
+                    # 1. Get the shared components
+                    # The index and metadata are loaded once per process and
+                    # reloaded only when the files change on disk.
                     # For this example, we assume a pre-built index.
-                    retriever = Retriever(
+                    registry = get_registry()
+                    retriever = registry.get_retriever(
                         index_path=f"{INDEX_PATH}/index.faiss",
                         metadata_path=METADATA_PATH,
-                        google_api_key=GOOGLE_API_KEY
+                        google_api_key=GOOGLE_API_KEY,
+                        embedding_cache_path=EMBEDDING_CACHE_PATH
+                    )
+                    llm_agent = registry.get_llm_agent(
+                        api_key=GOOGLE_API_KEY,
+                        response_cache_path=RESPONSE_CACHE_PATH,
+                        embedding_cache_path=EMBEDDING_CACHE_PATH
                     )
-                    llm_agent = LLMAgent(api_key=GOOGLE_API_KEY)
 
                     # 2. Retrieve context
                     retrieved_docs = retriever.retrieve(error_snippet, top_k=5)
                     
                     with st.expander("Retrieved Context"):
                         for doc in retrieved_docs:
-                            st.write(f"**Source:** {doc['source']} ({doc['id']}) - **Score:** {doc['score']:.4f}")
+                            match = f" - **Exact match** ({doc['match']})" if doc.get("match") else ""
+                            st.write(f"**Source:** {doc['source']} ({doc['id']}) - **Score:** {doc['score']:.4f}{match}")
                             st.text(doc['content'])
                             st.divider()
 
-                    # 3. Generate patch
-                    context_str = "\n".join([doc['content'] for doc in retrieved_docs])
-                    full_prompt = f"Error and Code:\n{error_snippet}\n\nRetrieved Context:\n{context_str}"
-                    llm_response = llm_agent.generate_patch(full_prompt, file_path=repo_path)
+                    # 3. Generate the patch and parse it while it streams in,
+                    # rendering each patch and test as soon as it is complete.
+                    # Only the most relevant passages that fit the token
+                    # budget go into the prompt.
+                    packer = ContextPacker(registry.get_embedder(EMBEDDING_CACHE_PATH), token_budget=CONTEXT_TOKEN_BUDGET)
+                    full_prompt = build_prompt(error_snippet, packer.pack(error_snippet, retrieved_docs))
+                    parser = StreamingPatchParser(repo_path=repo_path or None)
 
-                    # 4. Parse and display output
-                    parsed_output = parse_llm_output(llm_response)
-                    
                     st.subheader("Suggested Patch")
-                    if parsed_output["patches"]:
-                        for patch in parsed_output["patches"]:
-                            st.code(patch['diff'], language='diff')
-                    else:
-                        st.write("No patch was generated.")
-
+                    patch_area = st.container()
                     st.subheader("Generated Unit Tests")
-                    if parsed_output["unit_tests"]:
-                        for test in parsed_output["unit_tests"]:
-                            st.code(test['code'], language='python')
-                    else:
-                        st.write("No unit tests were generated.")
+                    test_area = st.container()
+                    with st.expander("Raw LLM Response"):
+                        raw_response = st.empty()
+
+                    def render(events):
+                        for kind, item in events:
+                            if kind == "patch":
+                                patch_area.code(item['diff'], language='diff')
+                            else:
+                                test_area.code(item['code'], language='python')
+
+                    llm_response = ""
+                    for chunk in llm_agent.generate_patch_stream(full_prompt, file_path=repo_path):
+                        llm_response += chunk
+                        raw_response.text(llm_response)
+                        render(parser.feed(chunk))
+                    render(parser.close())
+
+                    # 4. Report empty sections
+                    parsed_output = parser.result()
+                    if not parsed_output["patches"]:
+                        patch_area.write("No patch was generated.")
+                    if not parsed_output["unit_tests"]:
+                        test_area.write("No unit tests were generated.")
 
                     st.success("Debugging complete!")
                 
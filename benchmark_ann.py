@@ -0,0 +1,83 @@
+import argparse
+import time
+import faiss
+import numpy as np
+
+from index_factory import build_index, search_parameters
+
+# Measures recall@k against the exact flat index and per-query p50/p99
+# latency for each approximate index type on a synthetic, clustered corpus:
+#   python benchmark_ann.py --sizes 10000,100000 --dim 128 --k 10
+# Corpora of 1M vectors work too but need a few GB of RAM and several minutes
+# of training and graph construction.
+
+CONFIGS = [
+    ("flat", {}),
+    ("ivf_flat", {"nprobe": 1}),
+    ("ivf_flat", {"nprobe": 8}),
+    ("ivf_flat", {"nprobe": 32}),
+    ("ivf_pq", {"nprobe": 8}),
+    ("ivf_pq", {"nprobe": 32}),
+    ("hnsw", {"ef_search": 16}),
+    ("hnsw", {"ef_search": 64}),
+    ("hnsw", {"ef_search": 256}),
+]
+
+
+def make_corpus(n: int, dim: int, num_queries: int, seed: int = 0):
+    """Generates unit-norm vectors drawn around random cluster centres, like real embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(n // 100, 1), dim)).astype("float32")
+    corpus = centers[rng.integers(len(centers), size=n)] + 0.5 * rng.standard_normal((n, dim)).astype("float32")
+    queries = centers[rng.integers(len(centers), size=num_queries)] + 0.5 * rng.standard_normal((num_queries, dim)).astype("float32")
+    faiss.normalize_L2(corpus)
+    faiss.normalize_L2(queries)
+    return corpus, queries
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(np.intersect1d(f, t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def latency_percentiles(index, queries: np.ndarray, k: int, params):
+    """Times single-query searches, which is how the retriever issues them."""
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query.reshape(1, -1), k, params=params)
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    return np.percentile(timings, 50), np.percentile(timings, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=str, default='10000,100000')
+    parser.add_argument('--dim', type=int, default=128)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    for n in [int(size) for size in args.sizes.split(',')]:
+        corpus, queries = make_corpus(n, args.dim, args.queries)
+        print(f"\n== {n} vectors, dim={args.dim}, k={args.k}, {args.queries} queries ==")
+        print(f"{'index':<10} {'knob':<14} {'build s':>8} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8}")
+        built = {}
+        truth = None
+        for index_type, knobs in CONFIGS:
+            if index_type not in built:
+                start = time.perf_counter()
+                built[index_type] = (build_index(corpus, index_type, metric="ip"), time.perf_counter() - start)
+            index, build_seconds = built[index_type]
+            params = search_parameters(index, **knobs)
+            _, found = index.search(queries, args.k, params=params)
+            if truth is None:
+                truth = found
+            p50, p99 = latency_percentiles(index, queries, args.k, params)
+            knob = ",".join(f"{name}={value}" for name, value in knobs.items()) or "-"
+            print(f"{index_type:<10} {knob:<14} {build_seconds:8.2f} {recall_at_k(found, truth):7.3f} {p50:8.3f} {p99:8.3f}")
+
+
+if __name__ == '__main__':
+    main()
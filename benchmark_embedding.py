@@ -0,0 +1,44 @@
+import argparse
+import time
+
+from embedder import BatchEmbedder, HashEmbeddingBackend
+
+# Compares the old one-request-per-document loop with the batched, concurrent
+# embedding stage. The local hash backend simulates the network round trip,
+# so this runs offline:
+#   python benchmark_embedding.py --docs 500 --latency 0.02
+
+
+def make_documents(n: int):
+    return [f"Issue {i}: TypeError in module_{i % 37}.py when calling handler_{i % 11}()" for i in range(n)]
+
+
+def run(documents, latency: float, batch_size: int, concurrency: int) -> float:
+    backend = HashEmbeddingBackend(dim=128, latency=latency)
+    embedder = BatchEmbedder(backend, max_batch_size=batch_size, max_concurrency=concurrency)
+    start = time.perf_counter()
+    embedder.embed(documents)
+    elapsed = time.perf_counter() - start
+    print(
+        f"batch_size={batch_size:<4} concurrency={concurrency:<3} requests={backend.calls:<5} "
+        f"time={elapsed:8.3f}s throughput={len(documents) / elapsed:10.1f} docs/s"
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.02, help='Simulated seconds per request.')
+    parser.add_argument('--batch_size', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    documents = make_documents(args.docs)
+    serial = run(documents, args.latency, batch_size=1, concurrency=1)
+    batched = run(documents, args.latency, batch_size=args.batch_size, concurrency=args.concurrency)
+    print(f"Speedup: {serial / batched:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import logging
+import re
+import time
+
+from patch_parser import parse_llm_output
+
+# Compares the previous regex-based extraction and validation, which rescans
+# the whole response prefix for the file path of every test block, with the
+# single-pass parser and AST validation on synthetic multi-megabyte LLM
+# responses:
+#   python benchmark_patch_parser.py --sizes 0.5 1 2
+
+
+def make_response(size_mb: float) -> str:
+    blocks = []
+    total = 0
+    i = 0
+    while total < size_mb * 1024 * 1024:
+        block = (
+            f"Step {i}: the handler in module_{i}.py divides by the length of an empty list. "
+            + "The surrounding explanation goes on for a while. " * 12
+            + f"\n\ndiff --git a/src/module_{i}.py b/src/module_{i}.py\n"
+            f"--- a/src/module_{i}.py\n+++ b/src/module_{i}.py\n@@ -1,2 +1,2 @@\n"
+            f" def handler_{i}(items):\n-    return sum(items) / len(items)\n"
+            f"+    return sum(items) / max(len(items), 1)\n\n"
+            f"A test for it:\n```python\ndef test_handler_{i}():\n    assert handler_{i}([]) == 0\n```\n\n"
+            f"# File: tests/test_module_{i}.py\ndef test_handler_{i}_inline():\n    assert True\n\n"
+        )
+        blocks.append(block)
+        total += len(block)
+        i += 1
+    return "".join(blocks)
+
+
+def legacy_parse_llm_output(text: str):
+    return {"patches": _legacy_extract_patches(text), "unit_tests": _legacy_extract_unit_tests(text)}
+
+
+def _legacy_validate_patch(diff_text: str) -> bool:
+    if re.search(r"\+\s*.*(\w+\s*\+\s*['\"].*['\"])", diff_text) or re.search(r"\+\s*.*(['\"].*['\"]\s*\+\s*\w+)", diff_text):
+        if not re.search(r"\+\s*.*(['\"].*['\"]\s*\+\s*['\"].*['\"])", diff_text):
+            return False
+    return True
+
+
+def _legacy_extract_patches(text: str):
+    diff_pattern = re.compile(
+        r"diff --git a/(.+) b/(.+)\n--- a/.*\n\+\+\+ b/.*\n@@ .* @@\n([\s\S]*?)(?=\ndiff --git|\Z)",
+        re.MULTILINE,
+    )
+    patches = []
+    for match in diff_pattern.finditer(text):
+        file_path = match.group(1)
+        diff_text = f"diff --git a/{file_path} b/{match.group(2)}\n--- a/{file_path}\n+++ b/{match.group(2)}\n@@ {match.group(3)}"
+        if _legacy_validate_patch(diff_text):
+            patches.append({"file_path": file_path, "diff": diff_text})
+    return patches
+
+
+def _legacy_extract_file_path(text: str, match_start: int):
+    preceding_text = text[:match_start]
+    diff_header_match = re.findall(r"diff --git a/(\S+) b/\S+", preceding_text)
+    if diff_header_match:
+        return diff_header_match[-1]
+    plus_minus_header_match = re.findall(r"--- a/(\S+)", preceding_text)
+    if plus_minus_header_match:
+        return plus_minus_header_match[-1]
+    plus_header_match = re.findall(r"\+\+\+ b/(\S+)", preceding_text)
+    if plus_header_match:
+        return plus_header_match[-1]
+    marker_match = re.findall(r"(?:#|File:|Path:)\s*([\w/\\-]+\.py)", preceding_text)
+    if marker_match:
+        return marker_match[-1].replace("\\", "/").strip()
+    return None
+
+
+def _legacy_extract_unit_tests(text: str):
+    unit_tests = []
+    processed_tests = set()
+    fenced_code_pattern = re.compile(r"```python\n(.*?)\n```", re.DOTALL)
+    for match in fenced_code_pattern.finditer(text):
+        code_block = match.group(1)
+        test_funcs = re.findall(r"def (test_[A-Za-z0-9_]+)", code_block)
+        if test_funcs:
+            file_path = _legacy_extract_file_path(text, match.start())
+            for func in test_funcs:
+                if func not in processed_tests:
+                    unit_tests.append({"file_path": file_path, "code": code_block})
+                    processed_tests.add(func)
+                    break
+    inline_test_pattern = re.compile(r"^(def (test_[A-Za-z0-9_]+)\(.*?\):.*?)(?=\n\n|\Z)", re.DOTALL | re.MULTILINE)
+    for match in inline_test_pattern.finditer(text):
+        if match.group(2) not in processed_tests:
+            file_path = _legacy_extract_file_path(text, match.start())
+            unit_tests.append({"file_path": file_path, "code": match.group(1)})
+            processed_tests.add(match.group(2))
+    return unit_tests
+
+
+def run(name: str, parse, text: str) -> float:
+    start = time.perf_counter()
+    result = parse(text)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<12} patches={len(result['patches']):<6} tests={len(result['unit_tests']):<6} "
+        f"time={elapsed:8.3f}s throughput={len(text) / elapsed / 1e6:8.2f} MB/s"
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=float, nargs='+', default=[0.5, 1.0, 2.0], help='Response sizes in MB.')
+    parser.add_argument('--legacy_max_mb', type=float, default=2.0, help='Skip the quadratic baseline above this size.')
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    for size_mb in args.sizes:
+        text = make_response(size_mb)
+        print(f"--- {len(text) / 1e6:.2f} MB response ---")
+        single_pass = run("single-pass", parse_llm_output, text)
+        if size_mb <= args.legacy_max_mb:
+            legacy = run("legacy", legacy_parse_llm_output, text)
+            print(f"Speedup: {legacy / single_pass:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
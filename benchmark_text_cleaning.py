@@ -0,0 +1,67 @@
+import argparse
+import logging
+import os
+import re
+import time
+
+from bs4 import BeautifulSoup
+from text_cleaning import clean, clean_many
+
+# Compares the previous cleaner, which built a BeautifulSoup tree for every
+# record, with the precompiled-regex cleaner in one process and on a process
+# pool, on synthetic GitHub (Markdown) and Stack Overflow (HTML) records:
+#   python benchmark_text_cleaning.py --records 20000 --processes 4
+
+
+def make_records(n: int):
+    records = []
+    for i in range(n):
+        if i % 2:
+            records.append(
+                f"<p>Calling <code>handler_{i}()</code> raises a <strong>KeyError</strong> when the config &amp; cache are empty.</p>\n"
+                + "<p>The surrounding explanation goes on for a while, with <a href=\"https://example.com/{i}\">links</a>.</p>\n" * 6
+                + f"<pre class=\"lang-py prettyprint-override\"><code>def handler_{i}(config):\n    return config[&quot;key_{i}&quot;]\n</code></pre>\n"
+                + "<ul><li>Python 3.11</li><li>Linux</li></ul>"
+            )
+        else:
+            records.append(
+                f"handler_{i} crashes on start\n\n### Describe the bug\n"
+                + "The surrounding explanation goes on for a while, mentioning `config` and other details. " * 6
+                + f"\n\n```python\nTraceback (most recent call last):\n  File \"app.py\", line {i}, in <module>\n    handler_{i}()\nKeyError: 'key_{i}'\n```\n\n"
+                + "<details><summary>Environment</summary>Python 3.11 on Linux</details>"
+            )
+    return records
+
+
+def legacy_clean_text(raw_text: str) -> str:
+    if not raw_text:
+        return ""
+    text = re.sub(r"```.*?```", "", raw_text, flags=re.DOTALL)
+    text = BeautifulSoup(text, "html.parser").get_text()
+    return " ".join(text.split())
+
+
+def run(name: str, clean_all, records) -> float:
+    start = time.perf_counter()
+    count = sum(1 for _ in clean_all(records))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<16} records={count:<7} time={elapsed:8.3f}s throughput={count / elapsed:10.1f} records/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    records = make_records(args.records)
+    legacy = run("beautifulsoup", lambda rs: map(legacy_clean_text, rs), records)
+    regex = run("regex", lambda rs: map(clean, rs), records)
+    pool = run(f"regex x{args.processes}", lambda rs: clean_many(rs, processes=args.processes), records)
+    print(f"Speedup: {legacy / regex:.1f}x in one process, {legacy / pool:.1f}x on {args.processes} processes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+
+from dataclasses import dataclass, field
+from llm_agent import LLMAgent
+from patch_parser import StreamingPatchParser
+from patch_validation import Issue, PatchValidator
+from sandbox_runner import SandboxResult, SandboxRunner
+from typing import Dict, List, Optional, Tuple
+from unified_diff import FileDiff
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Candidate:
+    """One sampled completion with its parse, validation and test results."""
+    index: int
+    response: str
+    parsed_output: Dict
+    rejected: List[Tuple[FileDiff, List[Issue]]] = field(default_factory=list)
+    test_results: Optional[List[SandboxResult]] = None
+    duplicates: int = 0
+
+    @property
+    def passed(self) -> bool:
+        """
+        Whether the candidate passes validation.
+
+        It needs at least one patch and no rejected ones. When tests were
+        run, it also needs at least one test, with every test passing.
+        """
+        if not self.parsed_output["patches"] or self.rejected:
+            return False
+        if self.test_results is None:
+            return True
+        return bool(self.test_results) and all(result.passed for result in self.test_results)
+
+    @property
+    def score(self) -> Tuple:
+        """A sort key; higher is better, earlier samples win ties."""
+        tests_passed = sum(result.passed for result in self.test_results or [])
+        return (
+            self.passed,
+            tests_passed,
+            bool(self.parsed_output["patches"]),
+            -len(self.rejected),
+            bool(self.parsed_output["unit_tests"]),
+            -self.index,
+        )
+
+    def dedup_key(self) -> Tuple:
+        """
+        Identifies candidates that make the same change.
+
+        Only the added and removed lines count, with whitespace collapsed,
+        so diffs that differ in context, hunk ranges or formatting collapse
+        into one.
+        """
+        patches = self.parsed_output["patches"]
+        if not patches:
+            return ("text", " ".join(self.response.split()))
+        return tuple(
+            (patch["file_path"], tuple(
+                (kind, " ".join(text.split()))
+                for hunk in patch["file_diff"].hunks
+                for kind, text in hunk.lines
+                if kind != " "
+            ))
+            for patch in patches
+        )
+
+
+class BestOfNGenerator:
+    """
+    Samples several completions concurrently and returns them ranked.
+
+    All N generations are issued at once, each capped at an equal share of
+    the output token budget. As each one arrives it is parsed and validated
+    in a worker thread while the others are still generating. Duplicates are
+    dropped before the (optional) sandboxed tests run. With `early_exit`, the
+    first candidate that passes validation cancels the rest, so the latency
+    is that of the fastest good sample rather than of N retries in a row.
+    """
+    def __init__(
+        self,
+        llm_agent: LLMAgent,
+        n: int = 4,
+        token_budget: int = 8192,
+        temperature: float = 0.8,
+        validator: PatchValidator = None,
+        sandbox: SandboxRunner = None,
+        early_exit: bool = True,
+    ):
+        """
+        Initializes the BestOfNGenerator.
+
+        Args:
+            llm_agent: The agent used for every sample.
+            n: The number of candidates to sample.
+            token_budget: The total output tokens across all candidates.
+            temperature: The sampling temperature, so candidates differ.
+            validator: The patch validator; the parser's default if None.
+            sandbox: An optional SandboxRunner that runs each unique
+                candidate's unit tests against its patches.
+            early_exit: Whether to stop at the first passing candidate.
+        """
+        self.llm_agent = llm_agent
+        self.n = n
+        self.token_budget = token_budget
+        self.temperature = temperature
+        self.validator = validator
+        self.sandbox = sandbox
+        self.early_exit = early_exit
+
+    def _parse(self, index: int, response: str, repo_path: str = None) -> Candidate:
+        parser = StreamingPatchParser(repo_path=repo_path, validator=self.validator)
+        parser.feed(response)
+        parser.close()
+        return Candidate(index=index, response=response, parsed_output=parser.result(), rejected=parser.rejected)
+
+    def _test(self, candidate: Candidate) -> Candidate:
+        candidate.test_results = self.sandbox.verify(candidate.parsed_output)
+        return candidate
+
+    async def _sample(self, index: int, context: str, file_path: str = None) -> Tuple[int, str]:
+        response = await self.llm_agent.generate_patch_async(
+            context,
+            file_path=file_path,
+            temperature=self.temperature,
+            max_output_tokens=max(1, self.token_budget // self.n),
+            use_cache=False,
+        )
+        return index, response
+
+    async def generate(self, context: str, file_path: str = None, repo_path: str = None) -> List[Candidate]:
+        """
+        Samples up to N candidates and ranks them.
+
+        Args:
+            context: The prompt context, as for `generate_patch`.
+            file_path: An optional path passed on to the LLM prompt.
+            repo_path: An optional checkout used to validate the patches.
+
+        Returns:
+            The unique candidates, best first. With `early_exit`, generation
+            stops at the first passing candidate, so fewer may be returned.
+            Failed API calls are left out.
+        """
+        stages = {}
+        for index in range(self.n):
+            stages[asyncio.create_task(self._sample(index, context, file_path))] = "sample"
+        candidates: List[Candidate] = []
+        seen: Dict[Tuple, Candidate] = {}
+        pending = set(stages)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                finished = False
+                for task in done:
+                    stage = stages.pop(task)
+                    if stage == "sample":
+                        index, response = task.result()
+                        if response.startswith("Error:"):
+                            logger.warning(f"Candidate {index} failed: {response}")
+                            continue
+                        follow_up = asyncio.create_task(asyncio.to_thread(self._parse, index, response, repo_path))
+                        stages[follow_up] = "parse"
+                        pending.add(follow_up)
+                    elif stage == "parse":
+                        candidate = task.result()
+                        key = candidate.dedup_key()
+                        if key in seen:
+                            seen[key].duplicates += 1
+                            continue
+                        seen[key] = candidate
+                        if self.sandbox is not None and candidate.parsed_output["patches"] and not candidate.rejected:
+                            follow_up = asyncio.create_task(asyncio.to_thread(self._test, candidate))
+                            stages[follow_up] = "test"
+                            pending.add(follow_up)
+                            continue
+                        if self.sandbox is not None:
+                            candidate.test_results = []
+                        candidates.append(candidate)
+                        finished = finished or (self.early_exit and candidate.passed)
+                    else:
+                        candidate = task.result()
+                        candidates.append(candidate)
+                        finished = finished or (self.early_exit and candidate.passed)
+                if finished:
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        candidates.sort(key=lambda candidate: candidate.score, reverse=True)
+        logger.info(
+            f"Best-of-{self.n}: {len(candidates)} unique candidates, "
+            f"{sum(c.passed for c in candidates)} passing, {sum(c.duplicates for c in candidates)} duplicates"
+        )
+        return candidates
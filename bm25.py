@@ -0,0 +1,307 @@
+import logging
+import numpy as np
+import os
+import re
+
+from array import array
+from chunker import CHUNKS_FILE, index_units, load_chunks
+from collections import Counter
+from metadata_store import open_metadata_store, record_content
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BM25_FILE = "bm25.npz"
+
+# Identifiers, dotted module paths and numbers. "openai._base_client.request"
+# is indexed whole and as its parts, so both exact paths and names match.
+_TOKEN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*|\d+")
+_MAX_TOKEN_LENGTH = 64
+
+
+def tokenize(text: str) -> Iterator[str]:
+    """Yields the lowercased lexical tokens of `text`."""
+    for match in _TOKEN.finditer(text or ""):
+        token = match.group().lower()
+        if len(token) > _MAX_TOKEN_LENGTH:
+            continue
+        yield token
+        if "." in token:
+            yield from token.split(".")
+
+
+class BM25Index:
+    """
+    An in-memory inverted index with Okapi BM25 scoring.
+
+    Postings are stored as flat arrays in term order: `term_starts[t]` to
+    `term_starts[t + 1]` delimit term t's slice of `postings` (document rows,
+    int32) and `frequencies` (term counts, uint16). Each document row maps to
+    an external id, such as a FAISS id, through `ids`. Queries only touch the
+    postings of their own terms, and scoring is vectorized per term.
+    """
+    def __init__(
+        self,
+        terms: List[str],
+        term_starts: np.ndarray,
+        postings: np.ndarray,
+        frequencies: np.ndarray,
+        doc_lengths: np.ndarray,
+        ids: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.term_ids: Dict[str, int] = {term: i for i, term in enumerate(terms)}
+        self.term_starts = term_starts
+        self.postings = postings
+        self.frequencies = frequencies
+        self.doc_lengths = doc_lengths
+        self.ids = ids
+        self.k1 = k1
+        self.b = b
+        self.average_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        self._length_norm = (k1 * (1 - b + b * doc_lengths / max(self.average_length, 1e-9))).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    @classmethod
+    def build(cls, texts: Iterable[str], ids: Sequence[int] = None, k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """
+        Builds an index over `texts`.
+
+        Args:
+            texts: The documents, streamed once.
+            ids: The external id of each document. Defaults to its position.
+            k1: The BM25 term-frequency saturation.
+            b: The BM25 length normalization.
+
+        Returns:
+            The index.
+        """
+        term_ids: Dict[str, int] = {}
+        term_column, doc_column, tf_column = array("i"), array("i"), array("H")
+        doc_lengths = array("i")
+        for row, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_column.append(term_ids.setdefault(term, len(term_ids)))
+                doc_column.append(row)
+                tf_column.append(min(tf, 65535))
+        term_column = np.frombuffer(term_column, dtype=np.int32) if len(term_column) else np.zeros(0, dtype=np.int32)
+        # A stable sort keeps each term's postings in document order.
+        order = np.argsort(term_column, kind="stable")
+        term_starts = np.zeros(len(term_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_column, minlength=len(term_ids)), out=term_starts[1:])
+        doc_lengths = np.array(doc_lengths, dtype=np.int32)
+        ids = np.arange(len(doc_lengths), dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+        if len(ids) != len(doc_lengths):
+            raise ValueError(f"Got {len(ids)} ids for {len(doc_lengths)} documents.")
+        return cls(
+            list(term_ids),
+            term_starts,
+            np.array(doc_column, dtype=np.int32)[order],
+            np.array(tf_column, dtype=np.uint16)[order],
+            doc_lengths,
+            ids,
+            k1=k1,
+            b=b,
+        )
+
+    def update(self, removed_ids: Sequence[int], texts: Iterable[str], ids: Sequence[int]) -> "BM25Index":
+        """
+        Returns a copy without the documents `removed_ids` and with `texts` added.
+
+        Only the added texts are tokenized; the kept postings are carried
+        over as arrays, so the cost follows the change set rather than the
+        corpus. Terms that lose all their postings stay in the vocabulary.
+
+        Args:
+            removed_ids: The external ids of the documents to drop.
+            texts: The documents to add, streamed once.
+            ids: The external id of each added document.
+
+        Returns:
+            The updated index.
+        """
+        added = BM25Index.build(texts, ids=ids, k1=self.k1, b=self.b)
+        keep = ~np.isin(self.ids, np.asarray(removed_ids, dtype=np.int64))
+        new_rows = np.cumsum(keep, dtype=np.int64) - 1
+        old_terms = np.repeat(np.arange(len(self.term_ids), dtype=np.int32), np.diff(self.term_starts))
+        kept = keep[self.postings]
+
+        # Term ids are assigned in insertion order, so the dicts list the terms by id.
+        terms = list(self.term_ids)
+        term_ids = dict(self.term_ids)
+        for term in added.term_ids:
+            if term not in term_ids:
+                term_ids[term] = len(terms)
+                terms.append(term)
+        added_term_map = np.array([term_ids[term] for term in added.term_ids], dtype=np.int32)
+        added_terms = np.repeat(np.arange(len(added.term_ids), dtype=np.int32), np.diff(added.term_starts))
+
+        term_column = np.concatenate([old_terms[kept], added_term_map[added_terms]])
+        doc_column = np.concatenate([new_rows[self.postings[kept]].astype(np.int32), added.postings + np.int32(keep.sum())])
+        tf_column = np.concatenate([self.frequencies[kept], added.frequencies])
+        # Kept rows come before added ones, so a stable sort keeps each term's postings in document order.
+        order = np.argsort(term_column, kind="stable")
+        term_starts = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_column, minlength=len(terms)), out=term_starts[1:])
+        return BM25Index(
+            terms,
+            term_starts,
+            doc_column[order],
+            tf_column[order],
+            np.concatenate([self.doc_lengths[keep], added.doc_lengths]),
+            np.concatenate([self.ids[keep], added.ids]),
+            k1=self.k1,
+            b=self.b,
+        )
+
+    def search(self, query: str, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Scores the documents that share a term with `query`.
+
+        Args:
+            query: The query text.
+            top_k: The number of hits to return.
+
+        Returns:
+            (scores, ids) arrays of length `top_k`, best first, padded with
+            0 and -1 like a FAISS search result.
+        """
+        scores = np.zeros(len(self), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_starts[term_id], self.term_starts[term_id + 1]
+            rows = self.postings[start:end]
+            tf = self.frequencies[start:end].astype(np.float32)
+            df = end - start
+            idf = np.log(1 + (len(self) - df + 0.5) / (df + 0.5))
+            scores[rows] += idf * tf * (self.k1 + 1) / (tf + self._length_norm[rows])
+        hit_scores = np.zeros(top_k, dtype=np.float32)
+        hit_ids = np.full(top_k, -1, dtype=np.int64)
+        matched = np.flatnonzero(scores)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        hit_scores[:len(matched)] = scores[matched]
+        hit_ids[:len(matched)] = self.ids[matched]
+        return hit_scores, hit_ids
+
+    def save(self, path: str):
+        """Writes the index to an `.npz` file through a temporary file."""
+        terms = [""] * len(self.term_ids)
+        for term, i in self.term_ids.items():
+            terms[i] = term
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            terms=np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+            term_starts=self.term_starts,
+            postings=self.postings,
+            frequencies=self.frequencies,
+            doc_lengths=self.doc_lengths,
+            ids=self.ids,
+            params=np.array([self.k1, self.b]),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Loads an index written by `save`."""
+        with np.load(path) as data:
+            blob = data["terms"].tobytes().decode("utf-8")
+            k1, b = data["params"].tolist()
+            return cls(
+                blob.split("\n") if blob else [],
+                data["term_starts"],
+                data["postings"],
+                data["frequencies"],
+                data["doc_lengths"],
+                data["ids"],
+                k1=k1,
+                b=b,
+            )
+
+
+def reciprocal_rank_fusion(rankings: Sequence[np.ndarray], top_k: int, k: int = 60) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fuses ranked id lists with reciprocal rank fusion.
+
+    Each id scores the sum of 1 / (k + rank) over the lists it appears in,
+    so it needs no calibration between BM25 and cosine scores.
+
+    Args:
+        rankings: Id arrays, best first; negative ids are ignored.
+        top_k: The number of fused hits to return.
+        k: The RRF rank constant.
+
+    Returns:
+        (scores, ids) arrays of length `top_k`, padded with 0 and -1.
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking.tolist()):
+            if doc_id >= 0:
+                fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    best = sorted(fused.items(), key=lambda item: -item[1])[:top_k]
+    scores = np.zeros(top_k, dtype=np.float32)
+    ids = np.full(top_k, -1, dtype=np.int64)
+    for i, (doc_id, score) in enumerate(best):
+        scores[i], ids[i] = score, doc_id
+    return scores, ids
+
+
+def build_for_index(content_of: Callable[[int], str], doc_ids: Sequence[int], chunks: np.ndarray = None) -> BM25Index:
+    """
+    Builds a lexical index whose ids match a FAISS index (see `chunker.index_units`).
+
+    Args:
+        content_of: Returns the text of a document id.
+        doc_ids: The document ids of an unchunked index.
+        chunks: The chunk table of a chunked index.
+
+    Returns:
+        The index.
+    """
+    ids, texts = index_units(content_of, doc_ids, chunks)
+    return BM25Index.build(texts, ids=ids)
+
+
+def build_from_metadata(metadata_path: str, index_dir: str) -> BM25Index:
+    """
+    Builds the lexical index for a metadata file and saves it next to `index.faiss`.
+
+    Raises:
+        ValueError: If `index_dir` is a versioned index saved by the Indexer
+            (a symlink), which already has its own lexical index. Writing
+            into the live version would pair it with another corpus.
+    """
+    if os.path.islink(os.path.normpath(index_dir)):
+        raise ValueError(f"{index_dir} is a versioned index saved by the Indexer; rebuild it with indexer.py instead.")
+    store = open_metadata_store(metadata_path)
+    try:
+        chunks_path = os.path.join(index_dir, CHUNKS_FILE)
+        chunks = load_chunks(chunks_path) if os.path.exists(chunks_path) else None
+        index = build_for_index(lambda i: record_content(store[i]), store.ids(), chunks)
+    finally:
+        store.close()
+    index.save(os.path.join(index_dir, BM25_FILE))
+    logger.info(f"Built lexical index over {len(index)} rows with {len(index.term_ids)} terms.")
+    return index
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the BM25 index for a JSONL corpus next to its FAISS index.")
+    parser.add_argument('--metadata_path', type=str, default='data/github_issues.jsonl')
+    parser.add_argument('--index_dir', type=str, required=True)
+    args = parser.parse_args()
+    build_from_metadata(args.metadata_path, args.index_dir)
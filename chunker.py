@@ -0,0 +1,298 @@
+import logging
+import numpy as np
+import os
+import re
+
+from context_packer import estimate_tokens
+from typing import Callable, Iterable, Iterator, List, Sequence, Tuple
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHUNKS_FILE = "chunks.npy"
+
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_TRACEBACK_START = re.compile(r"^\s*Traceback \(most recent call last\):")
+_FRAME = re.compile(r"^\s+File \"")
+_WORD = re.compile(r"\S+\s*")
+
+Span = Tuple[int, int, int]
+
+
+def _line_spans(text: str, start: int, end: int) -> List[Tuple[int, int]]:
+    spans = []
+    position = start
+    for line in text[start:end].splitlines(keepends=True):
+        spans.append((position, position + len(line)))
+        position += len(line)
+    return spans
+
+
+def _blocks(text: str) -> List[Tuple[int, int, str]]:
+    """
+    Splits `text` into (start, end, kind) blocks that chunks must not cut.
+
+    Fenced code blocks and Python tracebacks (from the "Traceback" line to
+    the exception line) are single blocks of kind "code" and "traceback".
+    Everything else becomes one "text" block per paragraph. Blank lines
+    between blocks belong to no block.
+    """
+    lines = _line_spans(text, 0, len(text))
+    blocks = []
+    i = 0
+    while i < len(lines):
+        start, end = lines[i]
+        line = text[start:end]
+        if not line.strip():
+            i += 1
+            continue
+        if _FENCE.match(line):
+            j = i + 1
+            while j < len(lines) and not _FENCE.match(text[lines[j][0]:lines[j][1]]):
+                j += 1
+            j = min(j, len(lines) - 1)
+            blocks.append((start, lines[j][1], "code"))
+            i = j + 1
+        elif _TRACEBACK_START.match(line):
+            # Frames are indented; the first unindented line is the exception.
+            j = i + 1
+            while j < len(lines) and text[lines[j][0]:lines[j][1]][:1] in (" ", "\t"):
+                j += 1
+            j = min(j, len(lines) - 1)
+            blocks.append((start, lines[j][1], "traceback"))
+            i = j + 1
+        else:
+            j = i
+            while j + 1 < len(lines):
+                following = text[lines[j + 1][0]:lines[j + 1][1]]
+                if not following.strip() or _FENCE.match(following) or _TRACEBACK_START.match(following):
+                    break
+                j += 1
+            blocks.append((start, lines[j][1], "text"))
+            i = j + 1
+    return blocks
+
+
+def _split_oversized(text: str, start: int, end: int, kind: str, max_tokens: int, word_tokens: int) -> List[Span]:
+    """
+    Splits a block larger than `max_tokens` into (start, end, tokens) units.
+
+    Code and text are split at line ends. Tracebacks are split before a
+    "File ..." frame line where possible, so frames stay whole. Single lines
+    that are still too long fall back to word boundaries, in pieces of
+    `word_tokens` so that windows over them can still overlap.
+    """
+    units: List[Span] = []
+    lines = _line_spans(text, start, end)
+    current_start, current_tokens = start, 0
+    for index, (line_start, line_end) in enumerate(lines):
+        line = text[line_start:line_end]
+        tokens = estimate_tokens(line)
+        if tokens > max_tokens:
+            if current_tokens:
+                units.append((current_start, line_start, current_tokens))
+            units.extend(_split_words(text, line_start, line_end, word_tokens))
+            current_start, current_tokens = line_end, 0
+            continue
+        at_frame = kind != "traceback" or _FRAME.match(line) or index == 0
+        if current_tokens and current_tokens + tokens > max_tokens and at_frame:
+            units.append((current_start, line_start, current_tokens))
+            current_start, current_tokens = line_start, 0
+        current_tokens += tokens
+    if current_tokens:
+        units.append((current_start, end, current_tokens))
+    return units
+
+
+def _split_words(text: str, start: int, end: int, max_tokens: int) -> List[Span]:
+    units: List[Span] = []
+    current_start, current_tokens = start, 0
+    for match in _WORD.finditer(text, start, end):
+        tokens = estimate_tokens(match.group())
+        if current_tokens and current_tokens + tokens > max_tokens:
+            units.append((current_start, match.start(), current_tokens))
+            current_start, current_tokens = match.start(), 0
+        current_tokens += tokens
+    if current_tokens:
+        units.append((current_start, end, current_tokens))
+    return units
+
+
+class Chunker:
+    """
+    Splits documents into overlapping passages for embedding.
+
+    Passages are sliding windows over whole blocks: paragraphs, fenced code
+    blocks and tracebacks are never cut unless a single one is larger than
+    a passage, and then only at line (or traceback frame) boundaries.
+    Consecutive windows share up to `overlap_tokens` of trailing blocks, so
+    an answer that straddles a boundary is still embedded in one piece.
+    Passages are (start, end) character offsets into the document, so the
+    index only stores integers and the text is sliced from the corpus.
+    """
+    def __init__(self, chunk_tokens: int = 256, overlap_tokens: int = 32):
+        """
+        Initializes the Chunker.
+
+        Args:
+            chunk_tokens: The target passage size in estimated tokens.
+            overlap_tokens: The most estimated tokens that consecutive
+                passages of a document share.
+        """
+        if chunk_tokens <= 0:
+            raise ValueError("chunk_tokens must be positive.")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = max(0, min(overlap_tokens, chunk_tokens // 2))
+
+    def _units(self, text: str) -> List[Span]:
+        units: List[Span] = []
+        for start, end, kind in _blocks(text):
+            tokens = estimate_tokens(text[start:end])
+            if tokens > self.chunk_tokens:
+                units.extend(_split_oversized(text, start, end, kind, self.chunk_tokens, max(1, self.chunk_tokens // 4)))
+            else:
+                units.append((start, end, tokens))
+        return units
+
+    def chunk(self, text: str) -> List[Tuple[int, int]]:
+        """
+        Splits one document into passages.
+
+        Args:
+            text: The document text.
+
+        Returns:
+            The (start, end) character offsets of each passage, in order.
+            A document with no text has no passages.
+        """
+        units = self._units(text)
+        spans = []
+        i = 0
+        while i < len(units):
+            j, tokens = i, 0
+            while j < len(units) and (j == i or tokens + units[j][2] <= self.chunk_tokens):
+                tokens += units[j][2]
+                j += 1
+            spans.append((units[i][0], units[j - 1][1]))
+            if j >= len(units):
+                break
+            # Start the next window a few whole units back, but always move forward.
+            k, shared = j, 0
+            while k - 1 > i and shared + units[k - 1][2] <= self.overlap_tokens:
+                k -= 1
+                shared += units[k][2]
+            i = k
+        return spans
+
+    def chunk_documents(self, texts: Iterable[str], parent_ids: Sequence[int] = None) -> np.ndarray:
+        """
+        Chunks many documents into a compact chunk table.
+
+        Args:
+            texts: The document texts.
+            parent_ids: The id each document is looked up by in the metadata
+                store. Defaults to the document's position.
+
+        Returns:
+            An (n_chunks, 3) int32 array of (parent id, start, end) rows.
+        """
+        rows = []
+        for position, text in enumerate(texts):
+            parent = position if parent_ids is None else int(parent_ids[position])
+            rows.extend((parent, start, end) for start, end in self.chunk(text))
+        return np.array(rows, dtype="int32").reshape(-1, 3)
+
+
+def save_chunks(path: str, chunks: np.ndarray):
+    """Writes a chunk table next to the index, through a temporary file."""
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, np.asarray(chunks, dtype="int32"))
+    os.replace(tmp_path, path)
+
+
+def load_chunks(path: str) -> np.ndarray:
+    """Memory-maps a chunk table written by `save_chunks`."""
+    return np.load(path, mmap_mode="r")
+
+
+def index_units(content_of: Callable[[int], str], doc_ids: Sequence[int], chunks: np.ndarray = None, chunk_ids: Sequence[int] = None) -> Tuple[np.ndarray, Iterator[str]]:
+    """
+    Lists the units a FAISS index holds, for the sidecar indexes built next to it.
+
+    An unchunked index holds one unit per document, keyed by document id. A
+    chunked index holds one unit per live chunk, keyed by chunk id, and its
+    text is sliced from the parent document.
+
+    Args:
+        content_of: Returns the text of a document id.
+        doc_ids: The document ids of an unchunked index.
+        chunks: The chunk table of a chunked index.
+        chunk_ids: Only list these chunks of a chunked index, e.g. the ones
+            an update added. Defaults to every live chunk.
+
+    Returns:
+        The unit ids and a generator of their texts, in the same order.
+    """
+    if chunks is None:
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        return doc_ids, (content_of(int(i)) for i in doc_ids)
+    if chunk_ids is None:
+        live = np.flatnonzero(chunks[:, 0] >= 0)
+    else:
+        chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        live = chunk_ids[chunks[chunk_ids, 0] >= 0]
+
+    def passages() -> Iterator[str]:
+        parent, text = None, ""
+        for i in live:
+            if chunks[i, 0] != parent:
+                parent = int(chunks[i, 0])
+                text = content_of(parent)
+            yield text[chunks[i, 1]:chunks[i, 2]]
+    return live, passages()
+
+
+def collapse_hits(distances: np.ndarray, indices: np.ndarray, chunks: np.ndarray, top_k: int, passages_per_doc: int = 2) -> List[Tuple[int, float, List[int]]]:
+    """
+    Groups one query's chunk hits by parent document.
+
+    FAISS returns hits best first, so the first hit of a parent is its
+    score. Chunks of deleted documents have a negative parent and are
+    skipped.
+
+    Args:
+        distances: The scores of one query's hits.
+        indices: The chunk ids of one query's hits; -1 marks a missing hit.
+        chunks: The chunk table.
+        top_k: The number of parent documents to return.
+        passages_per_doc: The most chunks kept per parent.
+
+    Returns:
+        Up to `top_k` (parent id, score, chunk ids) tuples, best first.
+    """
+    parents = {}
+    for score, chunk_id in zip(distances.tolist(), indices.tolist()):
+        if chunk_id < 0 or chunk_id >= len(chunks):
+            continue
+        parent = int(chunks[chunk_id, 0])
+        if parent < 0:
+            continue
+        if parent not in parents:
+            if len(parents) == top_k:
+                continue
+            parents[parent] = (score, [])
+        if len(parents[parent][1]) < passages_per_doc:
+            parents[parent][1].append(chunk_id)
+    return [(parent, score, chunk_ids) for parent, (score, chunk_ids) in parents.items()]
+
+
+def passage_text(text: str, spans: Iterable[Tuple[int, int]], separator: str = "\n...\n") -> str:
+    """Joins the given passages of `text` in document order, merging overlapping windows."""
+    merged: List[List[int]] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return separator.join(text[start:end].strip() for start, end in merged)
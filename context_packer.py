@@ -0,0 +1,162 @@
+import hashlib
+import logging
+import numpy as np
+import re
+
+from embedder import BatchEmbedder
+from typing import Dict, List, Optional, Tuple
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of LLM tokens in `text` without a tokenizer.
+
+    Counts words and punctuation marks, and counts long identifiers as
+    several tokens, which tracks subword tokenizers closely enough for
+    budgeting code and stack traces.
+    """
+    return sum(1 + len(token) // 8 for token in _TOKEN_PATTERN.findall(text))
+
+
+def split_passages(text: str, max_tokens: int) -> List[str]:
+    """Splits `text` into passages of at most about `max_tokens`, on paragraph and then line boundaries."""
+    passages = []
+    current: List[str] = []
+    current_tokens = 0
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        paragraph = paragraph.strip("\n")
+        if not paragraph.strip():
+            continue
+        pieces = [paragraph]
+        if estimate_tokens(paragraph) > max_tokens:
+            pieces = paragraph.split("\n")
+        for piece in pieces:
+            tokens = estimate_tokens(piece)
+            if current and current_tokens + tokens > max_tokens:
+                passages.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
+    if current:
+        passages.append("\n".join(current))
+    return passages
+
+
+class ContextPacker:
+    """
+    Packs the most relevant parts of the retrieved documents into a token budget.
+
+    Documents are split into passages. Passages that repeat one already seen
+    (after whitespace normalization) are dropped. The rest are ranked by
+    embedding similarity to the error and added greedily while they fit in
+    `token_budget`, skipping near-duplicates of passages already chosen.
+    The chosen passages are returned per document, in their original order,
+    so `build_prompt` can use them unchanged.
+    """
+    def __init__(
+        self,
+        embedder: BatchEmbedder = None,
+        token_budget: int = 3000,
+        passage_tokens: int = 200,
+        redundancy_threshold: float = 0.95,
+    ):
+        """
+        Initializes the ContextPacker.
+
+        Args:
+            embedder: The embedder used to score passages against the error.
+                Without one, passages keep the retrieval order.
+            token_budget: The maximum estimated tokens of packed context.
+            passage_tokens: The target passage size in estimated tokens.
+            redundancy_threshold: Passages at least this similar to one
+                already chosen are skipped.
+        """
+        self.embedder = embedder
+        self.token_budget = token_budget
+        self.passage_tokens = passage_tokens
+        self.redundancy_threshold = redundancy_threshold
+
+    def _passages(self, retrieved_docs: List[Dict]) -> List[Tuple[int, int, str, int]]:
+        """Returns unique (doc index, passage index, text, tokens) tuples."""
+        seen = set()
+        passages = []
+        for doc_index, doc in enumerate(retrieved_docs):
+            for passage_index, text in enumerate(split_passages(doc.get("content") or "", self.passage_tokens)):
+                key = hashlib.blake2b(" ".join(text.split()).lower().encode("utf-8"), digest_size=16).digest()
+                if key in seen:
+                    continue
+                seen.add(key)
+                passages.append((doc_index, passage_index, text, estimate_tokens(text)))
+        return passages
+
+    @staticmethod
+    def _normalize(embeddings: np.ndarray) -> np.ndarray:
+        embeddings = np.asarray(embeddings, dtype="float32")
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+    def _select(self, retrieved_docs: List[Dict], passages, vectors: Optional[np.ndarray], query: Optional[np.ndarray]) -> List[Dict]:
+        if vectors is not None:
+            scores = vectors @ query
+            order = np.argsort(-scores, kind="stable")
+        else:
+            order = np.arange(len(passages))
+        chosen: List[int] = []
+        used = 0
+        for i in order:
+            tokens = passages[i][3]
+            if used + tokens > self.token_budget:
+                continue
+            if vectors is not None and chosen and float(np.max(vectors[chosen] @ vectors[i])) >= self.redundancy_threshold:
+                continue
+            chosen.append(int(i))
+            used += tokens
+        by_doc: Dict[int, List[Tuple[int, str]]] = {}
+        for i in chosen:
+            doc_index, passage_index, text, _ = passages[i]
+            by_doc.setdefault(doc_index, []).append((passage_index, text))
+        packed = []
+        for doc_index in sorted(by_doc):
+            texts = [text for _, text in sorted(by_doc[doc_index])]
+            packed.append({**retrieved_docs[doc_index], "content": "\n...\n".join(texts)})
+        logger.info(f"Packed {len(chosen)}/{len(passages)} passages from {len(packed)} documents into ~{used} tokens")
+        return packed
+
+    def pack(self, error_snippet: str, retrieved_docs: List[Dict]) -> List[Dict]:
+        """
+        Packs the retrieved documents for the prompt.
+
+        Args:
+            error_snippet: The user's error, used as the relevance query.
+            retrieved_docs: The documents from `Retriever.retrieve`.
+
+        Returns:
+            The documents that contributed passages, in retrieval order, each
+            with "content" replaced by its chosen passages.
+        """
+        passages = self._passages(retrieved_docs)
+        if not passages:
+            return []
+        vectors = query = None
+        if self.embedder is not None:
+            query = self._normalize(self.embedder.embed([error_snippet], task_type="RETRIEVAL_QUERY"))[0]
+            vectors = self._normalize(self.embedder.embed([p[2] for p in passages]))
+        return self._select(retrieved_docs, passages, vectors, query)
+
+    async def pack_async(self, error_snippet: str, retrieved_docs: List[Dict]) -> List[Dict]:
+        """The asyncio counterpart of `pack`; embedding requests are awaited."""
+        passages = self._passages(retrieved_docs)
+        if not passages:
+            return []
+        vectors = query = None
+        if self.embedder is not None:
+            query = self._normalize(await self.embedder.embed_async([error_snippet], task_type="RETRIEVAL_QUERY"))[0]
+            vectors = self._normalize(await self.embedder.embed_async([p[2] for p in passages]))
+        return self._select(retrieved_docs, passages, vectors, query)
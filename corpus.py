@@ -0,0 +1,317 @@
+import json
+import logging
+import mmap
+import numpy as np
+import os
+import struct
+
+from array import array
+from typing import Dict, Iterable, Iterator, List, Sequence
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CORPUS_EXTENSION = ".corpus"
+
+_MAGIC = b"CFXCORP\x00"
+_VERSION = 1
+_HEADER = struct.Struct("<8sII")
+_RECORD = struct.Struct("<II")
+# offsets position, record count, flags, reserved, magic
+_TRAILER = struct.Struct("<QQQQ8s")
+_HAS_FAISS_IDS = 1
+_HAS_ID_ORDER = 2
+_HAS_SORTED_IDS = 4
+# Collector output uses "content", Indexer output uses "document"; a corpus
+# stores whichever a record has as its text and returns it as "content".
+_TEXT_FIELDS = ("content", "document", "text")
+
+
+class CorpusWriter:
+    """
+    Streams records into a corpus file.
+
+    The file is a header, then one record after another, then the columns
+    and a fixed-size trailer:
+
+    - record: text length and extra length (two uint32), the record's text
+      as UTF-8, and its other fields as compact JSON;
+    - offsets: uint64[n + 1], the start of every record and the end of the last;
+    - faiss_ids: int64[n], each record's "faiss_id" (or its row), if any
+      record had one;
+    - id_order: int64[n], the rows sorted by FAISS id, and sorted_ids:
+      int64[n], the FAISS ids in that order, if the ids were not written in
+      ascending order;
+    - trailer: the offsets position, the record count, flags and the magic.
+
+    Records are written as they arrive, so the writer only keeps 16 bytes per
+    record in memory for the columns. The file is written under a temporary
+    name and renamed into place by `close`.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._tmp_path = path + ".tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(_HEADER.pack(_MAGIC, _VERSION, 0))
+        self._position = _HEADER.size
+        self._offsets = array("Q")
+        self._faiss_ids = array("q")
+        self._has_faiss_ids = False
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def write(self, record: Dict) -> int:
+        """
+        Appends a record.
+
+        Args:
+            record: A collector record ("content") or an Indexer record
+                ("document"), optionally with a "faiss_id".
+
+        Returns:
+            The record's row.
+        """
+        record = dict(record)
+        key = next((k for k in _TEXT_FIELDS if k in record), None)
+        text = (record.pop(key) or "") if key else ""
+        faiss_id = record.pop("faiss_id", None)
+        if faiss_id is not None:
+            self._has_faiss_ids = True
+        row = len(self._offsets)
+        self._faiss_ids.append(row if faiss_id is None else int(faiss_id))
+        text = text.encode("utf-8")
+        extra = json.dumps(record, separators=(",", ":")).encode("utf-8") if record else b""
+        self._offsets.append(self._position)
+        self._file.write(_RECORD.pack(len(text), len(extra)))
+        self._file.write(text)
+        self._file.write(extra)
+        self._position += _RECORD.size + len(text) + len(extra)
+        return row
+
+    def write_many(self, records: Iterable[Dict]) -> int:
+        """Appends records and returns how many were written."""
+        count = 0
+        for record in records:
+            self.write(record)
+            count += 1
+        return count
+
+    def close(self):
+        """Writes the columns and the trailer and renames the file into place."""
+        if self._file.closed:
+            return
+        padding = -self._position % 8
+        self._file.write(b"\x00" * padding)
+        offsets_position = self._position + padding
+        self._offsets.append(self._position)
+        flags = 0
+        self._file.write(np.frombuffer(self._offsets, dtype=np.uint64).astype("<u8").tobytes())
+        if self._has_faiss_ids:
+            flags |= _HAS_FAISS_IDS
+            faiss_ids = np.frombuffer(self._faiss_ids, dtype=np.int64)
+            self._file.write(faiss_ids.astype("<i8").tobytes())
+            if len(faiss_ids) > 1 and (np.diff(faiss_ids) < 0).any():
+                flags |= _HAS_ID_ORDER | _HAS_SORTED_IDS
+                id_order = np.argsort(faiss_ids, kind="stable")
+                self._file.write(id_order.astype("<i8").tobytes())
+                self._file.write(faiss_ids[id_order].astype("<i8").tobytes())
+        self._file.write(_TRAILER.pack(offsets_position, len(self._offsets) - 1, flags, 0, _MAGIC))
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        """Discards the file being written."""
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self) -> "CorpusWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class CorpusStore:
+    """
+    Random access to a corpus written by `CorpusWriter`.
+
+    The file is memory-mapped and the columns are numpy views of the map,
+    so opening costs the same for any corpus size and nothing is parsed
+    until a record is read. `text` decodes a record's text straight from the
+    map without parsing its JSON, and `text_view` returns it as a zero-copy
+    memoryview. Records are looked up by FAISS id, which is the row unless
+    the records carried a "faiss_id".
+    """
+    def __init__(self, path: str):
+        """
+        Initializes the CorpusStore.
+
+        Args:
+            path: The path to the corpus file.
+
+        Raises:
+            ValueError: If the file is not a corpus.
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size < _HEADER.size + _TRAILER.size:
+            self._file.close()
+            raise ValueError(f"{path} is not a corpus file.")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _ = _HEADER.unpack_from(self._mmap, 0)
+        offsets_position, count, flags, _, trailer_magic = _TRAILER.unpack_from(self._mmap, size - _TRAILER.size)
+        if magic != _MAGIC or trailer_magic != _MAGIC or version != _VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a corpus file, or was not closed.")
+        self._view = memoryview(self._mmap)
+        self.offsets = np.frombuffer(self._mmap, dtype="<u8", count=count + 1, offset=offsets_position)
+        position = offsets_position + self.offsets.nbytes
+        self.faiss_ids = None
+        self._id_order = None
+        self._sorted_ids = None
+        if flags & _HAS_FAISS_IDS:
+            self.faiss_ids = np.frombuffer(self._mmap, dtype="<i8", count=count, offset=position)
+            position += self.faiss_ids.nbytes
+        if flags & _HAS_ID_ORDER:
+            self._id_order = np.frombuffer(self._mmap, dtype="<i8", count=count, offset=position)
+            position += self._id_order.nbytes
+            if flags & _HAS_SORTED_IDS:
+                self._sorted_ids = np.frombuffer(self._mmap, dtype="<i8", count=count, offset=position)
+            else:
+                # Corpora written before the sorted-ids column: sort once, not per lookup.
+                self._sorted_ids = self.faiss_ids[self._id_order]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def row_of(self, faiss_id: int) -> int:
+        """Returns the row of a FAISS id."""
+        faiss_id = int(faiss_id)
+        if self.faiss_ids is None:
+            if not 0 <= faiss_id < len(self):
+                raise KeyError(faiss_id)
+            return faiss_id
+        if self._id_order is None:
+            row = int(np.searchsorted(self.faiss_ids, faiss_id))
+        else:
+            position = int(np.searchsorted(self._sorted_ids, faiss_id))
+            row = int(self._id_order[position]) if position < len(self) else len(self)
+        if row >= len(self) or self.faiss_ids[row] != faiss_id:
+            raise KeyError(faiss_id)
+        return row
+
+    def ids(self) -> np.ndarray:
+        """The FAISS id of every row, in row order."""
+        if self.faiss_ids is None:
+            return np.arange(len(self), dtype=np.int64)
+        return self.faiss_ids
+
+    def _spans(self, row: int):
+        start = int(self.offsets[row])
+        text_length, extra_length = _RECORD.unpack_from(self._mmap, start)
+        text_start = start + _RECORD.size
+        return text_start, text_start + text_length, text_start + text_length + extra_length
+
+    def text_view(self, row: int) -> memoryview:
+        """The UTF-8 text of a row, as a view of the memory map."""
+        text_start, text_end, _ = self._spans(row)
+        return self._view[text_start:text_end]
+
+    def text(self, row: int) -> str:
+        """The text of a row, decoded without reading the rest of the record."""
+        return str(self.text_view(row), "utf-8")
+
+    def row(self, row: int) -> Dict:
+        """The record at a row, with its text as "content"."""
+        text_start, text_end, extra_end = self._spans(row)
+        record = json.loads(self._mmap[text_end:extra_end]) if extra_end > text_end else {}
+        record["content"] = str(self._view[text_start:text_end], "utf-8")
+        if self.faiss_ids is not None:
+            record["faiss_id"] = int(self.faiss_ids[row])
+        return record
+
+    def __getitem__(self, faiss_id: int) -> Dict:
+        return self.row(self.row_of(faiss_id))
+
+    def get_many(self, indices: Sequence[int]) -> List[Dict]:
+        """Returns the records with the given FAISS ids, in order."""
+        return [self[int(idx)] for idx in indices]
+
+    def __iter__(self) -> Iterator[Dict]:
+        for row in range(len(self)):
+            yield self.row(row)
+
+    def close(self):
+        self.offsets = self.faiss_ids = self._id_order = self._sorted_ids = None
+        if getattr(self, "_view", None) is not None:
+            self._view.release()
+            self._view = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # A caller still holds a text_view; the map closes when it is released.
+            pass
+        except AttributeError:
+            pass
+        self._file.close()
+
+    def __enter__(self) -> "CorpusStore":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def iter_records(path: str) -> Iterator[Dict]:
+    """Reads the records of a `metadata.json` array, a JSONL file or a corpus."""
+    if path.endswith(CORPUS_EXTENSION):
+        with CorpusStore(path) as store:
+            yield from store
+    elif path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+    else:
+        with open(path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def write_corpus(path: str, records: Iterable[Dict]) -> int:
+    """Writes records to a corpus file and returns how many were written."""
+    with CorpusWriter(path) as writer:
+        return writer.write_many(records)
+
+
+def convert(input_path: str, output_path: str) -> int:
+    """
+    Converts a `metadata.json` array or a JSONL file to a corpus.
+
+    Both schemas become one: the "content" or "document" field is stored as
+    the record's text and read back as "content". Rows keep their order, so
+    FAISS ids that are row positions stay valid, and "faiss_id" fields are
+    kept for lookups.
+
+    Returns:
+        The number of records converted.
+    """
+    count = write_corpus(output_path, iter_records(input_path))
+    logger.info(f"Converted {count} records from {input_path} to {output_path}.")
+    return count
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert a metadata.json or JSONL corpus to the binary corpus format.")
+    parser.add_argument('--input', type=str, required=True)
+    parser.add_argument('--output', type=str, default=None, help='Defaults to the input path with a .corpus extension.')
+    args = parser.parse_args()
+    convert(args.input, args.output or os.path.splitext(args.input)[0] + CORPUS_EXTENSION)
@@ -0,0 +1,295 @@
+import json
+import logging
+import os
+import re
+
+from concurrent.futures import ThreadPoolExecutor
+from corpus import CORPUS_EXTENSION, CorpusStore, CorpusWriter
+from data_collector.engine import (
+    GITHUB_API,
+    STACKEXCHANGE_API,
+    ApiClient,
+    Checkpoint,
+    Crawler,
+    GitHubIssues,
+    LocalJsonl,
+    StackOverflowQuestions,
+    github_client,
+    record_key,
+    stackexchange_client,
+)
+from dataclasses import asdict
+from text_cleaning import clean
+from typing import Callable, Dict, Iterator, List, Tuple
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def to_record(raw: Dict) -> Dict:
+    """
+    Turns a fetched GitHub issue, Stack Overflow question or local record into
+    a corpus record. The kind of record is told by its fields, not its
+    "source": a record that already has its text is passed through. The
+    cleaned prose goes to "content" and the code blocks, if any, to "code"
+    (see `text_cleaning.clean`).
+    """
+    source = raw.get("source")
+    if "content" in raw or "document" in raw or "text" in raw:
+        # Already a corpus record, e.g. an earlier collector export (which
+        # still carries "source": "github") or Indexer output ("document").
+        content = raw.get("content", raw.get("document", raw.get("text", "")))
+    elif "comments" in raw:
+        content = f"{raw['title']} {raw['body']} {raw['comments']}"
+    elif "accepted_answer" in raw:
+        content = f"{raw['title']} {raw['body']} {raw['accepted_answer']}"
+    else:
+        content = ""
+    cleaned = clean(content)
+    record = {
+        "id": raw["id"],
+        "content": cleaned.text,
+        "source": source or "jsonl",
+        "repo_or_tag": raw.get("repo_or_tag"),
+    }
+    if cleaned.code:
+        record["code"] = [asdict(block) for block in cleaned.code]
+    if raw.get("url"):
+        record["url"] = raw["url"]
+    return record
+
+
+class SourceClients:
+    """
+    The API clients shared by every source of a run.
+
+    All GitHub sources spend one rate-limit budget (it is per token), and all
+    Stack Exchange sources one quota.
+    """
+    def __init__(self, github: ApiClient, stackexchange: ApiClient, max_workers: int = 8, stackexchange_key: str = None):
+        self.github = github
+        self.stackexchange = stackexchange
+        self.max_workers = max_workers
+        self.stackexchange_key = stackexchange_key
+
+
+# Source types by their "type" in the config. A factory takes the source's
+# config entry and the shared clients and returns a source for `Crawler`.
+SOURCE_TYPES: Dict[str, Callable[[Dict, SourceClients], object]] = {
+    "github": lambda spec, clients: GitHubIssues(spec["repo"], clients.github, max_workers=clients.max_workers),
+    "stackoverflow": lambda spec, clients: StackOverflowQuestions(
+        spec["tags"], clients.stackexchange, max_pages=spec.get("max_pages", 50), site=spec.get("site", "stackoverflow"), key=clients.stackexchange_key
+    ),
+    "jsonl": lambda spec, clients: LocalJsonl(spec["path"]),
+}
+
+
+def shard_name(key: str) -> str:
+    """The output file of a source, e.g. "github-microsoft-vscode.jsonl" for "github:microsoft/vscode"."""
+    return re.sub(r"[^A-Za-z0-9_.]+", "-", key).strip("-.") + ".jsonl"
+
+
+def _previous_merge(output_path: str) -> Iterator[Tuple[Tuple, Dict]]:
+    """Yields the (source, id) and record of every row of an earlier merge, in order."""
+    if not os.path.exists(output_path):
+        return
+    if output_path.endswith(CORPUS_EXTENSION):
+        with CorpusStore(output_path) as store:
+            for record in store:
+                yield (record.get("source"), record.get("id")), record
+        return
+    with open(output_path, "rb") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield (record.get("source"), record.get("id")), record
+
+
+def merge_shards(shard_paths: List[str], output_path: str) -> int:
+    """
+    Merges the shards into one JSONL corpus, or a binary corpus if
+    `output_path` ends with ".corpus", through a temporary file.
+
+    Rows are stable across merges, and every record's "faiss_id" is its
+    row. Records are matched by (source, id) with the previous merge: a
+    record keeps its row when it changes, a record no shard holds any more
+    keeps its previous contents, and new records are appended. An index
+    built over an earlier merge therefore never points at another document.
+
+    Returns:
+        The number of records written.
+    """
+    latest: Dict[Tuple, Tuple[str, int]] = {}
+    for path in shard_paths:
+        with open(path, "rb") as f:
+            offset = 0
+            for line in f:
+                if line.strip():
+                    latest[record_key(line)] = (path, offset)
+                offset += len(line)
+
+    shards = {path: open(path, "rb") for path in shard_paths}
+
+    def read(location: Tuple[str, int]) -> Dict:
+        f = shards[location[0]]
+        f.seek(location[1])
+        return json.loads(f.readline())
+
+    def merged_records() -> Iterator[Dict]:
+        for key, record in _previous_merge(output_path):
+            location = latest.pop(key, None)
+            yield record if location is None else read(location)
+        for location in latest.values():
+            yield read(location)
+
+    count = 0
+    try:
+        if output_path.endswith(CORPUS_EXTENSION):
+            with CorpusWriter(output_path) as writer:
+                for count, record in enumerate(merged_records(), 1):
+                    writer.write({**record, "faiss_id": count - 1})
+            return count
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            for count, record in enumerate(merged_records(), 1):
+                out.write(json.dumps({**record, "faiss_id": count - 1}) + "\n")
+        os.replace(tmp_path, output_path)
+        return count
+    finally:
+        for f in shards.values():
+            f.close()
+
+
+class Collector:
+    """
+    Collects many GitHub repositories, Stack Overflow tag sets and local
+    JSONL files into a sharded corpus.
+
+    Every source is crawled by `Crawler` into its own shard in `output_dir`,
+    so sources run in parallel on a worker pool without sharing a file, and
+    each resumes and syncs incrementally on its own. A source that fails does
+    not stop the others. The shards can then be merged into the single JSONL
+    file the indexing tools read.
+    """
+    def __init__(
+        self,
+        sources: List[Dict],
+        output_dir: str = "data/corpus",
+        checkpoint_path: str = None,
+        corpus_path: str = None,
+        max_workers: int = 4,
+        source_workers: int = 8,
+        github_token: str = None,
+        stackexchange_key: str = None,
+        github_base_url: str = GITHUB_API,
+        stackexchange_base_url: str = STACKEXCHANGE_API,
+    ):
+        """
+        Initializes the Collector.
+
+        Args:
+            sources: The source config entries, each with a "type" from
+                `SOURCE_TYPES` and that type's fields ("repo", "tags" or "path").
+            output_dir: The directory of the shards.
+            checkpoint_path: The crawl checkpoint; `<output_dir>/checkpoint.json`
+                if None.
+            corpus_path: If set, the shards are merged into this JSONL file,
+                or binary corpus if it ends with ".corpus", after a
+                successful run.
+            max_workers: The number of sources crawled at once.
+            source_workers: The most concurrent requests of one source.
+            github_token: A GitHub personal access token for higher rate limits.
+            stackexchange_key: A Stack Exchange API key for a higher quota.
+            github_base_url: The GitHub API URL.
+            stackexchange_base_url: The Stack Exchange API URL.
+        """
+        unknown = sorted({spec.get("type") for spec in sources} - set(SOURCE_TYPES), key=str)
+        if unknown:
+            raise ValueError(f"Unknown source types {unknown}; expected one of {sorted(SOURCE_TYPES)}.")
+        self.output_dir = output_dir
+        self.corpus_path = corpus_path
+        self.max_workers = max_workers
+        self.checkpoint = Checkpoint(checkpoint_path or os.path.join(output_dir, "checkpoint.json"))
+        clients = SourceClients(
+            github_client(github_token, base_url=github_base_url, max_workers=max_workers * source_workers),
+            stackexchange_client(base_url=stackexchange_base_url, pool_size=max_workers),
+            max_workers=source_workers,
+            stackexchange_key=stackexchange_key,
+        )
+        self.sources = [SOURCE_TYPES[spec["type"]](spec, clients) for spec in sources]
+        keys = [source.key for source in self.sources]
+        if len(set(keys)) != len(keys):
+            raise ValueError(f"Sources are listed more than once: {sorted({k for k in keys if keys.count(k) > 1})}")
+
+    @classmethod
+    def from_config(cls, path: str, **kwargs) -> "Collector":
+        """
+        Creates a Collector from a JSON config file.
+
+        The file holds the constructor's arguments, e.g.
+        {"output_dir": "data/corpus", "sources": [{"type": "github", "repo": "owner/name"}]}.
+        Keyword arguments override the file.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        config.update(kwargs)
+        return cls(**config)
+
+    def shard_path(self, source) -> str:
+        return os.path.join(self.output_dir, shard_name(source.key))
+
+    def run(self, incremental: bool = False) -> Dict[str, int]:
+        """
+        Crawls every source into its shard.
+
+        Args:
+            incremental: Fetch only what changed since each source's last
+                finished crawl and upsert it into its shard.
+
+        Returns:
+            The number of records written per source key.
+
+        Raises:
+            RuntimeError: If any source failed, after the others finished.
+                Their shards and checkpoints are kept, so the next run resumes.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        crawler = Crawler(self.checkpoint)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {
+                source.key: pool.submit(crawler.run, source, self.shard_path(source), to_record, incremental)
+                for source in self.sources
+            }
+        written, failed = {}, []
+        for key, future in futures.items():
+            try:
+                written[key] = future.result()
+            except Exception as e:
+                logger.error(f"Collecting {key} failed: {e}")
+                failed.append(key)
+        if failed:
+            raise RuntimeError(f"{len(failed)} of {len(futures)} sources failed: {', '.join(failed)}")
+        if self.corpus_path:
+            count = merge_shards([self.shard_path(source) for source in self.sources], self.corpus_path)
+            logger.info(f"Merged {len(self.sources)} shards into {self.corpus_path} ({count} records).")
+        return written
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Collect GitHub issues, Stack Overflow questions and local JSONL files into a sharded corpus.")
+    parser.add_argument('--config', type=str, default='data_collector/sources.json')
+    parser.add_argument('--incremental', action='store_true', help='Only fetch what changed since the last run.')
+    args = parser.parse_args()
+    # You will need to create a GitHub personal access token and set it as an
+    # environment variable named GITHUB_TOKEN
+    collector = Collector.from_config(
+        args.config,
+        github_token=os.environ.get("GITHUB_TOKEN"),
+        stackexchange_key=os.environ.get("STACKEXCHANGE_KEY"),
+    )
+    collector.run(incremental=args.incremental)
@@ -0,0 +1,589 @@
+import calendar
+import json
+import logging
+import os
+import threading
+import time
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+GITHUB_API = "https://api.github.com"
+STACKEXCHANGE_API = "https://api.stackexchange.com/2.3"
+# The Stack Exchange API accepts at most 100 semicolon-separated ids per request.
+MAX_IDS_PER_REQUEST = 100
+# Incremental crawls look this many seconds before the last sync, to allow
+# for clock skew between this machine and the API.
+SYNC_OVERLAP = 60
+
+
+class RateLimitBudget:
+    """
+    A request budget shared by every thread of a crawl.
+
+    The budget is what the API last advertised (GitHub's X-RateLimit-Remaining
+    header, Stack Exchange's quota_remaining field). Each request reserves one
+    unit first, and once only `reserve` units are left requests wait for the
+    advertised reset instead of being rejected. `pause` starts a cool-down
+    that all threads respect, for Retry-After and back-off hints.
+    """
+    def __init__(self, reserve: int = 0):
+        self.reserve = reserve
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+        self.paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                now = time.time()
+                if self.remaining is not None and now >= self.reset_at:
+                    # The window is over; the next response advertises the new one.
+                    self.remaining = None
+                wait = self.paused_until - now
+                if wait <= 0 and self.remaining is not None and self.remaining <= self.reserve:
+                    wait = self.reset_at - now
+                    logger.warning(f"Rate-limit budget exhausted; waiting {wait:.1f}s for the reset.")
+                if wait <= 0:
+                    if self.remaining is not None:
+                        self.remaining -= 1
+                    return
+                self._cond.wait(timeout=wait)
+
+    def update(self, remaining: int, reset_at: float):
+        """Records an advertised budget of `remaining` requests until `reset_at` (epoch seconds)."""
+        with self._cond:
+            if self.remaining is None or reset_at > self.reset_at:
+                self.remaining = remaining
+            else:
+                # Requests still in flight have already been reserved locally.
+                self.remaining = min(self.remaining, remaining)
+            self.reset_at = max(self.reset_at, reset_at)
+            self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+            self._cond.notify_all()
+
+
+class ApiClient:
+    """
+    A thread-safe HTTP client for JSON APIs that spends a `RateLimitBudget`.
+
+    Connection errors, 5xx responses and rate-limit responses (429, or 403
+    with an exhausted budget or a Retry-After header) are retried with
+    exponential back-off. Rate limits pause every thread until Retry-After or
+    the advertised reset, so one throttled request does not turn into many.
+    """
+    def __init__(
+        self,
+        base_url: str,
+        headers: Dict[str, str] = None,
+        budget: RateLimitBudget = None,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        timeout: float = 30.0,
+        pool_size: int = 10,
+        session: requests.Session = None,
+    ):
+        """
+        Initializes the ApiClient.
+
+        Args:
+            base_url: The URL that relative paths are joined to.
+            headers: Headers sent with every request.
+            budget: The rate-limit budget; a fresh one if None.
+            max_retries: The most retries of a single request.
+            backoff: The first retry delay in seconds.
+            max_backoff: The longest retry delay in seconds.
+            timeout: The timeout of a single request in seconds.
+            pool_size: The number of pooled connections, at least the number
+                of threads that share the client.
+            session: The session to use; a new one if None.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.budget = budget or RateLimitBudget()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(headers or {})
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def url(self, path: str) -> str:
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _record_budget(self, response: requests.Response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is not None and reset is not None:
+            self.budget.update(int(remaining), float(reset))
+
+    def _retry_delay(self, response: requests.Response, delay: float) -> Tuple[Optional[float], bool]:
+        """Returns (seconds to wait, rate limited), or (None, False) if the response is final."""
+        retry_after = response.headers.get("Retry-After")
+        exhausted = response.headers.get("X-RateLimit-Remaining") == "0"
+        if response.status_code == 429 or (response.status_code == 403 and (exhausted or retry_after)):
+            if retry_after:
+                return float(retry_after), True
+            reset = response.headers.get("X-RateLimit-Reset")
+            if reset:
+                return max(0.0, float(reset) - time.time()), True
+            return delay, True
+        if response.status_code >= 500:
+            return delay, False
+        return None, False
+
+    def get(self, path: str, params: Dict = None, etag: str = None) -> requests.Response:
+        """
+        Sends a GET request, retrying transient failures.
+
+        Args:
+            path: A path relative to `base_url`, or an absolute URL such as a
+                Link header's.
+            params: The query parameters.
+            etag: An ETag to send as If-None-Match.
+
+        Returns:
+            The response, which is a 304 if `etag` still matches.
+
+        Raises:
+            requests.RequestException: If the request fails for good.
+        """
+        headers = {"If-None-Match": etag} if etag else None
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            self.budget.acquire()
+            with self._lock:
+                self.requests += 1
+            rate_limited = False
+            try:
+                response = self.session.get(self.url(path), params=params, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                error, wait = e, delay
+            else:
+                self._record_budget(response)
+                wait, rate_limited = self._retry_delay(response, delay)
+                if wait is None:
+                    response.raise_for_status()
+                    return response
+                error = requests.HTTPError(f"{response.status_code} from {response.url}", response=response)
+            if attempt == self.max_retries:
+                raise error
+            logger.warning(f"GET {path} failed ({error}); retrying in {wait:.1f}s.")
+            if rate_limited:
+                self.budget.pause(wait)
+            else:
+                time.sleep(wait)
+            delay = min(self.max_backoff, delay * 2)
+
+
+def github_client(token: str = None, base_url: str = GITHUB_API, max_workers: int = 8, **kwargs) -> ApiClient:
+    """Returns an ApiClient for the GitHub REST API, authenticated if `token` is given."""
+    headers = {"Accept": "application/vnd.github+json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    return ApiClient(base_url, headers=headers, pool_size=max_workers + 1, **kwargs)
+
+
+def stackexchange_client(base_url: str = STACKEXCHANGE_API, **kwargs) -> ApiClient:
+    """Returns an ApiClient for the Stack Exchange API."""
+    return ApiClient(base_url, **kwargs)
+
+
+@dataclass
+class Page:
+    """One page of a crawl: its records and the cursor of the next page (None after the last)."""
+    records: List[Dict]
+    cursor: Optional[str]
+    etag: Optional[str] = None
+    not_modified: bool = False
+
+
+class GitHubIssues:
+    """
+    Every issue of a repository, open and closed, with its comments.
+
+    Issues are listed 100 per page, most recently updated first, following
+    the Link header. The next listing page is requested while the comments
+    of the current one are fetched, and comments are fetched concurrently and
+    only for issues that have any. The cursor is the next page's URL.
+    Incremental crawls list only the issues updated since the last sync, with
+    GitHub's `since` filter.
+    """
+    def __init__(self, repo: str, client: ApiClient, max_workers: int = 8):
+        """
+        Initializes the source.
+
+        Args:
+            repo: The repository in the format "owner/repo_name".
+            client: A client for the GitHub API (see `github_client`).
+            max_workers: The most concurrent requests.
+        """
+        self.repo = repo
+        self.client = client
+        self.max_workers = max_workers
+
+    @property
+    def key(self) -> str:
+        return f"github:{self.repo}"
+
+    def _comments(self, number: int) -> List[str]:
+        bodies = []
+        url, params = f"repos/{self.repo}/issues/{number}/comments", {"per_page": 100}
+        while url:
+            response = self.client.get(url, params)
+            bodies.extend(comment.get("body") or "" for comment in response.json())
+            url, params = response.links.get("next", {}).get("url"), None
+        return bodies
+
+    def pages(self, cursor: str = None, etag: str = None, since: float = None) -> Iterator[Page]:
+        """
+        Yields the pages of issues from `cursor`, or from the first page.
+
+        Args:
+            cursor: The cursor of a page yielded by an earlier crawl.
+            etag: The first page's ETag from an earlier crawl. If the first
+                page still matches, a single not-modified page is yielded.
+            since: Only list issues updated at or after this time (epoch
+                seconds). Cursors already carry it.
+        """
+        first = cursor is None
+        params = {"state": "all", "sort": "updated", "direction": "desc", "per_page": 100} if first else None
+        if first and since is not None:
+            params["since"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(since))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = pool.submit(self.client.get, cursor or f"repos/{self.repo}/issues", params, etag if first else None)
+            while pending is not None:
+                response = pending.result()
+                if response.status_code == 304:
+                    yield Page([], None, etag, not_modified=True)
+                    return
+                next_url = response.links.get("next", {}).get("url")
+                pending = pool.submit(self.client.get, next_url) if next_url else None
+                issues = response.json()
+                comments = {issue["number"]: pool.submit(self._comments, issue["number"]) for issue in issues if issue.get("comments")}
+                records = []
+                for issue in issues:
+                    records.append({
+                        "id": issue["number"],
+                        "title": issue.get("title") or "",
+                        "body": issue.get("body") or "",
+                        "comments": "\n\n".join(comments[issue["number"]].result()) if issue["number"] in comments else "",
+                        "url": issue.get("html_url"),
+                        "updated_at": issue.get("updated_at"),
+                        "source": "github",
+                        "repo_or_tag": self.repo,
+                    })
+                yield Page(records, next_url, response.headers.get("ETag") if first else None)
+                first = False
+
+
+def _next_utc_midnight() -> float:
+    day = time.gmtime()
+    return calendar.timegm((day.tm_year, day.tm_mon, day.tm_mday, 0, 0, 0)) + 86400.0
+
+
+class StackOverflowQuestions:
+    """
+    Answered questions with the given tags and their accepted answers.
+
+    Questions are listed by votes, 100 per page. The accepted answers of a
+    whole page are fetched in one request with semicolon-joined ids. The
+    daily quota and any `backoff` in a response are fed to the client's
+    budget. The cursor is the next page number. Incremental crawls list the
+    questions with activity since the last sync instead, which includes new
+    and edited answers.
+    """
+    def __init__(self, tags: Sequence[str], client: ApiClient, max_pages: int = 50, site: str = "stackoverflow", key: str = None):
+        """
+        Initializes the source.
+
+        Args:
+            tags: The tags that every question must have.
+            client: A client for the Stack Exchange API (see `stackexchange_client`).
+            max_pages: The most pages of questions to list.
+            site: The Stack Exchange site.
+            key: A Stack Exchange API key, for a higher daily quota.
+        """
+        self.tags = list(tags)
+        self.client = client
+        self.max_pages = max_pages
+        self.site = site
+        self.api_key = key
+
+    @property
+    def key(self) -> str:
+        return f"{self.site}:{';'.join(self.tags)}"
+
+    def _get(self, path: str, params: Dict) -> Dict:
+        params = dict(params, site=self.site)
+        if self.api_key:
+            params["key"] = self.api_key
+        data = self.client.get(path, params).json()
+        if "quota_remaining" in data:
+            self.client.budget.update(int(data["quota_remaining"]), _next_utc_midnight())
+        if data.get("backoff"):
+            self.client.budget.pause(float(data["backoff"]))
+        return data
+
+    def answers(self, answer_ids: Sequence[int]) -> Dict[int, str]:
+        """Returns the bodies of the given answers, fetched up to 100 per request."""
+        bodies = {}
+        for start in range(0, len(answer_ids), MAX_IDS_PER_REQUEST):
+            batch = answer_ids[start:start + MAX_IDS_PER_REQUEST]
+            data = self._get(f"answers/{';'.join(str(i) for i in batch)}", {"filter": "withbody", "pagesize": MAX_IDS_PER_REQUEST})
+            bodies.update((answer["answer_id"], answer.get("body") or "") for answer in data.get("items", []))
+        return bodies
+
+    def pages(self, cursor: str = None, etag: str = None, since: float = None) -> Iterator[Page]:
+        """
+        Yields the pages of questions from `cursor`, or from the first page.
+
+        Stack Exchange has no ETags, so `etag` is ignored. With `since` (epoch
+        seconds) only questions with activity at or after it are listed.
+        """
+        page = int(cursor or 1)
+        params = {"tagged": ";".join(self.tags), "sort": "votes", "order": "desc", "pagesize": 100, "filter": "withbody"}
+        if since is not None:
+            params.update(sort="activity", min=int(since))
+        while True:
+            data = self._get("questions", dict(params, page=page))
+            questions = [q for q in data.get("items", []) if q.get("is_answered") and q.get("accepted_answer_id")]
+            answers = self.answers([q["accepted_answer_id"] for q in questions])
+            records = [{
+                "id": q["question_id"],
+                "title": q.get("title") or "",
+                "body": q.get("body") or "",
+                "accepted_answer": answers[q["accepted_answer_id"]],
+                "url": q.get("link"),
+                "source": "stackoverflow",
+                "repo_or_tag": ",".join(self.tags),
+            } for q in questions if q["accepted_answer_id"] in answers]
+            next_cursor = str(page + 1) if data.get("has_more") and page < self.max_pages else None
+            yield Page(records, next_cursor)
+            if next_cursor is None:
+                return
+            page += 1
+
+
+class LocalJsonl:
+    """
+    The records of a local JSONL file, such as an export or another crawl.
+
+    The file is read `page_size` lines per page and the cursor is the byte
+    offset of the next page. Records without an id get their line's offset.
+    The file's size and modification time serve as its ETag, so an unchanged
+    file is not read again.
+    """
+    def __init__(self, path: str, page_size: int = 1000):
+        self.path = path
+        self.page_size = page_size
+
+    @property
+    def key(self) -> str:
+        return f"jsonl:{self.path}"
+
+    def pages(self, cursor: str = None, etag: str = None, since: float = None) -> Iterator[Page]:
+        """Yields the pages of records from `cursor`, or from the start of the file."""
+        stat = os.stat(self.path)
+        current_etag = f"{stat.st_size}-{stat.st_mtime_ns}"
+        if cursor is None and etag == current_etag:
+            yield Page([], None, etag, not_modified=True)
+            return
+        with open(self.path, "rb") as f:
+            f.seek(int(cursor or 0))
+            while True:
+                records = []
+                while len(records) < self.page_size:
+                    offset = f.tell()
+                    line = f.readline()
+                    if not line:
+                        break
+                    if line.strip():
+                        record = json.loads(line)
+                        record.setdefault("id", offset)
+                        records.append(record)
+                next_cursor = str(f.tell()) if line else None
+                yield Page(records, next_cursor, current_etag if cursor is None else None)
+                if next_cursor is None:
+                    return
+                cursor = next_cursor
+
+
+class Checkpoint:
+    """Per-source crawl state in a JSON file, rewritten atomically on every change."""
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.state: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def get(self, key: str) -> Dict:
+        with self._lock:
+            return dict(self.state.get(key, {}))
+
+    def set(self, key: str, state: Dict):
+        with self._lock:
+            self.state[key] = state
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, indent=1)
+            os.replace(tmp_path, self.path)
+
+
+def record_key(line: bytes):
+    """The (source, id) a JSONL record is matched by."""
+    record = json.loads(line)
+    return record.get("source"), record.get("id")
+
+
+def upsert_jsonl(path: str, changes_path: str) -> Tuple[int, int]:
+    """
+    Merges the records of `changes_path` into the JSONL file at `path`.
+
+    Records are matched by (source, id). A changed record replaces the old
+    one in place and new records are appended, so the rows of this file
+    stay stable. The file is rewritten through a temporary sibling. Shards
+    are merged by `collector.merge_shards`, which keeps the merged rows
+    stable as well.
+
+    Returns:
+        The numbers of updated and added records.
+    """
+    changes: Dict = {}
+    with open(changes_path, "rb") as f:
+        for line in f:
+            if line.strip():
+                changes[record_key(line)] = line
+    if not changes:
+        return 0, 0
+    updated = 0
+    tmp_path = path + ".tmp"
+    with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+        for line in src:
+            if not line.strip():
+                continue
+            replacement = changes.pop(record_key(line), None)
+            if replacement is not None:
+                updated += 1
+            dst.write(line if replacement is None else replacement)
+        dst.writelines(changes.values())
+    os.replace(tmp_path, path)
+    return updated, len(changes)
+
+
+class Crawler:
+    """
+    Writes a source's records to a JSONL file, checkpointing after every page.
+
+    A full crawl writes to `<output>.partial`, which replaces the output only
+    once the crawl finishes. An incremental crawl fetches only what changed
+    since the last finished crawl (the `synced_at` of the source's
+    checkpoint) into `<output>.changes` and upserts it into the output.
+
+    After each page the checkpoint stores the next cursor and the size of the
+    file being written, so an interrupted crawl truncates anything written
+    past the checkpoint and resumes at that cursor, and no record is written
+    twice. A finished crawl keeps the first page's ETag; the next crawl sends
+    it as If-None-Match and does nothing more if the source has not changed.
+    """
+    def __init__(self, checkpoint: Checkpoint):
+        self.checkpoint = checkpoint
+
+    @staticmethod
+    def _written_keys(path: str, offset: int) -> set:
+        with open(path, "rb") as f:
+            return {record_key(line) for line in f.read(offset).splitlines() if line.strip()}
+
+    def run(self, source, output_path: str, to_record: Callable[[Dict], Dict] = None, incremental: bool = False) -> int:
+        """
+        Crawls `source` into `output_path`, resuming an interrupted crawl.
+
+        Args:
+            source: A source with a `key` and a `pages(cursor, etag, since)`
+                method, such as `GitHubIssues` or `StackOverflowQuestions`.
+            output_path: The JSONL file to write.
+            to_record: Turns a fetched record into the written one; records
+                are written as fetched if None.
+            incremental: Fetch only the records changed since the last
+                finished crawl and upsert them into `output_path`. Falls back
+                to a full crawl if there is none.
+
+        Returns:
+            The number of records written by this call.
+        """
+        state = self.checkpoint.get(source.key)
+        if state.get("cursor") is not None:
+            # An interrupted crawl is resumed in the mode it was started in.
+            since = state.get("since")
+        else:
+            since = state.get("synced_at") if incremental and os.path.exists(output_path) else None
+        partial_path = output_path + (".partial" if since is None else ".changes")
+        resuming = state.get("cursor") is not None and os.path.exists(partial_path)
+        etag = None if resuming or not os.path.exists(output_path) else state.get("etag")
+        if resuming:
+            logger.info(f"Resuming {source.key} at {state['cursor']}.")
+            seen = self._written_keys(partial_path, state["offset"])
+            f = open(partial_path, "r+b")
+            f.truncate(state["offset"])
+            f.seek(state["offset"])
+        else:
+            state = {key: state[key] for key in ("etag", "synced_at") if key in state}
+            state.update(started_at=time.time(), since=since)
+            seen, f = set(), None
+        written = 0
+        try:
+            for page in source.pages(state.get("cursor"), etag, None if since is None else since - SYNC_OVERLAP):
+                if page.not_modified:
+                    logger.info(f"{source.key} has not changed since the last crawl.")
+                    break
+                if f is None:
+                    f = open(partial_path, "wb")
+                for record in page.records:
+                    # Items can move to an earlier page while it is listed.
+                    key = (record.get("source"), record["id"])
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    f.write((json.dumps(to_record(record) if to_record else record) + "\n").encode("utf-8"))
+                    written += 1
+                f.flush()
+                if page.etag is not None:
+                    state["etag"] = page.etag
+                state.update(cursor=page.cursor, offset=f.tell())
+                self.checkpoint.set(source.key, state)
+        finally:
+            if f is not None:
+                f.close()
+        if f is not None and since is None:
+            os.replace(partial_path, output_path)
+        elif f is not None:
+            updated, added = upsert_jsonl(output_path, partial_path)
+            os.remove(partial_path)
+            logger.info(f"Upserted {source.key} changes into {output_path}: {updated} updated, {added} added.")
+        state.update(cursor=None, synced_at=state["started_at"], completed_at=time.time())
+        self.checkpoint.set(source.key, state)
+        logger.info(f"Crawled {written} records from {source.key} into {output_path}.")
+        return written
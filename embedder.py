@@ -0,0 +1,370 @@
+import asyncio
+import hashlib
+import logging
+import re
+import threading
+import time
+import google.generativeai as genai
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+from embedding_cache import EmbeddingCache
+from typing import Dict, List
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBackend:
+    """
+    The interface every embedding backend implements.
+
+    A backend turns one batch of texts into one vector per text. Batching,
+    concurrency and retries are handled by `BatchEmbedder`, so backends only
+    have to make a single request.
+    """
+    model_name = "unknown"
+
+    def embed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        raise NotImplementedError
+
+    async def embed_batch_async(self, texts: List[str], task_type: str) -> List[List[float]]:
+        # Backends without a native async client run the blocking call in a thread.
+        return await asyncio.to_thread(self.embed_batch, texts, task_type)
+
+
+class GeminiEmbeddingBackend(EmbeddingBackend):
+    """
+    Embeds texts with Google's embedding models through `genai.embed_content`.
+    """
+    def __init__(self, model_name: str = "models/embedding-001"):
+        self.model_name = model_name
+
+    def embed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        # A single string gets a single embedding back; a list of strings is
+        # sent as one batchEmbedContents request and returns a list.
+        if len(texts) == 1:
+            response = genai.embed_content(model=self.model_name, content=texts[0], task_type=task_type)
+            return [response["embedding"]]
+        response = genai.embed_content(model=self.model_name, content=list(texts), task_type=task_type)
+        return response["embedding"]
+
+    async def embed_batch_async(self, texts: List[str], task_type: str) -> List[List[float]]:
+        if len(texts) == 1:
+            response = await genai.embed_content_async(model=self.model_name, content=texts[0], task_type=task_type)
+            return [response["embedding"]]
+        response = await genai.embed_content_async(model=self.model_name, content=list(texts), task_type=task_type)
+        return response["embedding"]
+
+
+class HashEmbeddingBackend(EmbeddingBackend):
+    """
+    A local, deterministic stand-in for a real embedding model.
+
+    Tokens are hashed into a fixed number of signed buckets and the result is
+    unit-normalized like real embeddings, so similar texts get similar
+    vectors.
+
+    An optional per-request latency simulates the network round trip, which
+    makes it useful for offline benchmarks.
+    """
+    def __init__(self, dim: int = 128, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.model_name = f"local/hash-{dim}"
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _embed_one(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype="float32")
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign
+        if not vector.any():
+            vector[0] = 1.0
+        return vector / np.linalg.norm(vector)
+
+    def embed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed_one(text) for text in texts]
+
+    async def embed_batch_async(self, texts: List[str], task_type: str) -> List[List[float]]:
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._embed_one(text) for text in texts]
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Returns True if an exception looks like an HTTP 429 / quota error."""
+    return "429" in str(error) or type(error).__name__ in ("ResourceExhausted", "TooManyRequests")
+
+
+class _AdaptiveLimiter:
+    """
+    Bounds the number of in-flight requests and backs off on rate limits.
+
+    The concurrency limit is halved and a shared cool-down is started whenever
+    a request is rate limited; every success grows the limit back by one and
+    shrinks the next back-off (additive increase, multiplicative decrease).
+    """
+    def __init__(self, max_concurrency: int, initial_backoff: float, max_backoff: float):
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.backoff = initial_backoff
+        self.cooldown_until = 0.0
+        self.in_flight = 0
+        self.rate_limited = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self.cooldown_until - time.monotonic()
+                if wait <= 0 and self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def release(self, rate_limited: bool = False):
+        with self._cond:
+            self.in_flight -= 1
+            if rate_limited:
+                self.rate_limited += 1
+                self.limit = max(1, self.limit // 2)
+                self.cooldown_until = max(self.cooldown_until, time.monotonic() + self.backoff)
+                logger.warning(f"Rate limited; backing off {self.backoff:.2f}s with concurrency {self.limit}.")
+                self.backoff = min(self.max_backoff, self.backoff * 2)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1)
+                self.backoff = max(self.initial_backoff, self.backoff / 2)
+            self._cond.notify_all()
+
+
+class BatchEmbedder:
+    """
+    Embeds many texts by grouping them into size-limited batches and sending a
+    bounded number of batches concurrently.
+    """
+    def __init__(
+        self,
+        backend: EmbeddingBackend = None,
+        max_batch_size: int = 100,
+        max_batch_chars: int = 100_000,
+        max_concurrency: int = 4,
+        max_retries: int = 5,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        cache: EmbeddingCache = None,
+    ):
+        """
+        Initializes the BatchEmbedder.
+
+        Args:
+            backend: The embedding backend. Defaults to `GeminiEmbeddingBackend`.
+            max_batch_size: The maximum number of texts per request.
+            max_batch_chars: The maximum total number of characters per request.
+            max_concurrency: The maximum number of requests in flight at once.
+            max_retries: How often a rate-limited batch is retried before giving up.
+            initial_backoff: The first back-off delay in seconds after a rate limit.
+            max_backoff: The upper bound for the back-off delay in seconds.
+            cache: An optional persistent cache consulted before any request.
+        """
+        self.backend = backend or GeminiEmbeddingBackend()
+        self.max_batch_size = max_batch_size
+        self.max_batch_chars = max_batch_chars
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.cache = cache
+        self.last_stats: Dict[str, float] = {}
+
+    @property
+    def model_name(self) -> str:
+        return self.backend.model_name
+
+    def _make_batches(self, texts: List[str]) -> List[List[int]]:
+        """Groups text indices into batches that respect the size limits."""
+        batches = []
+        current, current_chars = [], 0
+        for i, text in enumerate(texts):
+            if current and (len(current) >= self.max_batch_size or current_chars + len(text) > self.max_batch_chars):
+                batches.append(current)
+                current, current_chars = [], 0
+            current.append(i)
+            current_chars += len(text)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _embed_with_retries(self, texts: List[str], task_type: str, limiter: _AdaptiveLimiter) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire()
+            try:
+                vectors = self.backend.embed_batch(texts, task_type)
+            except Exception as e:
+                if is_rate_limit_error(e) and attempt < self.max_retries:
+                    limiter.release(rate_limited=True)
+                    continue
+                limiter.release()
+                raise
+            limiter.release()
+            if len(vectors) != len(texts):
+                raise ValueError(f"Embedding backend returned {len(vectors)} vectors for {len(texts)} texts.")
+            return vectors
+
+    def _embed_uncached(self, texts: List[str], task_type: str, stats: Dict) -> np.ndarray:
+        batches = self._make_batches(texts)
+        limiter = _AdaptiveLimiter(self.max_concurrency, self.initial_backoff, self.max_backoff)
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as pool:
+            futures = [
+                pool.submit(self._embed_with_retries, [texts[i] for i in batch], task_type, limiter)
+                for batch in batches
+            ]
+            results = [future.result() for future in futures]
+
+        embeddings = None
+        for batch, vectors in zip(batches, results):
+            vectors = np.asarray(vectors, dtype="float32")
+            if embeddings is None:
+                embeddings = np.empty((len(texts), vectors.shape[1]), dtype="float32")
+            embeddings[batch] = vectors
+        stats["batches"] = len(batches)
+        stats["retries"] = limiter.rate_limited
+        return embeddings
+
+    async def _embed_uncached_async(self, texts: List[str], task_type: str, stats: Dict) -> np.ndarray:
+        batches = self._make_batches(texts)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(batch: List[int]) -> List[List[float]]:
+            backoff = self.initial_backoff
+            for attempt in range(self.max_retries + 1):
+                async with semaphore:
+                    try:
+                        vectors = await self.backend.embed_batch_async([texts[i] for i in batch], task_type)
+                        break
+                    except Exception as e:
+                        if not (is_rate_limit_error(e) and attempt < self.max_retries):
+                            raise
+                stats["retries"] += 1
+                logger.warning(f"Rate limited; backing off {backoff:.2f}s.")
+                await asyncio.sleep(backoff)
+                backoff = min(self.max_backoff, backoff * 2)
+            if len(vectors) != len(batch):
+                raise ValueError(f"Embedding backend returned {len(vectors)} vectors for {len(batch)} texts.")
+            return vectors
+
+        results = await asyncio.gather(*(run(batch) for batch in batches))
+        embeddings = None
+        for batch, vectors in zip(batches, results):
+            vectors = np.asarray(vectors, dtype="float32")
+            if embeddings is None:
+                embeddings = np.empty((len(texts), vectors.shape[1]), dtype="float32")
+            embeddings[batch] = vectors
+        stats["batches"] = len(batches)
+        return embeddings
+
+    def _plan(self, texts: List[str], task_type: str):
+        """
+        Looks texts up in the cache and deduplicates the rest.
+
+        Returns:
+            The cached vectors (None for misses), the unique texts that still
+            need a request, their cache keys, and (text position, unique
+            position) pairs mapping every miss to its unique text.
+        """
+        keys = texts
+        cached = [None] * len(texts)
+        if self.cache is not None:
+            keys = [EmbeddingCache.make_key(self.model_name, task_type, text) for text in texts]
+            cached = self.cache.get_many(keys)
+
+        unique_index: Dict = {}
+        unique_texts, unique_keys, positions = [], [], []
+        for i, vector in enumerate(cached):
+            if vector is None:
+                if keys[i] not in unique_index:
+                    unique_index[keys[i]] = len(unique_texts)
+                    unique_texts.append(texts[i])
+                    unique_keys.append(keys[i])
+                positions.append((i, unique_index[keys[i]]))
+        return cached, unique_texts, unique_keys, positions
+
+    def _assemble(self, cached, fresh, unique_keys, positions, stats: Dict, start_time: float) -> np.ndarray:
+        """Stores fresh vectors in the cache and merges them with the cached ones."""
+        if fresh is not None:
+            stats["embedded"] = len(unique_keys)
+            if self.cache is not None:
+                self.cache.put_many(unique_keys, fresh)
+                self.cache.flush()
+
+        dim = fresh.shape[1] if fresh is not None else len(next(v for v in cached if v is not None))
+        embeddings = np.empty((len(cached), dim), dtype="float32")
+        for i, vector in enumerate(cached):
+            if vector is not None:
+                embeddings[i] = vector
+        for i, j in positions:
+            embeddings[i] = fresh[j]
+
+        elapsed = time.time() - start_time
+        self.last_stats = {
+            **stats,
+            "seconds": elapsed,
+            "texts_per_second": len(cached) / elapsed if elapsed else float("inf"),
+        }
+        logger.info(
+            f"Embedded {len(cached)} texts ({stats['embedded']} requested in {stats['batches']} batches, "
+            f"{self.last_stats['texts_per_second']:.1f} texts/s, {stats['retries']} rate-limit retries)."
+        )
+        return embeddings
+
+    def embed(self, texts: List[str], task_type: str = "RETRIEVAL_DOCUMENT") -> np.ndarray:
+        """
+        Embeds a list of texts.
+
+        Cached vectors are reused and identical texts are only sent once.
+
+        Args:
+            texts: The texts to embed.
+            task_type: The embedding task type passed to the backend.
+
+        Returns:
+            A float32 array of shape (len(texts), dim), in input order.
+        """
+        start_time = time.time()
+        stats = {"texts": len(texts), "embedded": 0, "batches": 0, "retries": 0}
+        if not texts:
+            self.last_stats = {**stats, "seconds": 0.0, "texts_per_second": 0.0}
+            return np.zeros((0, 0), dtype="float32")
+
+        cached, unique_texts, unique_keys, positions = self._plan(texts, task_type)
+        fresh = self._embed_uncached(unique_texts, task_type, stats) if unique_texts else None
+        return self._assemble(cached, fresh, unique_keys, positions, stats, start_time)
+
+    async def embed_async(self, texts: List[str], task_type: str = "RETRIEVAL_DOCUMENT") -> np.ndarray:
+        """
+        The asyncio counterpart of `embed`.
+
+        Batches run as coroutines under a semaphore of `max_concurrency` and
+        back off with `asyncio.sleep`, so no threads are used.
+        """
+        start_time = time.time()
+        stats = {"texts": len(texts), "embedded": 0, "batches": 0, "retries": 0}
+        if not texts:
+            self.last_stats = {**stats, "seconds": 0.0, "texts_per_second": 0.0}
+            return np.zeros((0, 0), dtype="float32")
+
+        cached, unique_texts, unique_keys, positions = self._plan(texts, task_type)
+        fresh = await self._embed_uncached_async(unique_texts, task_type, stats) if unique_texts else None
+        return self._assemble(cached, fresh, unique_keys, positions, stats, start_time)
@@ -0,0 +1,302 @@
+import hashlib
+import json
+import logging
+import numpy as np
+import os
+import threading
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; only one process may then write.
+    fcntl = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_KEY_BYTES = 16
+_LOG_RECORD = np.dtype([("key", f"V{_KEY_BYTES}"), ("slot", "<i8")])
+# The slot of a record that removes its key from the cache.
+_EVICTED = -1
+_DEFAULT_MAX_ENTRIES = 100_000
+
+
+class EmbeddingCache:
+    """
+    A persistent, content-addressed cache of embedding vectors.
+
+    Vectors live in a memory-mapped float32 array (`vectors.f32`) with one row
+    per slot. The key index (`keys.log`) is an append-only log of fixed-size
+    (key digest, slot) records: an insert or a hit appends a record, and
+    replaying the log on open restores both the key -> slot mapping and the
+    LRU order. The log is compacted when it grows well beyond the number of
+    live entries. When all slots are in use, the least recently used entry is
+    evicted: its key is removed from the log before its slot is overwritten,
+    and the new key is logged only after its vector is written, so a crash
+    in between never leaves a key pointing at another text's vector.
+
+    Several processes may share one directory (e.g. the app and the indexer
+    CLI). Writers take an `fcntl.flock` on `lock` and replay the records
+    other processes appended before they allocate slots.
+    """
+    def __init__(self, path: str, max_entries: int = None):
+        """
+        Initializes the EmbeddingCache.
+
+        Args:
+            path: The directory the cache files are stored in.
+            max_entries: The maximum number of vectors kept on disk. An
+                existing cache keeps the capacity it was created with.
+                Defaults to 100,000 for a new cache.
+        """
+        self.path = path
+        self.max_entries = max_entries or _DEFAULT_MAX_ENTRIES
+        self._requested_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.dim = None
+        self._vectors = None
+        self._entries: "OrderedDict[bytes, int]" = OrderedDict()
+        self._slot_owners = {}
+        self._free_slots = set()
+        self._next_slot = 0
+        self._log_records = 0
+        self._log_inode = None
+        self._pending = []
+        self._lock = threading.Lock()
+
+        os.makedirs(path, exist_ok=True)
+        self._meta_path = os.path.join(path, "meta.json")
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._log_path = os.path.join(path, "keys.log")
+        self._lock_path = os.path.join(path, "lock")
+        if os.path.exists(self._meta_path):
+            with self._file_lock():
+                self._load()
+
+    @staticmethod
+    def make_key(model_name: str, task_type: str, text: str) -> bytes:
+        """Builds the cache key from the model, task type and normalized text."""
+        normalized = " ".join(text.split())
+        payload = f"{model_name}\0{task_type}\0{normalized}".encode("utf-8")
+        return hashlib.blake2b(payload, digest_size=_KEY_BYTES).digest()
+
+    @contextmanager
+    def _file_lock(self):
+        """Holds an exclusive lock on the cache directory across processes."""
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _load(self):
+        with open(self._meta_path, "r") as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        if self._requested_entries is not None and self._requested_entries != meta["capacity"]:
+            logger.warning(
+                f"Embedding cache {self.path} holds {meta['capacity']} entries; "
+                f"ignoring max_entries={self._requested_entries}."
+            )
+        self.max_entries = meta["capacity"]
+        self._vectors = np.memmap(self._vectors_path, dtype="float32", mode="r+", shape=(self.max_entries, self.dim))
+        self._sync()
+        logger.info(f"Loaded embedding cache with {len(self._entries)} entries from {self.path}.")
+
+    def _sync(self):
+        """
+        Replays the key-log records appended since the last call, e.g. by
+        another process. A log compacted elsewhere is replayed from the start.
+        """
+        try:
+            f = open(self._log_path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            stat = os.fstat(f.fileno())
+            # A record being appended by another process is read next time.
+            records = stat.st_size // _LOG_RECORD.itemsize
+            if stat.st_ino != self._log_inode or records < self._log_records:
+                self._entries.clear()
+                self._slot_owners.clear()
+                self._free_slots.clear()
+                self._next_slot = 0
+                self._log_records = 0
+                self._log_inode = stat.st_ino
+            if records == self._log_records:
+                return
+            f.seek(self._log_records * _LOG_RECORD.itemsize)
+            log = np.fromfile(f, dtype=_LOG_RECORD, count=records - self._log_records)
+        self._log_records += len(log)
+        for raw_key, slot in zip(log["key"].tolist(), log["slot"].tolist()):
+            self._replay(bytes(raw_key), slot)
+
+    def _replay(self, key: bytes, slot: int):
+        if slot == _EVICTED:
+            slot = self._entries.pop(key, None)
+            if slot is not None and self._slot_owners.get(slot) == key:
+                del self._slot_owners[slot]
+                self._free_slots.add(slot)
+            return
+        previous = self._slot_owners.get(slot)
+        if previous is not None and previous != key:
+            self._entries.pop(previous, None)
+        old_slot = self._entries.get(key)
+        if old_slot is not None and old_slot != slot and self._slot_owners.get(old_slot) == key:
+            del self._slot_owners[old_slot]
+            self._free_slots.add(old_slot)
+        self._slot_owners[slot] = key
+        self._free_slots.discard(slot)
+        self._next_slot = max(self._next_slot, slot + 1)
+        self._entries[key] = slot
+        self._entries.move_to_end(key)
+
+    def _append(self, records: list):
+        if not records:
+            return
+        array = np.array(records, dtype=_LOG_RECORD)
+        with open(self._log_path, "ab") as f:
+            array.tofile(f)
+        if self._log_inode is None:
+            self._log_inode = os.stat(self._log_path).st_ino
+        self._log_records += len(array)
+        for key, slot in records:
+            self._replay(key, slot)
+
+    def _allocate(self, dim: int):
+        if os.path.exists(self._meta_path):
+            # Another process created the cache after this one opened it.
+            self._load()
+            return
+        self.dim = dim
+        self._vectors = np.memmap(self._vectors_path, dtype="float32", mode="w+", shape=(self.max_entries, dim))
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"dim": dim, "capacity": self.max_entries}, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[np.ndarray]]:
+        """
+        Looks up several keys at once.
+
+        Args:
+            keys: Keys built with `make_key`.
+
+        Returns:
+            A list with a copy of the cached vector for every hit and None for
+            every miss, in input order.
+        """
+        with self._lock:
+            if self._vectors is None:
+                if not os.path.exists(self._meta_path):
+                    self.misses += len(keys)
+                    return [None] * len(keys)
+                self._load()
+            self._sync()
+            slots = [self._entries.get(key) for key in keys]
+            results = [None if slot is None else np.array(self._vectors[slot]) for slot in slots]
+            # Another process unlinks a key before overwriting its slot, so
+            # a copy is valid if its key still owns the slot afterwards.
+            self._sync()
+            for i, (key, slot) in enumerate(zip(keys, slots)):
+                if slot is None or self._entries.get(key) != slot:
+                    self.misses += 1
+                    results[i] = None
+                    continue
+                self.hits += 1
+                self._entries.move_to_end(key)
+                self._pending.append((key, slot))
+        return results
+
+    def put_many(self, keys: List[bytes], vectors: np.ndarray):
+        """
+        Stores vectors under the given keys, evicting LRU entries if needed.
+
+        Args:
+            keys: Keys built with `make_key`.
+            vectors: A float32 array with one row per key.
+        """
+        vectors = np.asarray(vectors, dtype="float32")
+        if len(keys) == 0:
+            return
+        with self._lock, self._file_lock():
+            if self._vectors is None:
+                self._allocate(vectors.shape[1])
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match cache dimension {self.dim}.")
+            self._sync()
+            if len(keys) > self.max_entries:
+                keys, vectors = keys[-self.max_entries:], vectors[-self.max_entries:]
+            batch = set(keys)
+            assigned = {}
+            evicted = []
+            lru = iter(list(self._entries.items()))
+            for key in keys:
+                slot = assigned.get(key, self._entries.get(key))
+                if slot is None:
+                    if self._free_slots:
+                        slot = self._free_slots.pop()
+                    elif self._next_slot < self.max_entries:
+                        slot = self._next_slot
+                        self._next_slot += 1
+                    else:
+                        old_key, slot = next(lru)
+                        while old_key in batch:
+                            old_key, slot = next(lru)
+                        evicted.append((old_key, _EVICTED))
+                assigned[key] = slot
+            # Unlink the evicted keys before their slots are overwritten, and
+            # link the new keys only once their vectors are on disk.
+            self._append(evicted)
+            for key, vector in zip(keys, vectors):
+                self._vectors[assigned[key]] = vector
+            self._vectors.flush()
+            self._append(list(assigned.items()))
+
+    def flush(self):
+        """Writes the recency of pending hits to the key log."""
+        with self._lock:
+            if not self._pending or self._vectors is None:
+                return
+            with self._file_lock():
+                self._sync()
+                # Another process may have reassigned a slot since the hit.
+                pending = [(key, slot) for key, slot in self._pending if self._entries.get(key) == slot]
+                if self._log_records + len(pending) > 2 * max(len(self._entries), 1024):
+                    for key, _ in pending:
+                        self._entries.move_to_end(key)
+                    self._compact()
+                else:
+                    self._append(pending)
+            self._pending = []
+
+    def _compact(self):
+        """Rewrites the key log with exactly one record per live entry, in LRU order."""
+        records = np.array(list(self._entries.items()), dtype=_LOG_RECORD)
+        tmp_path = self._log_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            records.tofile(f)
+        os.replace(tmp_path, self._log_path)
+        self._log_records = len(records)
+        self._log_inode = os.stat(self._log_path).st_ino
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counters and the hit rate."""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
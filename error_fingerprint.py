@@ -0,0 +1,260 @@
+import hashlib
+import logging
+import re
+
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Tuple
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_TRACEBACK_START = re.compile(r"^\s*Traceback \(most recent call last\):\s*$")
+_FRAME = re.compile(r'^\s*File "(?P<path>[^"]+)", line (?P<line>\d+)(?:, in (?P<function>[^\s]+))?')
+_EXCEPTION_LINE = re.compile(r"^(?P<type>[A-Za-z_][\w.]*)(?:: ?(?P<message>.*))?$")
+# An exception line outside a traceback, e.g. a pasted "KeyError: 'choices'".
+# Tracebacks inside indexed documents may have lost their line breaks, so
+# these patterns match anywhere rather than per line.
+_TRACEBACK_ANYWHERE = re.compile(r"Traceback \(most recent call last\):")
+_FRAME_ANYWHERE = re.compile(r'File "(?P<path>[^"]+)", line (?P<line>\d+)(?:, in (?P<function>[^\s"]+))?')
+_EXCEPTION_NAME = re.compile(r"(?<![\w.])(?P<type>(?:[A-Za-z_]\w*\.)*[A-Za-z_]\w*(?:Error|Exception|Warning|Interrupt|Exit))(?=:|[ \t]*$)", re.MULTILINE)
+_BARE_EXCEPTION = re.compile(r"^\s*(?P<type>(?:[A-Za-z_]\w*\.)*[A-Za-z_]\w*(?:Error|Exception|Warning|Interrupt|Exit))(?:: ?(?P<message>.*))?$", re.MULTILINE)
+
+_HEX = re.compile(r"\b0x[0-9a-fA-F]+\b")
+_UUID = re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b")
+_QUOTED = re.compile(r"'([^'\n]*)'|\"([^\"\n]*)\"")
+_IDENTIFIER = re.compile(r"^[A-Za-z_][\w.]{0,63}$")
+_ABSOLUTE_PATH = re.compile(r"(?<![\w.])(?:[A-Za-z]:)?[/\\](?:[^\s'\"():,/\\]+[/\\])+[^\s'\"():,]*")
+_NUMBER = re.compile(r"(?<![\w.])\d+(?:\.\d+)?(?![\w.])")
+_HOME = re.compile(r"(?:/home/|/Users/|[A-Za-z]:\\Users\\)[^/\\\s\"']+")
+_PACKAGE_ROOT = re.compile(r".*[/\\](?:site|dist)-packages[/\\]")
+_STDLIB_ROOT = re.compile(r".*[/\\]lib[/\\]python\d+(?:\.\d+)?[/\\]")
+
+# Frames that go into the fingerprint, innermost first. Outer frames are
+# mostly the user's entry point and framework plumbing.
+FINGERPRINT_FRAMES = 5
+
+
+def normalize_path(path: str) -> str:
+    """
+    Reduces a traceback file path to its machine-independent part.
+
+    Installed packages keep their path below site-packages, the standard
+    library keeps its path below lib/pythonX.Y, and other files (the
+    user's own code) keep only their file name.
+    """
+    if path.startswith("<"):
+        return path
+    for root in (_PACKAGE_ROOT, _STDLIB_ROOT):
+        match = root.match(path)
+        if match:
+            return path[match.end():].replace("\\", "/")
+    return re.split(r"[/\\]", path)[-1]
+
+
+def message_template(message: str) -> str:
+    """
+    Masks the variable parts of an exception message.
+
+    Addresses, UUIDs, absolute paths and numbers are replaced by
+    placeholders; three-digit numbers such as HTTP status codes are kept.
+    Quoted values are masked unless they look like an identifier (a key,
+    attribute or type name), since those name the bug rather than the data.
+    """
+    def quoted(match: re.Match) -> str:
+        value = match.group(1) if match.group(1) is not None else match.group(2)
+        return match.group() if _IDENTIFIER.match(value) else "'<str>'"
+
+    message = _UUID.sub("<uuid>", message)
+    message = _HEX.sub("0x?", message)
+    message = _QUOTED.sub(quoted, message)
+    message = _ABSOLUTE_PATH.sub("<path>", message)
+    message = _NUMBER.sub(lambda m: m.group() if len(m.group()) == 3 else "<n>", message)
+    return " ".join(message.split())
+
+
+def normalize_text(text: str) -> str:
+    """
+    Removes machine-specific noise from pasted error text.
+
+    Traceback frame paths are reduced with `normalize_path` and their line
+    numbers dropped, memory addresses are masked and home directories are
+    replaced by "~". Code and messages are otherwise left alone, and
+    whitespace is collapsed. Two pastes of the same error from different
+    machines or runs normalize to the same string.
+    """
+    lines = []
+    for line in (text or "").splitlines():
+        frame = _FRAME.match(line)
+        if frame:
+            line = f'File "{normalize_path(frame.group("path"))}", in {frame.group("function") or "?"}'
+        else:
+            line = _HOME.sub("~", _HEX.sub("0x?", line))
+        lines.append(line)
+    return " ".join(" ".join(lines).split())
+
+
+@dataclass
+class Frame:
+    """One traceback frame."""
+    path: str
+    line: int
+    function: str
+    code: str = ""
+
+    @property
+    def signature(self) -> str:
+        """The frame's identity without its line number."""
+        return f"{self.path}:{self.function}"
+
+
+@dataclass
+class ParsedTraceback:
+    """The parts of a Python traceback that identify a bug."""
+    exception_type: str
+    message: str
+    frames: List[Frame] = field(default_factory=list)
+
+    @property
+    def message_template(self) -> str:
+        return message_template(self.message)
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        A stable id for the bug: the exception type, the message template and
+        the signatures of the innermost `FINGERPRINT_FRAMES` frames.
+        """
+        parts = [self.exception_type.rsplit(".", 1)[-1], self.message_template]
+        parts.extend(frame.signature for frame in self.frames[-FINGERPRINT_FRAMES:])
+        return hashlib.blake2b("\n".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+    @property
+    def stack_signature(self) -> Optional[str]:
+        """
+        The exception's class name and innermost frame signatures, or None
+        without frames.
+
+        Unlike `fingerprint` it ignores the message, so it also matches
+        tracebacks whose message was cut off or reflowed.
+        """
+        if not self.frames:
+            return None
+        parts = [self.exception_type.rsplit(".", 1)[-1]]
+        parts.extend(frame.signature for frame in self.frames[-FINGERPRINT_FRAMES:])
+        return hashlib.blake2b("\n".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+    def compact_query(self) -> str:
+        """A short, noise-free description of the error for embedding."""
+        lines = [f"{self.exception_type}: {self.message_template}".rstrip(": ")]
+        for frame in reversed(self.frames[-FINGERPRINT_FRAMES:]):
+            lines.append(f"{frame.path} in {frame.function}: {frame.code}".rstrip(": "))
+        return "\n".join(lines)
+
+
+def _parse_frames(lines: List[str], start: int):
+    """Parses the frames after a "Traceback" header and returns them with the exception line's index."""
+    frames: List[Frame] = []
+    i = start
+    while i < len(lines):
+        line = lines[i]
+        if not line.strip():
+            i += 1
+            continue
+        if line[:1] not in (" ", "\t") and not _FRAME.match(line):
+            break
+        frame = _FRAME.match(line)
+        if frame:
+            frames.append(Frame(normalize_path(frame.group("path")), int(frame.group("line")), frame.group("function") or "?"))
+        elif frames and not frames[-1].code and not set(line.strip()) <= set("^~ "):
+            frames[-1].code = " ".join(_HOME.sub("~", _HEX.sub("0x?", line)).split())
+        i += 1
+    return frames, i
+
+
+def parse_traceback(text: str) -> Optional[ParsedTraceback]:
+    """
+    Parses the last exception in pasted error text.
+
+    For chained exceptions ("During handling of the above exception ...")
+    the final traceback is used. Text without a traceback is searched for a
+    bare exception line such as "ValueError: ...".
+
+    Args:
+        text: The pasted error text.
+
+    Returns:
+        The parsed traceback, or None if the text names no exception.
+    """
+    lines = (text or "").splitlines()
+    starts = [i for i, line in enumerate(lines) if _TRACEBACK_START.match(line)]
+    if starts:
+        frames, i = _parse_frames(lines, starts[-1] + 1)
+        if i < len(lines):
+            match = _EXCEPTION_LINE.match(lines[i].strip())
+            if match:
+                return ParsedTraceback(match.group("type"), (match.group("message") or "").strip(), frames)
+    matches = list(_BARE_EXCEPTION.finditer(text or ""))
+    if matches:
+        match = matches[-1]
+        return ParsedTraceback(match.group("type"), (match.group("message") or "").strip())
+    return None
+
+
+def iter_tracebacks(text: str, max_message: int = 200) -> Iterator[Tuple[str, ParsedTraceback]]:
+    """
+    Finds every traceback in a document, including ones flattened onto one line.
+
+    Frames are matched anywhere after a "Traceback" header, and the
+    exception is the first name ending in Error, Exception, Warning,
+    Interrupt or Exit that follows the last frame and ends its line or is
+    followed by a colon.
+
+    Args:
+        text: The document text.
+        max_message: The most characters of message kept after the
+            exception name, since flattened text has no line end.
+
+    Returns:
+        (traceback text, parsed traceback) pairs, in order.
+    """
+    text = text or ""
+    starts = [match.start() for match in _TRACEBACK_ANYWHERE.finditer(text)]
+    for i, start in enumerate(starts):
+        block = text[start:starts[i + 1] if i + 1 < len(starts) else len(text)]
+        frames = list(_FRAME_ANYWHERE.finditer(block))
+        if not frames:
+            continue
+        exception = _EXCEPTION_NAME.search(block, frames[-1].end())
+        if exception is None:
+            continue
+        line_end = block.find("\n", exception.end())
+        end = min(len(block) if line_end < 0 else line_end, exception.end() + max_message)
+        parsed = ParsedTraceback(
+            exception.group("type"),
+            block[exception.end():end].lstrip(":").strip(),
+            [Frame(normalize_path(f.group("path")), int(f.group("line")), f.group("function") or "?") for f in frames],
+        )
+        yield block[:end], parsed
+
+
+def fingerprint(text: str) -> str:
+    """
+    Returns a stable key for an error.
+
+    Text that names an exception is keyed by `ParsedTraceback.fingerprint`,
+    so the same bug pasted from different machines, paths or runs gets the
+    same key. Anything else is keyed by its `normalize_text` form.
+    """
+    parsed = parse_traceback(text)
+    if parsed is not None:
+        return parsed.fingerprint
+    return hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def compact_query(text: str) -> str:
+    """Returns the text to embed for an error: `ParsedTraceback.compact_query` or the normalized text."""
+    parsed = parse_traceback(text)
+    if parsed is not None:
+        return parsed.compact_query()
+    return normalize_text(text)
@@ -0,0 +1,346 @@
+import hashlib
+import logging
+import numpy as np
+import os
+import re
+
+from chunker import CHUNKS_FILE, index_units, load_chunks
+from dataclasses import dataclass
+from error_fingerprint import iter_tracebacks, normalize_text
+from metadata_store import open_metadata_store, record_content
+from typing import Callable, Iterable, List, Optional, Sequence
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EXACT_MATCH_FILE = "exact_match.npz"
+
+_WORD = re.compile(r"\w+")
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+
+
+def _hash64(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+class MinHasher:
+    """
+    MinHash signatures over word shingles of the normalized text.
+
+    Texts are normalized with `error_fingerprint.normalize_text`, so paths,
+    line numbers and addresses do not change the shingles.
+    """
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1):
+        """
+        Initializes the MinHasher.
+
+        Args:
+            num_perm: The signature length.
+            shingle_size: The number of words per shingle.
+            seed: The seed of the hash permutations. Signatures are only
+                comparable between hashers with the same parameters.
+        """
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        # Coefficients below 2**32 keep a * x (x is a 32-bit hash) inside uint64.
+        self._a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> np.ndarray:
+        words = _WORD.findall(normalize_text(text).lower())
+        size = min(self.shingle_size, len(words))
+        grams = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)} if size else set()
+        # A cryptographic hash, since CRCs of similar shingles are correlated and bias the estimate.
+        hashes = (int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=4).digest(), "little") for gram in grams)
+        return np.fromiter(hashes, dtype=np.uint64, count=len(grams))
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """Returns the uint32 MinHash signature of `text`, or None if it has no words."""
+        shingles = self.shingles(text)
+        if not len(shingles):
+            return None
+        hashed = (np.outer(self._a, shingles) % _MERSENNE_PRIME + self._b[:, None]) % _MERSENNE_PRIME
+        return (hashed.min(axis=1) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+
+@dataclass
+class ExactMatch:
+    """The indexed units that an error repeats exactly."""
+    ids: List[int]
+    kind: str
+    similarity: float
+
+
+class ExactMatchIndex:
+    """
+    Hash tables from an error to the indexed units that contain it verbatim.
+
+    Two tiers are checked, both with binary searches over sorted uint64
+    arrays and no network calls:
+
+    - "signature": the `stack_signature` of every traceback in a unit
+      (exception class and innermost frames, without paths or line numbers)
+      together with its message template. A hit needs both to match; the
+      indexed message may run on past the query's, since flattened
+      tracebacks are followed by prose on the same line.
+    - "near_duplicate": MinHash signatures of each unit and of each
+      traceback in it, bucketed with LSH bands. A candidate counts only if
+      its estimated Jaccard similarity to the query is at least `threshold`.
+
+    Ids are the FAISS ids of the units, i.e. chunk ids in a chunked index.
+    """
+    def __init__(
+        self,
+        signature_keys: np.ndarray,
+        signature_ids: np.ndarray,
+        signature_messages: np.ndarray,
+        band_keys: np.ndarray,
+        band_rows: np.ndarray,
+        minhashes: np.ndarray,
+        minhash_ids: np.ndarray,
+        bands: int = 16,
+        threshold: float = 0.8,
+        hasher: MinHasher = None,
+    ):
+        self.signature_keys = signature_keys
+        self.signature_ids = signature_ids
+        self.signature_messages = signature_messages
+        self.band_keys = band_keys
+        self.band_rows = band_rows
+        self.minhashes = minhashes
+        self.minhash_ids = minhash_ids
+        self.bands = bands
+        self.threshold = threshold
+        self.hasher = hasher or MinHasher(num_perm=minhashes.shape[1])
+
+    @staticmethod
+    def _signature_key(stack_signature: str) -> int:
+        return int(stack_signature[:16], 16)
+
+    @staticmethod
+    def _band_keys(minhash: np.ndarray, bands: int) -> List[int]:
+        rows = len(minhash) // bands
+        return [_hash64(bytes([band]) + minhash[band * rows:(band + 1) * rows].tobytes()) for band in range(bands)]
+
+    @classmethod
+    def build(cls, texts: Iterable[str], ids: Sequence[int], bands: int = 16, threshold: float = 0.8, hasher: MinHasher = None) -> "ExactMatchIndex":
+        """
+        Builds the index.
+
+        Args:
+            texts: The unit texts, streamed once.
+            ids: The id of each unit.
+            bands: The number of LSH bands; `hasher.num_perm` must be a multiple.
+            threshold: The minimum estimated Jaccard similarity of a near-duplicate.
+            hasher: The MinHasher; a default one if None.
+
+        Returns:
+            The index.
+        """
+        hasher = hasher or MinHasher()
+        if hasher.num_perm % bands:
+            raise ValueError(f"num_perm ({hasher.num_perm}) must be a multiple of bands ({bands}).")
+        signature_keys, signature_ids, signature_messages = [], [], []
+        minhashes, minhash_ids = [], []
+        for unit_id, text in zip(ids, texts):
+            seen = set()
+            regions = [text]
+            for region, parsed in iter_tracebacks(text):
+                regions.append(region)
+                signature = parsed.stack_signature
+                if signature is not None and (signature, parsed.message_template) not in seen:
+                    seen.add((signature, parsed.message_template))
+                    signature_keys.append(cls._signature_key(signature))
+                    signature_ids.append(int(unit_id))
+                    signature_messages.append(parsed.message_template)
+            for region in regions:
+                minhash = hasher.signature(region)
+                if minhash is not None:
+                    minhashes.append(minhash)
+                    minhash_ids.append(int(unit_id))
+        band_keys, band_rows = [], []
+        for row, minhash in enumerate(minhashes):
+            band_keys.extend(cls._band_keys(minhash, bands))
+            band_rows.extend([row] * bands)
+        signature_keys = np.array(signature_keys, dtype=np.uint64)
+        signature_order = np.argsort(signature_keys, kind="stable")
+        band_keys = np.array(band_keys, dtype=np.uint64)
+        band_order = np.argsort(band_keys, kind="stable")
+        return cls(
+            signature_keys[signature_order],
+            np.array(signature_ids, dtype=np.int64)[signature_order],
+            np.array(signature_messages, dtype=np.str_)[signature_order],
+            band_keys[band_order],
+            np.array(band_rows, dtype=np.int32)[band_order],
+            np.vstack(minhashes) if minhashes else np.zeros((0, hasher.num_perm), dtype=np.uint32),
+            np.array(minhash_ids, dtype=np.int64),
+            bands,
+            threshold,
+            hasher,
+        )
+
+    def update(self, removed_ids: Sequence[int], texts: Iterable[str], ids: Sequence[int]) -> "ExactMatchIndex":
+        """
+        Returns a copy without the units `removed_ids` and with `texts` added.
+
+        Only the added texts are parsed and hashed; the kept entries are
+        carried over as arrays, so the cost follows the change set rather
+        than the corpus.
+
+        Args:
+            removed_ids: The ids of the units to drop.
+            texts: The units to add, streamed once.
+            ids: The id of each added unit.
+
+        Returns:
+            The updated index.
+        """
+        added = ExactMatchIndex.build(texts, ids, self.bands, self.threshold, self.hasher)
+        removed_ids = np.asarray(removed_ids, dtype=np.int64)
+        keep_signatures = ~np.isin(self.signature_ids, removed_ids)
+        signature_keys = np.concatenate([self.signature_keys[keep_signatures], added.signature_keys])
+        signature_order = np.argsort(signature_keys, kind="stable")
+
+        keep_rows = ~np.isin(self.minhash_ids, removed_ids)
+        new_rows = np.cumsum(keep_rows, dtype=np.int64) - 1
+        keep_bands = keep_rows[self.band_rows]
+        band_keys = np.concatenate([self.band_keys[keep_bands], added.band_keys])
+        band_rows = np.concatenate([new_rows[self.band_rows[keep_bands]], added.band_rows + keep_rows.sum()]).astype(np.int32)
+        band_order = np.argsort(band_keys, kind="stable")
+        return ExactMatchIndex(
+            signature_keys[signature_order],
+            np.concatenate([self.signature_ids[keep_signatures], added.signature_ids])[signature_order],
+            np.concatenate([self.signature_messages[keep_signatures], added.signature_messages])[signature_order],
+            band_keys[band_order],
+            band_rows[band_order],
+            np.concatenate([self.minhashes[keep_rows], added.minhashes]),
+            np.concatenate([self.minhash_ids[keep_rows], added.minhash_ids]),
+            self.bands,
+            self.threshold,
+            self.hasher,
+        )
+
+    @staticmethod
+    def _find(keys: np.ndarray, key: int) -> slice:
+        key = np.uint64(key)
+        return slice(int(np.searchsorted(keys, key, side="left")), int(np.searchsorted(keys, key, side="right")))
+
+    def lookup(self, query: str) -> Optional[ExactMatch]:
+        """
+        Looks up the units that repeat the error in `query`.
+
+        The stack signature and message template of the query's last
+        traceback are tried first. Otherwise the MinHash of that traceback (or of the whole query, if it
+        has none) is matched against the LSH buckets.
+
+        Args:
+            query: The pasted error text.
+
+        Returns:
+            The match, or None.
+        """
+        tracebacks = list(iter_tracebacks(query))
+        if tracebacks:
+            parsed = tracebacks[-1][1]
+            signature = parsed.stack_signature
+            if signature is not None:
+                found = self._find(self.signature_keys, self._signature_key(signature))
+                template = parsed.message_template
+                ids = [
+                    unit_id for unit_id, message in zip(self.signature_ids[found].tolist(), self.signature_messages[found].tolist())
+                    if message == template or (template and message.startswith(template + " "))
+                ]
+                if ids:
+                    return ExactMatch(list(dict.fromkeys(ids)), "signature", 1.0)
+        minhash = self.hasher.signature(tracebacks[-1][0] if tracebacks else query)
+        if minhash is None or not len(self.band_keys):
+            return None
+        candidates = set()
+        for key in self._band_keys(minhash, self.bands):
+            candidates.update(self.band_rows[self._find(self.band_keys, key)].tolist())
+        if not candidates:
+            return None
+        rows = np.array(sorted(candidates))
+        similarity = (self.minhashes[rows] == minhash).mean(axis=1)
+        keep = similarity >= self.threshold
+        if not keep.any():
+            return None
+        order = np.argsort(-similarity[keep], kind="stable")
+        ids = self.minhash_ids[rows[keep][order]]
+        return ExactMatch(list(dict.fromkeys(ids.tolist())), "near_duplicate", float(similarity[keep][order][0]))
+
+    def save(self, path: str):
+        """Writes the index to an `.npz` file through a temporary file."""
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            signature_keys=self.signature_keys,
+            signature_ids=self.signature_ids,
+            signature_messages=self.signature_messages,
+            band_keys=self.band_keys,
+            band_rows=self.band_rows,
+            minhashes=self.minhashes,
+            minhash_ids=self.minhash_ids,
+            params=np.array([self.bands, self.threshold, self.hasher.num_perm, self.hasher.shingle_size, self.hasher.seed]),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ExactMatchIndex":
+        """Loads an index written by `save`."""
+        with np.load(path) as data:
+            bands, threshold, num_perm, shingle_size, seed = data["params"].tolist()
+            return cls(
+                data["signature_keys"],
+                data["signature_ids"],
+                data["signature_messages"],
+                data["band_keys"],
+                data["band_rows"],
+                data["minhashes"],
+                data["minhash_ids"],
+                int(bands),
+                threshold,
+                MinHasher(int(num_perm), int(shingle_size), int(seed)),
+            )
+
+
+def build_for_index(content_of: Callable[[int], str], doc_ids: Sequence[int], chunks: np.ndarray = None) -> ExactMatchIndex:
+    """Builds an exact-match index whose ids match a FAISS index (see `chunker.index_units`)."""
+    ids, texts = index_units(content_of, doc_ids, chunks)
+    return ExactMatchIndex.build(texts, ids)
+
+
+def build_from_metadata(metadata_path: str, index_dir: str) -> ExactMatchIndex:
+    """
+    Builds the exact-match index for a metadata file and saves it next to `index.faiss`.
+
+    Raises:
+        ValueError: If `index_dir` is a versioned index saved by the Indexer
+            (a symlink), which already has its own exact-match index. Writing
+            into the live version would pair it with another corpus.
+    """
+    if os.path.islink(os.path.normpath(index_dir)):
+        raise ValueError(f"{index_dir} is a versioned index saved by the Indexer; rebuild it with indexer.py instead.")
+    store = open_metadata_store(metadata_path)
+    try:
+        chunks_path = os.path.join(index_dir, CHUNKS_FILE)
+        chunks = load_chunks(chunks_path) if os.path.exists(chunks_path) else None
+        index = build_for_index(lambda i: record_content(store[i]), store.ids(), chunks)
+    finally:
+        store.close()
+    index.save(os.path.join(index_dir, EXACT_MATCH_FILE))
+    logger.info(f"Built exact-match index with {len(index.signature_keys)} traceback signatures and {len(index.minhashes)} MinHashes.")
+    return index
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the exact-match index for a JSONL corpus next to its FAISS index.")
+    parser.add_argument('--metadata_path', type=str, default='data/github_issues.jsonl')
+    parser.add_argument('--index_dir', type=str, required=True)
+    args = parser.parse_args()
+    build_from_metadata(args.metadata_path, args.index_dir)
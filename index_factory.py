@@ -0,0 +1,179 @@
+import faiss
+import logging
+import math
+import numpy as np
+
+from typing import Optional
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# FAISS warns when k-means gets fewer than this many points per centroid.
+MIN_POINTS_PER_CENTROID = 39
+
+
+def _metric(metric: str) -> int:
+    if metric == "ip":
+        return faiss.METRIC_INNER_PRODUCT
+    if metric == "l2":
+        return faiss.METRIC_L2
+    raise ValueError(f"Unknown metric '{metric}'. Expected 'ip' or 'l2'.")
+
+
+def default_nlist(n: int) -> int:
+    """Picks the number of IVF lists: about 4 * sqrt(n), with enough points to train each list."""
+    return max(1, min(int(4 * math.sqrt(n)), n // MIN_POINTS_PER_CENTROID))
+
+
+def _pq_subquantizers(dim: int, pq_m: int) -> int:
+    """Returns the largest divisor of `dim` that is not larger than `pq_m`."""
+    for m in range(min(pq_m, dim), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def sample_training_set(embeddings: np.ndarray, train_size: int, seed: int = 0) -> np.ndarray:
+    """
+    Draws a uniform random sample of rows to train an index on.
+
+    Args:
+        embeddings: The full set of vectors.
+        train_size: The maximum number of vectors to sample.
+        seed: The random seed, so that repeated builds are reproducible.
+
+    Returns:
+        A contiguous float32 array with at most `train_size` rows.
+    """
+    if len(embeddings) <= train_size:
+        return np.ascontiguousarray(embeddings, dtype="float32")
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(embeddings), size=train_size, replace=False))
+    return np.ascontiguousarray(embeddings[rows], dtype="float32")
+
+
+def create_index(
+    dim: int,
+    n: int,
+    index_type: str = "flat",
+    metric: str = "ip",
+    nlist: Optional[int] = None,
+    pq_m: int = 16,
+    pq_bits: int = 8,
+    hnsw_m: int = 32,
+    ef_construction: int = 200,
+) -> faiss.Index:
+    """
+    Creates an empty (untrained) FAISS index of the requested type.
+
+    Args:
+        dim: The vector dimension.
+        n: The expected number of vectors, used to size IVF lists and PQ codebooks.
+        index_type: One of "flat", "ivf_flat", "ivf_pq" or "hnsw".
+        metric: "ip" for inner product or "l2" for Euclidean distance.
+        nlist: The number of IVF lists. Defaults to `default_nlist(n)`.
+        pq_m: The maximum number of PQ sub-quantizers; adjusted to divide `dim`.
+        pq_bits: The bits per PQ code; reduced when there is too little training data.
+        hnsw_m: The number of HNSW neighbours per node.
+        ef_construction: The HNSW candidate list size used while building.
+
+    Returns:
+        A FAISS index. IVF indexes still need to be trained.
+    """
+    faiss_metric = _metric(metric)
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dim) if metric == "ip" else faiss.IndexFlatL2(dim)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss_metric)
+        index.hnsw.efConstruction = ef_construction
+        return index
+
+    nlist = nlist or default_nlist(n)
+    quantizer = faiss.IndexFlatIP(dim) if metric == "ip" else faiss.IndexFlatL2(dim)
+    if index_type == "ivf_flat":
+        return faiss.IndexIVFFlat(quantizer, dim, nlist, faiss_metric)
+    if index_type == "ivf_pq":
+        m = _pq_subquantizers(dim, pq_m)
+        max_bits = int(math.log2(max(n // MIN_POINTS_PER_CENTROID, 2)))
+        nbits = max(1, min(pq_bits, max_bits))
+        return faiss.IndexIVFPQ(quantizer, dim, nlist, m, nbits, faiss_metric)
+    raise ValueError(f"Unknown index type '{index_type}'. Expected one of {INDEX_TYPES}.")
+
+
+def build_index(
+    embeddings: np.ndarray,
+    index_type: str = "flat",
+    metric: str = "ip",
+    train_size: int = 100_000,
+    seed: int = 0,
+    ids: Optional[np.ndarray] = None,
+    **kwargs,
+) -> faiss.Index:
+    """
+    Creates, trains and fills an index of the requested type.
+
+    Args:
+        embeddings: A float32 array of shape (n, dim).
+        index_type: One of "flat", "ivf_flat", "ivf_pq" or "hnsw".
+        metric: "ip" for inner product or "l2" for Euclidean distance.
+        train_size: The maximum number of vectors sampled to train IVF/PQ indexes.
+        seed: The random seed for training-set sampling.
+        ids: Optional int64 ids. When given, the index is wrapped in an
+            IndexIDMap2 so that vectors can be addressed by id.
+        **kwargs: Passed on to `create_index`.
+
+    Returns:
+        A populated FAISS index.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    n, dim = embeddings.shape
+    index = create_index(dim, n, index_type=index_type, metric=metric, **kwargs)
+    if not index.is_trained:
+        training_set = sample_training_set(embeddings, train_size, seed)
+        logger.info(f"Training {index_type} index on {len(training_set)} of {n} vectors...")
+        index.train(training_set)
+    if ids is None:
+        index.add(embeddings)
+        return index
+    index = faiss.IndexIDMap2(index)
+    index.add_with_ids(embeddings, np.ascontiguousarray(ids, dtype="int64"))
+    return index
+
+
+def _unwrap(index: faiss.Index) -> faiss.Index:
+    """Returns the index inside an IndexIDMap / IndexIDMap2 wrapper."""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return faiss.downcast_index(index)
+
+
+def search_parameters(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """
+    Builds per-query search parameters for an index.
+
+    The parameters are passed to `index.search(..., params=...)` rather than
+    set on the index itself, so concurrent searches with different settings
+    do not interfere.
+
+    Args:
+        index: The index to be searched, optionally wrapped in an IndexIDMap.
+        nprobe: The number of IVF lists to visit.
+        ef_search: The HNSW candidate list size.
+
+    Returns:
+        A `faiss.SearchParameters` object, or None if no knob applies.
+    """
+    inner = _unwrap(index)
+    if nprobe is not None and isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=nprobe)
+    if ef_search is not None and isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+    return None
+
+
+def supports_remove(index: faiss.Index) -> bool:
+    """Returns False for index types that cannot delete vectors (HNSW)."""
+    return not isinstance(_unwrap(index), faiss.IndexHNSW)
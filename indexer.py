@@ -1,27 +1,59 @@
+import bm25
+import exact_match
 import faiss
 import github
+import index_factory
+import hashlib
+import json
 import logging
 import numpy as np
 import google.generativeai as genai
 import os
-import re
+import shutil
 import stackapi
+import tempfile
+import time
 
-from typing import Dict, List
+from chunker import CHUNKS_FILE, Chunker, collapse_hits, index_units, load_chunks, passage_text, save_chunks
+from corpus import CorpusStore, write_corpus
+from data_collector.engine import SYNC_OVERLAP
+from datetime import datetime, timezone
+from embedder import BatchEmbedder
+from embedding_cache import EmbeddingCache
+from metadata_store import METADATA_FILE, saved_metadata_path
+from text_cleaning import clean_document, clean_text
+from typing import Dict, List, Optional, Tuple
 
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Each save writes a new directory under "<index dir>.versions" and points
+# the index dir, a symlink, at it. The previous version is kept for readers
+# that still have it open.
+VERSIONS_SUFFIX = ".versions"
+KEEP_VERSIONS = 2
+
+
 class Indexer:
-    def __init__(self, repo_name: str, so_tags: List[str], github_token: str = None, google_api_key: str = None):
+    def __init__(self, repo_name: str, so_tags: List[str], github_token: str = None, google_api_key: str = None, embedder: BatchEmbedder = None, index_type: str = "flat", chunker: Chunker = None):
         self.repo_name = repo_name
+        self.index_type = index_type
+        self.chunker = chunker
+        self.chunks = None
         self.so_tags = so_tags
         self.github_token = github_token or os.environ.get("GITHUB_TOKEN")
         self.google_api_key = google_api_key or os.environ.get("GOOGLE_API_KEY")
         self.index = None
         self.metadata = []
+        self.manifest = None
+        self._metadata_by_id = None
+        # The directory the index was loaded from and the (removed, added)
+        # FAISS ids since then, so that saving can update its lexical and
+        # exact-match indexes instead of rebuilding them.
+        self._loaded_from = None
+        self._unit_changes = None
 
         if not self.github_token:
             raise ValueError("GitHub token not provided. Please set the GITHUB_TOKEN environment variable.")
@@ -31,38 +63,57 @@ class Indexer:
         self.gh = github.Github(self.github_token)
         self.so = stackapi.StackAPI("stackoverflow")
         genai.configure(api_key=self.google_api_key)
+        self.embedder = embedder or BatchEmbedder()
 
     def _preprocess_text(self, text: str) -> str:
-        text = re.sub(r"```.*?```", "", text, flags=re.DOTALL)
-        text = re.sub(r"\s+", " ", text).strip()
-        return text
+        if self.chunker is not None:
+            # Keep code and line breaks so that chunk boundaries can see them.
+            return clean_document(text)
+        return clean_text(text)
 
-    def _get_github_issues(self):
-        logger.info(f"Fetching open issues from {self.repo_name}...")
+    def _get_github_issues(self, since: float = None):
+        """
+        Fetches the open issues, or with `since` (epoch seconds) every issue
+        updated since then. Issues are keyed by their number, as in the
+        collector's records. Issues closed since then are returned as
+        {"source", "id", "state": "closed"} stubs without their comments.
+        """
         repo = self.gh.get_repo(self.repo_name)
-        issues = repo.get_issues(state="open")
+        if since is None:
+            logger.info(f"Fetching open issues from {self.repo_name}...")
+            issues = repo.get_issues(state="open")
+        else:
+            logger.info(f"Fetching issues of {self.repo_name} updated since {time.ctime(since)}...")
+            issues = repo.get_issues(state="all", since=datetime.fromtimestamp(since, tz=timezone.utc))
         documents = []
         for issue in issues:
-            comments = "".join([c.body for c in issue.get_comments()])
-            full_text = f"{issue.title} {issue.body} {comments}"
+            if issue.state == "closed":
+                documents.append({"source": "github", "id": issue.number, "state": "closed"})
+                continue
+            comments = "\n\n".join([c.body for c in issue.get_comments()])
+            full_text = f"{issue.title}\n\n{issue.body}\n\n{comments}"
             processed_text = self._preprocess_text(full_text)
             documents.append({
                 "source": "github",
                 "url": issue.html_url,
-                "id": issue.id,
+                "id": issue.number,
                 "document": processed_text,
             })
         logger.info(f"Fetched {len(documents)} issues from GitHub.")
         return documents
 
-    def _get_stackoverflow_questions(self):
+    def _get_stackoverflow_questions(self, since: float = None):
         logger.info(f"Fetching questions from Stack Overflow with tags: {self.so_tags}...")
-        questions = self.so.fetch("questions", tagged=self.so_tags, sort="votes", pagesize=100, filter="withbody")
+        if since is None:
+            questions = self.so.fetch("questions", tagged=self.so_tags, sort="votes", pagesize=100, filter="withbody")
+        else:
+            # Activity includes new and edited answers.
+            questions = self.so.fetch("questions", tagged=self.so_tags, sort="activity", min=int(since), pagesize=100, filter="withbody")
         documents = []
         for q in questions["items"]:
             if q.get("is_answered") and q.get("accepted_answer_id"):
                 answer = self.so.fetch(f"answers/{q['accepted_answer_id']}", filter="withbody")["items"][0]
-                full_text = f"{q['title']} {q['body']} {answer['body']}"
+                full_text = f"{q['title']}\n\n{q['body']}\n\n{answer['body']}"
                 processed_text = self._preprocess_text(full_text)
                 documents.append({
                     "source": "stackoverflow",
@@ -73,59 +124,332 @@ class Indexer:
         logger.info(f"Fetched {len(documents)} questions from Stack Overflow.")
         return documents
 
-    def build_index(self):
+    def _fetch_documents(self) -> List[Dict]:
         documents = self._get_github_issues()
         documents.extend(self._get_stackoverflow_questions())
+        return documents
+
+    def _fetch_changes(self, since: float) -> Tuple[List[Dict], List[str]]:
+        """Fetches the documents updated since `since`, and the keys of issues closed since then."""
+        documents, closed = [], []
+        for doc in self._get_github_issues(since=since):
+            if doc.get("state") == "closed":
+                closed.append(self._document_key(doc))
+            else:
+                documents.append(doc)
+        documents.extend(self._get_stackoverflow_questions(since=since))
+        return documents, closed
+
+    @staticmethod
+    def _document_key(doc: Dict) -> str:
+        return f"{doc['source']}:{doc['id']}"
+
+    @staticmethod
+    def _content_hash(doc: Dict) -> str:
+        return hashlib.sha256(doc["document"].encode("utf-8")).hexdigest()
+
+    def _embed_documents(self, documents: List[Dict]) -> np.ndarray:
+        embeddings = self.embedder.embed([doc["document"] for doc in documents], task_type="RETRIEVAL_DOCUMENT")
+        if self.embedder.cache is not None:
+            logger.info(f"Embedding cache: {self.embedder.cache.stats()}")
+        return embeddings
+
+    def _chunking_settings(self) -> Optional[Dict]:
+        if self.chunker is None:
+            return None
+        return {"chunk_tokens": self.chunker.chunk_tokens, "overlap_tokens": self.chunker.overlap_tokens}
+
+    def _vectorize(self, documents: List[Dict], doc_ids: List[int]):
+        """
+        Embeds documents, or their chunks when chunking is enabled.
+
+        New chunks are appended to the chunk table, so chunk ids (the FAISS
+        ids of a chunked index) are never reused.
+
+        Returns:
+            The embeddings and the FAISS id of each row.
+        """
+        if self.chunker is None:
+            return self._embed_documents(documents), np.asarray(doc_ids, dtype="int64")
+        table = self.chunker.chunk_documents([doc["document"] for doc in documents], doc_ids)
+        first = len(self.chunks)
+        self.chunks = np.vstack([self.chunks, table])
+        texts_by_id = {doc_id: doc["document"] for doc, doc_id in zip(documents, doc_ids)}
+        texts = [texts_by_id[int(parent)][start:end] for parent, start, end in table]
+        logger.info(f"Split {len(documents)} documents into {len(texts)} chunks.")
+        embeddings = self.embedder.embed(texts, task_type="RETRIEVAL_DOCUMENT")
+        if self.embedder.cache is not None:
+            logger.info(f"Embedding cache: {self.embedder.cache.stats()}")
+        return embeddings, np.arange(first, first + len(table), dtype="int64")
+
+    def build_index(self):
+        started = time.time()
+        documents = self._fetch_documents()
 
         logger.info("Generating embeddings...")
-        embeddings = []
-        for doc in documents:
-            response = genai.embed_content(
-                model="models/embedding-001",
-                content=doc["document"],
-                task_type="RETRIEVAL_DOCUMENT"
-            )
-            embeddings.append(response["embedding"])
-        
-        embeddings = np.array(embeddings).astype("float32")
-        self.index = faiss.IndexFlatIP(embeddings.shape[1])
-        self.index.add(embeddings)
-        self.metadata = documents
+        ids = np.arange(len(documents), dtype="int64")
+        self.chunks = np.zeros((0, 3), dtype="int32") if self.chunker is not None else None
+        embeddings, vector_ids = self._vectorize(documents, ids.tolist())
+        self.index = index_factory.build_index(embeddings, self.index_type, metric="ip", ids=vector_ids)
+        self.metadata = [{**doc, "faiss_id": int(i)} for doc, i in zip(documents, ids)]
+        self.manifest = {
+            "index_type": self.index_type,
+            "chunking": self._chunking_settings(),
+            "next_id": len(documents),
+            "synced_at": started,
+            "documents": {
+                self._document_key(doc): {"faiss_id": int(i), "hash": self._content_hash(doc)}
+                for doc, i in zip(documents, ids)
+            },
+        }
+        self._metadata_by_id = None
+        self._unit_changes = None
         logger.info("Index built successfully.")
 
+    def update_index(self, path: str, since_last_sync: bool = False):
+        """
+        Brings a saved index up to date with the current GitHub and Stack
+        Overflow documents, embedding only what changed.
+
+        New documents are added with fresh ids, changed documents are
+        re-embedded under their existing id and documents that disappeared
+        are removed. In a chunked index the chunks of changed and removed
+        documents are removed and fresh chunks are added. Indexes saved
+        without a manifest are rebuilt from scratch.
+
+        Args:
+            path: The index directory.
+            since_last_sync: Only download the issues and questions updated
+                since the manifest's `synced_at`, instead of everything. Issues
+                closed since then are removed; nothing else is.
+        """
+        if not os.path.exists(os.path.join(path, "manifest.json")):
+            logger.info(f"No manifest found in {path}; building a full index.")
+            self.build_index()
+            self.save_index(path)
+            return
+        self.load_index(path)
+        self.index_type = self.manifest.get("index_type", "flat")
+        chunking = self.manifest.get("chunking")
+        self.chunker = Chunker(**chunking) if chunking else None
+
+        started = time.time()
+        synced_at = self.manifest.get("synced_at")
+        if since_last_sync and synced_at is not None:
+            documents, closed = self._fetch_changes(synced_at - SYNC_OVERLAP)
+        else:
+            documents, closed = self._fetch_documents(), None
+        entries = self.manifest["documents"]
+        seen = set()
+        to_embed, embed_ids, changed_ids = [], [], []
+        for doc in documents:
+            key = self._document_key(doc)
+            seen.add(key)
+            entry = entries.get(key)
+            content_hash = self._content_hash(doc)
+            if entry is None:
+                entry = {"faiss_id": self.manifest["next_id"], "hash": content_hash}
+                self.manifest["next_id"] += 1
+                entries[key] = entry
+            elif entry["hash"] == content_hash:
+                continue
+            else:
+                changed_ids.append(entry["faiss_id"])
+            entry["hash"] = content_hash
+            to_embed.append(doc)
+            embed_ids.append(entry["faiss_id"])
+        if closed is None:
+            deleted = [key for key in entries if key not in seen]
+        else:
+            deleted = [key for key in dict.fromkeys(closed) if key in entries]
+        self.manifest["synced_at"] = started
+
+        stale_ids = np.array(changed_ids + [entries[key]["faiss_id"] for key in deleted], dtype="int64")
+        if self.chunks is not None and len(stale_ids):
+            stale_chunks = np.flatnonzero(np.isin(self.chunks[:, 0], stale_ids))
+            self.chunks[stale_chunks, 0] = -1
+            stale_ids = stale_chunks.astype("int64")
+        if len(stale_ids):
+            self._remove_ids(stale_ids)
+        vector_ids = np.zeros(0, dtype="int64")
+        if to_embed:
+            embeddings, vector_ids = self._vectorize(to_embed, embed_ids)
+            self.index.add_with_ids(embeddings, vector_ids)
+        self._unit_changes = (stale_ids, vector_ids)
+
+        metadata_by_id = {record["faiss_id"]: record for record in self.metadata}
+        for key in deleted:
+            metadata_by_id.pop(entries.pop(key)["faiss_id"], None)
+        for doc, faiss_id in zip(to_embed, embed_ids):
+            metadata_by_id[faiss_id] = {**doc, "faiss_id": faiss_id}
+        self.metadata = [metadata_by_id[i] for i in sorted(metadata_by_id)]
+        self._metadata_by_id = None
+
+        logger.info(
+            f"Incremental update: {len(to_embed)} added or changed, {len(deleted)} removed, "
+            f"{self.index.ntotal} vectors in the index."
+        )
+        self.save_index(path)
+
+    def _remove_ids(self, ids: np.ndarray):
+        if index_factory.supports_remove(self.index):
+            self.index.remove_ids(ids)
+            return
+        # HNSW graphs cannot delete nodes, so rebuild from the stored vectors
+        # instead. This costs a re-insert but no embedding calls.
+        all_ids = faiss.vector_to_array(self.index.id_map)
+        keep = all_ids[~np.isin(all_ids, ids)]
+        vectors = np.vstack([self.index.reconstruct(int(i)) for i in keep]) if len(keep) else np.zeros((0, self.index.d), dtype="float32")
+        logger.info(f"Rebuilding {self.index_type} index without {len(ids)} removed vectors...")
+        self.index = index_factory.build_index(vectors, self.index_type, metric="ip", ids=keep)
+
+    @staticmethod
+    def _versions_dir(path: str) -> str:
+        return os.path.normpath(path) + VERSIONS_SUFFIX
+
+    def _publish(self, path: str, version: str):
+        """
+        Points `path` at the saved `version` directory by renaming a fresh
+        symlink over it, then prunes all but the newest `KEEP_VERSIONS`.
+
+        An index directory saved before versioning is moved into the
+        versions directory first, which is the only non-atomic step.
+        """
+        link = os.path.normpath(path)
+        versions = self._versions_dir(path)
+        if os.path.isdir(link) and not os.path.islink(link):
+            if os.listdir(link):
+                logger.info(f"Moving the unversioned index in {link} into {versions}.")
+                os.rename(link, os.path.join(versions, "0-unversioned"))
+            else:
+                os.rmdir(link)
+        tmp_link = f"{link}.{os.getpid()}.link"
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(os.path.relpath(version, os.path.dirname(link) or "."), tmp_link)
+        os.replace(tmp_link, link)
+        # Older versions may still be open in running retrievers; files
+        # removed under them stay readable until they are closed.
+        for name in sorted(os.listdir(versions))[:-KEEP_VERSIONS]:
+            old = os.path.join(versions, name)
+            if os.path.realpath(old) != os.path.realpath(link):
+                shutil.rmtree(old, ignore_errors=True)
+
     def save_index(self, path: str):
+        """
+        Saves the index as a new version and switches `path` to it atomically.
+
+        `path` is a symlink to a directory under `<path>.versions`, so a
+        reader that resolves it once sees a FAISS index, metadata and
+        sidecars from the same save, and a save that fails midway leaves the
+        previous version in place.
+        """
         logger.info(f"Saving index to {path}...")
-        if not os.path.exists(path):
-            os.makedirs(path)
-        faiss.write_index(self.index, os.path.join(path, "index.faiss"))
-        with open(os.path.join(path, "metadata.json"), "w") as f:
-            import json
-            json.dump(self.metadata, f)
+        versions = self._versions_dir(path)
+        os.makedirs(versions, exist_ok=True)
+        version = tempfile.mkdtemp(dir=versions, prefix=f"{time.time_ns()}-")
+        try:
+            os.chmod(version, 0o755)
+            faiss.write_index(self.index, os.path.join(version, "index.faiss"))
+            write_corpus(os.path.join(version, METADATA_FILE), self.metadata)
+            if self.chunks is not None:
+                save_chunks(os.path.join(version, CHUNKS_FILE), self.chunks)
+            self._save_sidecars(version)
+            if self.manifest is not None:
+                with open(os.path.join(version, "manifest.json"), "w") as f:
+                    json.dump(self.manifest, f)
+        except BaseException:
+            shutil.rmtree(version, ignore_errors=True)
+            raise
+        self._publish(path, version)
+        self._loaded_from = version
+        self._unit_changes = (np.zeros(0, dtype="int64"), np.zeros(0, dtype="int64"))
         logger.info("Index saved successfully.")
 
+    def _save_sidecars(self, path: str):
+        """
+        Writes the lexical and exact-match indexes. After `load_index` (and
+        `update_index`) they are updated from the loaded ones with only the
+        changed units; after `build_index` they are built from scratch.
+        """
+        def content_of(faiss_id: int) -> str:
+            return self._lookup(faiss_id)["document"]
+
+        sidecars = [(bm25.BM25_FILE, bm25.BM25Index, bm25.build_for_index), (exact_match.EXACT_MATCH_FILE, exact_match.ExactMatchIndex, exact_match.build_for_index)]
+        for name, index_class, build_for_index in sidecars:
+            source = os.path.join(self._loaded_from, name) if self._unit_changes is not None else None
+            if source is not None and os.path.exists(source):
+                removed, added = self._unit_changes
+                if self.chunks is None:
+                    ids, texts = index_units(content_of, added)
+                else:
+                    ids, texts = index_units(content_of, None, self.chunks, added)
+                sidecar = index_class.load(source).update(removed, texts, ids)
+            else:
+                sidecar = build_for_index(content_of, [record["faiss_id"] for record in self.metadata], self.chunks)
+            sidecar.save(os.path.join(path, name))
+
     def load_index(self, path: str):
         logger.info(f"Loading index from {path}...")
+        # Resolve a versioned index directory once, so that every file
+        # comes from the same save.
+        path = os.path.realpath(path)
         self.index = faiss.read_index(os.path.join(path, "index.faiss"))
-        with open(os.path.join(path, "metadata.json"), "r") as f:
-            import json
-            self.metadata = json.load(f)
+        self.metadata = self._read_metadata(path)
+        manifest_path = os.path.join(path, "manifest.json")
+        self.manifest = None
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r") as f:
+                self.manifest = json.load(f)
+        chunks_path = os.path.join(path, CHUNKS_FILE)
+        self.chunks = np.array(load_chunks(chunks_path)) if os.path.exists(chunks_path) else None
+        self._metadata_by_id = None
+        self._loaded_from = path
+        self._unit_changes = (np.zeros(0, dtype="int64"), np.zeros(0, dtype="int64"))
         logger.info("Index loaded successfully.")
 
+    def _read_metadata(self, path: str) -> List[Dict]:
+        corpus_path = saved_metadata_path(path)
+        if not corpus_path.endswith(METADATA_FILE):
+            with open(corpus_path, "r") as f:
+                return json.load(f)
+        metadata = []
+        with CorpusStore(corpus_path) as store:
+            for record in store:
+                # A corpus returns the text as "content"; the Indexer calls it "document".
+                record["document"] = record.pop("content")
+                metadata.append(record)
+        return metadata
+
+    def _lookup(self, idx: int) -> Dict:
+        # Indexes built before incremental updates use row positions as ids.
+        if not self.metadata or "faiss_id" not in self.metadata[0]:
+            return self.metadata[idx]
+        if self._metadata_by_id is None:
+            self._metadata_by_id = {record["faiss_id"]: record for record in self.metadata}
+        return self._metadata_by_id[int(idx)]
+
     def query_index(self, query: str, top_k: int) -> List[Dict]:
         logger.info(f"Querying index with top_k={top_k}...")
-        response = genai.embed_content(
-            model="models/embedding-001",
-            content=query,
-            task_type="RETRIEVAL_QUERY"
-        )
-        query_embedding = np.array(response["embedding"]).astype("float32").reshape(1, -1)
+        query_embedding = self.embedder.embed([query], task_type="RETRIEVAL_QUERY")
+        if self.chunks is not None:
+            distances, indices = self.index.search(query_embedding, top_k * 4)
+            results = []
+            for parent, score, chunk_ids in collapse_hits(distances[0], indices[0], self.chunks, top_k):
+                metadata = self._lookup(parent)
+                spans = [tuple(self.chunks[i, 1:]) for i in chunk_ids]
+                results.append({"score": score, "metadata": metadata, "passage": passage_text(metadata["document"], spans)})
+            logger.info("Query processed successfully.")
+            return results
         distances, indices = self.index.search(query_embedding, top_k)
         
         results = []
         for i, idx in enumerate(indices[0]):
+            if idx < 0:
+                continue
             results.append({
                 "score": distances[0][i],
-                "metadata": self.metadata[idx]
+                "metadata": self._lookup(idx)
             })
         logger.info("Query processed successfully.")
         return results
@@ -136,8 +460,25 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--repo_name', type=str, required=True)
     parser.add_argument('--so_tags', type=str, required=True)
+    parser.add_argument('--embed_batch_size', type=int, default=100)
+    parser.add_argument('--embed_concurrency', type=int, default=4)
+    parser.add_argument('--embedding_cache', type=str, default='data/embedding_cache')
+    parser.add_argument('--incremental', action='store_true', help='Update the saved index instead of rebuilding it.')
+    parser.add_argument('--since_last_sync', action='store_true', help='With --incremental, only download what changed since the last build or update.')
+    parser.add_argument('--index_type', type=str, default='flat', choices=index_factory.INDEX_TYPES)
+    parser.add_argument('--chunk_tokens', type=int, default=0, help='Index overlapping passages of about this many tokens instead of whole documents.')
+    parser.add_argument('--chunk_overlap', type=int, default=32)
     args = parser.parse_args()
 
-    indexer = Indexer(repo_name=args.repo_name, so_tags=args.so_tags.split(','))
-    indexer.build_index()
-    indexer.save_index('data/faiss_index')
\ No newline at end of file
+    embedder = BatchEmbedder(
+        max_batch_size=args.embed_batch_size,
+        max_concurrency=args.embed_concurrency,
+        cache=EmbeddingCache(args.embedding_cache),
+    )
+    chunker = Chunker(args.chunk_tokens, args.chunk_overlap) if args.chunk_tokens else None
+    indexer = Indexer(repo_name=args.repo_name, so_tags=args.so_tags.split(','), embedder=embedder, index_type=args.index_type, chunker=chunker)
+    if args.incremental:
+        indexer.update_index('data/faiss_index', since_last_sync=args.since_last_sync)
+    else:
+        indexer.build_index()
+        indexer.save_index('data/faiss_index')
\ No newline at end of file
@@ -1,21 +1,16 @@
+import asyncio
 import os
 import logging
 import google.generativeai as genai
 import time
+from response_cache import ResponseCache
+from typing import Iterator
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class LLMAgent:
-    def __init__(self, api_key: str = None):
-        self.api_key = api_key or os.environ.get("GOOGLE_API_KEY")
-        if not self.api_key:
-            raise ValueError("Google API key not provided. Please set the GOOGLE_API_KEY environment variable.")
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-pro')
-
-    def generate_patch(self, context: str, file_path: str = None, retries: int = 3, delay: int = 60):
-        system_prompt = """You are an expert programmer. Your task is to provide code patches to fix bugs.
+SYSTEM_PROMPT = """You are an expert programmer. Your task is to provide code patches to fix bugs.
 Pay close attention to data types and potential `TypeError` exceptions.
 Analyze the provided context, which includes an error message and relevant code snippets.
 Generate a patch in the git diff format.
@@ -41,59 +36,187 @@ class TestMyCode(unittest.TestCase):
         self.assertEqual(my_function(1), 1)
 ```
 """
-        
+
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_NONE",
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_NONE",
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_NONE",
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_NONE",
+    },
+]
+
+class LLMAgent:
+    def __init__(self, api_key: str = None, response_cache: ResponseCache = None):
+        self.response_cache = response_cache
+        self.api_key = api_key or os.environ.get("GOOGLE_API_KEY")
+        if not self.api_key:
+            raise ValueError("Google API key not provided. Please set the GOOGLE_API_KEY environment variable.")
+        genai.configure(api_key=self.api_key)
+        self.model = genai.GenerativeModel('gemini-pro')
+
+    def _build_prompt(self, context: str, file_path: str = None) -> str:
         if file_path:
             user_prompt = f"Given the following context and file path, generate a patch to fix the bug.\n\nContext:\n{context}\n\nFile Path:\n{file_path}"
         else:
             user_prompt = f"Given the following context, generate a patch to fix the bug.\n\nContext:\n{context}"
 
-        prompt = f"{system_prompt}\n\n{user_prompt}"
-
-        safety_settings = [
-            {
-                "category": "HARM_CATEGORY_HARASSMENT",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_HATE_SPEECH",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                "threshold": "BLOCK_NONE",
-            },
-        ]
+        return f"{SYSTEM_PROMPT}\n\n{user_prompt}"
+
+    def _handle_response(self, response) -> str:
+        logger.info(f"Full API Response: {response}")
+
+        if hasattr(response, 'text'):
+            return response.text
+        
+        # Check for blocked response
+        if response.prompt_feedback and response.prompt_feedback.block_reason:
+            logger.error(f"API call blocked due to: {response.prompt_feedback.block_reason}")
+            return f"Error: The API call was blocked. Reason: {response.prompt_feedback.block_reason}"
+
+        # Handle other unexpected responses
+        logger.error(f"Unexpected API response: {response}")
+        return "Error: The API returned an unexpected response. Check logs for details."
+
+    def _cache_prompt(self, context: str, file_path: str = None) -> str:
+        # The cache is keyed on the variable part of the prompt only; the
+        # shared system prompt would make every prompt look alike.
+        return f"File Path: {file_path}\n\n{context}" if file_path else context
+
+    def _store(self, cache_prompt: str, response: str) -> str:
+        # Errors and blocked responses are never cached.
+        if self.response_cache is not None and not response.startswith("Error:"):
+            self.response_cache.put(cache_prompt, response)
+        return response
+
+    def generate_patch(self, context: str, file_path: str = None, retries: int = 3, delay: int = 60):
+        prompt = self._build_prompt(context, file_path)
+        cache_prompt = self._cache_prompt(context, file_path)
+        if self.response_cache is not None:
+            cached = self.response_cache.get(cache_prompt)
+            if cached is not None:
+                return cached
+
+        for i in range(retries):
+            try:
+                response = self.model.generate_content(
+                    prompt,
+                    generation_config={"response_mime_type": "text/plain"},
+                    safety_settings=SAFETY_SETTINGS
+                )
+                return self._store(cache_prompt, self._handle_response(response))
+
+            except Exception as e:
+                if "429" in str(e) and i < retries - 1:
+                    logger.warning(f"Rate limit exceeded. Retrying in {delay} seconds...")
+                    time.sleep(delay)
+                else:
+                    logger.error(f"An error occurred during the API call: {e}")
+                    return f"Error: An error occurred during the API call: {e}"
+
+    def generate_patch_stream(self, context: str, file_path: str = None, retries: int = 3, delay: int = 60) -> Iterator[str]:
+        """
+        The streaming counterpart of `generate_patch`.
 
+        Yields the response text chunk by chunk as it arrives, so callers can
+        render and parse it before the completion has finished. A cached
+        response is yielded as a single chunk. Rate limits are only retried
+        before the first chunk; once text has been yielded it cannot be
+        taken back.
+        """
+        prompt = self._build_prompt(context, file_path)
+        cache_prompt = self._cache_prompt(context, file_path)
+        if self.response_cache is not None:
+            cached = self.response_cache.get(cache_prompt)
+            if cached is not None:
+                yield cached
+                return
+
+        chunks = []
         for i in range(retries):
             try:
                 response = self.model.generate_content(
                     prompt,
                     generation_config={"response_mime_type": "text/plain"},
-                    safety_settings=safety_settings
+                    safety_settings=SAFETY_SETTINGS,
+                    stream=True
                 )
+                for chunk in response:
+                    text = self._handle_response(chunk)
+                    chunks.append(text)
+                    yield text
+                    if text.startswith("Error:"):
+                        return
+                self._store(cache_prompt, "".join(chunks))
+                return
+
+            except Exception as e:
+                if "429" in str(e) and not chunks and i < retries - 1:
+                    logger.warning(f"Rate limit exceeded. Retrying in {delay} seconds...")
+                    time.sleep(delay)
+                else:
+                    logger.error(f"An error occurred during the API call: {e}")
+                    yield f"Error: An error occurred during the API call: {e}"
+                    return
 
-                logger.info(f"Full API Response: {response}")
+    async def generate_patch_async(
+        self,
+        context: str,
+        file_path: str = None,
+        retries: int = 3,
+        delay: int = 60,
+        temperature: float = None,
+        max_output_tokens: int = None,
+        use_cache: bool = True,
+    ):
+        """
+        The asyncio counterpart of `generate_patch`.
 
-                if hasattr(response, 'text'):
-                    return response.text
-                
-                # Check for blocked response
-                if response.prompt_feedback and response.prompt_feedback.block_reason:
-                    logger.error(f"API call blocked due to: {response.prompt_feedback.block_reason}")
-                    return f"Error: The API call was blocked. Reason: {response.prompt_feedback.block_reason}"
+        Rate-limit back-off uses `asyncio.sleep`, so a 429 suspends only this
+        request instead of blocking a worker thread.
 
-                # Handle other unexpected responses
-                logger.error(f"Unexpected API response: {response}")
-                return "Error: The API returned an unexpected response. Check logs for details."
+        `temperature` and `max_output_tokens` are passed on to the model when
+        set. Set `use_cache=False` when sampling several candidates, since a
+        cached response would make every sample identical.
+        """
+        prompt = self._build_prompt(context, file_path)
+        cache_prompt = self._cache_prompt(context, file_path)
+        response_cache = self.response_cache if use_cache else None
+        if response_cache is not None:
+            cached = await response_cache.get_async(cache_prompt)
+            if cached is not None:
+                return cached
+
+        generation_config = {"response_mime_type": "text/plain"}
+        if temperature is not None:
+            generation_config["temperature"] = temperature
+        if max_output_tokens is not None:
+            generation_config["max_output_tokens"] = max_output_tokens
+
+        for i in range(retries):
+            try:
+                response = await self.model.generate_content_async(
+                    prompt,
+                    generation_config=generation_config,
+                    safety_settings=SAFETY_SETTINGS
+                )
+                response_text = self._handle_response(response)
+                return self._store(cache_prompt, response_text) if use_cache else response_text
 
             except Exception as e:
                 if "429" in str(e) and i < retries - 1:
                     logger.warning(f"Rate limit exceeded. Retrying in {delay} seconds...")
-                    time.sleep(delay)
+                    await asyncio.sleep(delay)
                 else:
                     logger.error(f"An error occurred during the API call: {e}")
-                    return f"Error: An error occurred during the API call: {e}"
\ No newline at end of file
+                    return f"Error: An error occurred during the API call: {e}"
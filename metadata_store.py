@@ -0,0 +1,155 @@
+import json
+import logging
+import mmap
+import numpy as np
+import os
+
+from corpus import CORPUS_EXTENSION, CorpusStore
+from typing import Dict, List, Sequence
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The metadata file `Indexer.save_index` writes next to `index.faiss`.
+METADATA_FILE = "metadata.corpus"
+# Indexes saved before the binary corpus format keep their metadata here.
+LEGACY_METADATA_FILE = "metadata.json"
+
+
+def saved_metadata_path(index_dir: str) -> str:
+    """The metadata file an Indexer saved in `index_dir`: `metadata.corpus`, or `metadata.json` for older indexes."""
+    corpus_path = os.path.join(index_dir, METADATA_FILE)
+    legacy_path = os.path.join(index_dir, LEGACY_METADATA_FILE)
+    return legacy_path if not os.path.exists(corpus_path) and os.path.exists(legacy_path) else corpus_path
+
+
+def record_content(record: Dict) -> str:
+    """Returns a record's text; collector output uses "content", Indexer output uses "document"."""
+    return record.get("content", record.get("document", record.get("text", "")))
+
+
+class JsonlMetadataStore:
+    """
+    Random access to the records of a JSONL file without loading them.
+
+    A sidecar file (`<path>.offsets.npy`) holds the byte range of every
+    non-empty line as an int64 array, plus the size and mtime of the JSONL file
+    it was built from. Opening the store memory-maps both files, so startup
+    does not depend on the corpus size, and a lookup parses only the
+    requested lines. The sidecar is rebuilt automatically when the JSONL file
+    changes.
+    """
+    def __init__(self, path: str):
+        """
+        Initializes the JsonlMetadataStore.
+
+        Args:
+            path: The path to the JSONL metadata file.
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        stat = os.fstat(self._file.fileno())
+        self._stamp = (stat.st_size, stat.st_mtime_ns)
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+        self._ranges = self._load_ranges()
+
+    @property
+    def _offsets_path(self) -> str:
+        return self.path + ".offsets.npy"
+
+    def _load_ranges(self) -> np.ndarray:
+        try:
+            sidecar = np.load(self._offsets_path, mmap_mode="r")
+            if tuple(int(v) for v in sidecar[0]) == self._stamp:
+                return sidecar[1:]
+        except (OSError, ValueError, IndexError):
+            pass
+        ranges = self._scan()
+        sidecar = np.vstack([np.array([self._stamp], dtype="int64"), ranges])
+        try:
+            tmp_path = self._offsets_path + ".tmp.npy"
+            np.save(tmp_path, sidecar)
+            os.replace(tmp_path, self._offsets_path)
+        except OSError as e:
+            logger.warning(f"Could not write offsets index for {self.path}: {e}")
+        return ranges
+
+    def _scan(self) -> np.ndarray:
+        """Finds the [start, end) byte range of every non-empty line."""
+        logger.info(f"Building offsets index for {self.path}...")
+        data = np.frombuffer(self._mmap, dtype=np.uint8) if len(self._mmap) else np.zeros(0, dtype=np.uint8)
+        newlines = np.flatnonzero(data == ord("\n"))
+        starts = np.concatenate([[0], newlines + 1])
+        ends = np.concatenate([newlines, [len(data)]])
+        ranges = np.stack([starts, ends], axis=1).astype("int64")
+        ranges = ranges[ranges[:, 1] > ranges[:, 0]]
+        # Drop whitespace-only lines such as a stray "\r"; a record is at least "{}".
+        short = np.flatnonzero(ranges[:, 1] - ranges[:, 0] < 3)
+        blank = [i for i in short if not bytes(self._mmap[ranges[i, 0]:ranges[i, 1]]).strip()]
+        return np.delete(ranges, blank, axis=0)
+
+    def __len__(self) -> int:
+        return len(self._ranges)
+
+    def __getitem__(self, idx: int) -> Dict:
+        start, end = self._ranges[idx]
+        return json.loads(self._mmap[int(start):int(end)])
+
+    def get_many(self, indices: Sequence[int]) -> List[Dict]:
+        """Returns the records at the given row positions, in order."""
+        return [self[int(idx)] for idx in indices]
+
+    def ids(self) -> np.ndarray:
+        """The id of every record, in file order; for JSONL files, the row."""
+        return np.arange(len(self), dtype=np.int64)
+
+    def close(self):
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._file.close()
+
+
+class ListMetadataStore:
+    """
+    The metadata store for `metadata.json` files written by `Indexer`.
+
+    These hold one JSON array, so they are loaded whole. Records that carry
+    a `faiss_id` are looked up by that id rather than by row position.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "r") as f:
+            self._records = json.load(f)
+        self._by_id = None
+        if self._records and "faiss_id" in self._records[0]:
+            self._by_id = {record["faiss_id"]: record for record in self._records}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __getitem__(self, idx: int) -> Dict:
+        if self._by_id is not None:
+            return self._by_id[int(idx)]
+        return self._records[int(idx)]
+
+    def get_many(self, indices: Sequence[int]) -> List[Dict]:
+        return [self[int(idx)] for idx in indices]
+
+    def ids(self) -> np.ndarray:
+        """The id of every record, in file order: its `faiss_id`, or its row."""
+        if self._by_id is not None:
+            return np.array([record["faiss_id"] for record in self._records], dtype=np.int64)
+        return np.arange(len(self), dtype=np.int64)
+
+    def close(self):
+        pass
+
+
+def open_metadata_store(path: str):
+    """Opens the right metadata store for a binary corpus, a `.json` array or a JSONL file."""
+    if path.endswith(CORPUS_EXTENSION):
+        return CorpusStore(path)
+    if path.endswith(".json"):
+        return ListMetadataStore(path)
+    return JsonlMetadataStore(path)
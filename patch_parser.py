@@ -1,23 +1,226 @@
 import re
 import logging
-from typing import Dict, List, TypedDict
+from typing import Dict, List, Tuple, TypedDict
+from patch_validation import Issue, PatchValidator
+from unified_diff import FileDiff, UnifiedDiffParser
 
 logging.basicConfig(level=logging.INFO)
 
 class Patch(TypedDict):
     file_path: str
     diff: str
+    file_diff: FileDiff
 
 class UnitTest(TypedDict):
     file_path: str
     code: str
 
-def parse_llm_output(text: str) -> Dict[str, List[Patch] | List[UnitTest]]:
+_DEFAULT_VALIDATOR = PatchValidator()
+_PATH_HEADER = re.compile(r"(?:--- a/|\+\+\+ b/)(\S+)")
+_PATH_MARKER = re.compile(r"(?:#|File:|Path:)\s*([\w/\\-]+\.py)")
+_TEST_FUNC = re.compile(r"def (test_[A-Za-z0-9_]+)")
+_INLINE_TEST = re.compile(r"^def (test_[A-Za-z0-9_]+)\(")
+
+
+class StreamingPatchParser:
+    """
+    Incrementally parses an LLM response as it streams in.
+
+    Text is fed in arbitrary chunks. The parser works line by line and emits
+    each diff or unit test as soon as its block is complete: a file's diff
+    when its last hunk has all the lines its `@@` header announces, a fenced
+    test when its closing fence arrives, and an inline test at the next blank
+    line. Diffs are parsed by `UnifiedDiffParser`, in both the
+    `diff --git` and the bare `--- a/` form, and anywhere but inside a
+    Python fence, and each file's diff is checked by a `PatchValidator`
+    before it is emitted. The file path of a test block is the most recent
+    diff header or file marker seen before it.
+
+    Example:
+        parser = StreamingPatchParser()
+        for chunk in llm_agent.generate_patch_stream(prompt):
+            for kind, item in parser.feed(chunk):
+                ...
+        for kind, item in parser.close():
+            ...
+    """
+    def __init__(self, repo_path: str = None, validator: PatchValidator = None):
+        """
+        Initializes the StreamingPatchParser.
+
+        Args:
+            repo_path: An optional repository checkout. Patches to files found
+                there are applied in memory and validated as whole files.
+            validator: The validator for patches; a shared default if None.
+        """
+        self.repo_path = repo_path
+        self.validator = validator or _DEFAULT_VALIDATOR
+        self.rejected: List[Tuple[FileDiff, List[Issue]]] = []
+        self.warnings: List[Tuple[FileDiff, List[Issue]]] = []
+        self.patches: List[Patch] = []
+        self.unit_tests: List[UnitTest] = []
+        # Pieces of the current partial line, joined once its newline arrives.
+        self._pending: List[str] = []
+        self._mode = "text"
+        self._block: List[str] = []
+        self._block_path: str | None = None
+        self._fence_lang = ""
+        self._last_path: str | None = None
+        self._processed_tests = set()
+        self._diff = UnifiedDiffParser()
+
+    def feed(self, chunk: str) -> List[Tuple[str, Patch | UnitTest]]:
+        """
+        Consumes the next chunk of the response.
+
+        Returns:
+            The ("patch", Patch) and ("unit_test", UnitTest) items completed
+            by this chunk, in order.
+        """
+        if "\n" not in chunk:
+            if chunk:
+                self._pending.append(chunk)
+            return []
+        *lines, tail = chunk.split("\n")
+        if self._pending:
+            self._pending.append(lines[0])
+            lines[0] = "".join(self._pending)
+        self._pending = [tail] if tail else []
+        events = []
+        for line in lines:
+            self._process_line(line, events)
+        return events
+
+    def close(self) -> List[Tuple[str, Patch | UnitTest]]:
+        """Flushes the final partial line and any open block at the end of the stream."""
+        events = []
+        if self._pending:
+            self._process_line("".join(self._pending), events)
+            self._pending = []
+        self._diff.close()
+        self._emit_patches(events)
+        self._flush(events)
+        return events
+
+    def result(self) -> Dict[str, List[Patch] | List[UnitTest]]:
+        """Returns everything parsed so far, in the shape of `parse_llm_output`."""
+        return {"patches": list(self.patches), "unit_tests": list(self.unit_tests)}
+
+    def _process_line(self, line: str, events: List):
+        if self._diff.active:
+            consumed = self._diff.feed(line)
+            self._emit_patches(events)
+            if consumed:
+                self._track_diff_path()
+                return
+            # The diff has ended; the line belongs to the surrounding text.
+
+        if self._mode == "fence":
+            if line.startswith("```"):
+                self._flush(events)
+            elif self._fence_lang != "python" and self._feed_diff(line):
+                return
+            else:
+                self._track_path(line)
+                self._block.append(line)
+            return
+        elif self._mode == "inline_test":
+            if line.strip():
+                self._block.append(line)
+                return
+            self._flush(events)
+            return
+
+        if self._feed_diff(line):
+            return
+        if line.startswith("```"):
+            self._fence_lang = line[3:].strip()
+            self._start("fence")
+        elif _INLINE_TEST.match(line):
+            self._start("inline_test", line)
+        else:
+            self._track_path(line)
+
+    def _feed_diff(self, line: str) -> bool:
+        if not self._diff.feed(line):
+            return False
+        self._track_diff_path()
+        return True
+
+    def _track_diff_path(self):
+        current = self._diff.current
+        if current is not None and current.path:
+            self._last_path = current.path
+
+    def _emit_patches(self, events: List):
+        files, self._diff.files = self._diff.files, []
+        for file_diff in files:
+            file_path = file_diff.path
+            if file_diff.errors:
+                logging.warning(f"Invalid diff for file {file_path}: {' '.join(file_diff.errors)} Skipping.")
+                continue
+            issues = self.validator.validate_patch(file_diff, self.repo_path)
+            errors = [issue for issue in issues if issue.severity == "error"]
+            if errors:
+                self.rejected.append((file_diff, errors))
+                details = "; ".join(f"line {issue.line}: {issue.message}" for issue in errors)
+                logging.warning(f"Invalid patch detected for file {file_path} ({details}). Skipping.")
+                continue
+            if issues:
+                self.warnings.append((file_diff, issues))
+                details = "; ".join(f"line {issue.line}: {issue.message}" for issue in issues)
+                logging.warning(f"Possible problems in patch for file {file_path} ({details}).")
+            patch: Patch = {"file_path": file_path, "diff": file_diff.text, "file_diff": file_diff}
+            self.patches.append(patch)
+            events.append(("patch", patch))
+            logging.info(f"Found and validated patch for file: {file_path}")
+
+    def _track_path(self, line: str):
+        header = _PATH_HEADER.match(line)
+        if header:
+            self._last_path = header.group(1)
+            return
+        marker = _PATH_MARKER.search(line)
+        if marker:
+            self._last_path = marker.group(1).replace("\\", "/").strip()
+
+    def _start(self, mode: str, first_line: str = None):
+        self._mode = mode
+        self._block = [first_line] if first_line is not None else []
+        self._block_path = self._last_path
+
+    def _flush(self, events: List):
+        mode, block = self._mode, self._block
+        self._mode, self._block = "text", []
+        if mode == "fence" and self._fence_lang == "python":
+            self._emit_test("\n".join(block), events)
+        elif mode == "inline_test":
+            self._emit_test("\n".join(block), events)
+
+    def _emit_test(self, code: str, events: List):
+        test_funcs = _TEST_FUNC.findall(code)
+        if not test_funcs or all(func in self._processed_tests for func in test_funcs):
+            return
+        self._processed_tests.update(test_funcs)
+        if self._block_path is None:
+            logging.warning("Could not determine file path for a test block.")
+        unit_test: UnitTest = {"file_path": self._block_path, "code": code}
+        self.unit_tests.append(unit_test)
+        events.append(("unit_test", unit_test))
+        logging.info(f"Found unit test for file: {self._block_path}")
+
+
+def parse_llm_output(text: str, repo_path: str = None) -> Dict[str, List[Patch] | List[UnitTest]]:
     """
     Parses an LLM-generated response to extract code patches and unit tests.
 
+    The text is scanned once, line by line, by a `StreamingPatchParser`, so
+    the cost is linear in the length of the response.
+
     Args:
         text: The LLM-generated text.
+        repo_path: An optional repository checkout used to validate patches
+            against the files they modify.
 
     Returns:
         A dictionary with two keys:
@@ -26,106 +229,14 @@ def parse_llm_output(text: str) -> Dict[str, List[Patch] | List[UnitTest]]:
         - "unit_tests": A list of dictionaries, where each dictionary
           represents a unit test and contains the "file_path" and "code".
     """
-    patches = _extract_patches(text)
-    unit_tests = _extract_unit_tests(text)
+    parser = StreamingPatchParser(repo_path=repo_path)
+    parser.feed(text)
+    parser.close()
+    result = parser.result()
 
-    if not patches:
+    if not result["patches"]:
         logging.info("No patches found in the response.")
-    if not unit_tests:
+    if not result["unit_tests"]:
         logging.info("No unit tests found in the response.")
 
-    return {"patches": patches, "unit_tests": unit_tests}
-
-def _validate_patch(diff_text: str) -> bool:
-    """
-    Validates the patch to prevent basic TypeErrors.
-    This is a simplified check. A more robust solution might involve a static analysis tool.
-    """
-    # Avoid adding a string and an integer
-    if re.search(r"\+\s*.*(\w+\s*\+\s*['\"].*['\"])", diff_text) or re.search(r"\+\s*.*(['\"].*['\"]\s*\+\s*\w+)", diff_text):
-        # Check if it's a string concatenation
-        if not re.search(r"\+\s*.*(['\"].*['\"]\s*\+\s*['\"].*['\"])", diff_text):
-             logging.warning(f"Potential TypeError detected in patch:\n{diff_text}")
-             return False
-    return True
-
-def _extract_patches(text: str) -> List[Patch]:
-    """Extracts unified diff patches from the text."""
-    # Regex to find unified diff blocks
-    diff_pattern = re.compile(
-        r"diff --git a/(.+) b/(.+)\n--- a/.*\n\+\+\+ b/.*\n@@ .* @@\n([\s\S]*?)(?=\ndiff --git|\Z)",
-        re.MULTILINE,
-    )
-    patches = []
-    for match in diff_pattern.finditer(text):
-        file_path = match.group(1)
-        # Reconstruct the full diff text
-        diff_text = f"diff --git a/{file_path} b/{match.group(2)}\n--- a/{file_path}\n+++ b/{match.group(2)}\n@@ {match.group(3)}"
-        if _validate_patch(diff_text):
-            patches.append({"file_path": file_path, "diff": diff_text})
-            logging.info(f"Found and validated patch for file: {file_path}")
-        else:
-            logging.warning(f"Invalid patch detected for file {file_path}. Skipping.")
-            
-    return patches
-
-
-def _extract_file_path(text: str, match_start: int) -> str | None:
-    """Extracts the file path for a given match."""
-    preceding_text = text[:match_start]
-    
-    # 1. Look for diff headers
-    diff_header_match = re.findall(r"diff --git a/(\S+) b/\S+", preceding_text)
-    if diff_header_match:
-        return diff_header_match[-1]
-
-    # 2. Look for --- a/ or +++ b/
-    plus_minus_header_match = re.findall(r"--- a/(\S+)", preceding_text)
-    if plus_minus_header_match:
-        return plus_minus_header_match[-1]
-    
-    plus_header_match = re.findall(r"\+\+\+ b/(\S+)", preceding_text)
-    if plus_header_match:
-        return plus_header_match[-1]
-
-    # 3. Fallback to comment lines or markers
-    marker_match = re.findall(r"(?:#|File:|Path:)\s*([\w/\\-]+\.py)", preceding_text)
-    if marker_match:
-        path = marker_match[-1]
-        return path.replace("\\", "/").strip()
-
-    logging.warning("Could not determine file path for a test block.")
-    return None
-
-
-def _extract_unit_tests(text: str) -> List[UnitTest]:
-    """Extracts Python unit tests from the text."""
-    unit_tests: List[UnitTest] = []
-    processed_tests = set()
-
-    # Extract from Python code fences
-    fenced_code_pattern = re.compile(r"```python\n(.*?)\n```", re.DOTALL)
-    for match in fenced_code_pattern.finditer(text):
-        code_block = match.group(1)
-        test_funcs = re.findall(r"def (test_[A-Za-z0-9_]+)", code_block)
-        if test_funcs:
-            file_path = _extract_file_path(text, match.start())
-            for func in test_funcs:
-                if func not in processed_tests:
-                    unit_tests.append({"file_path": file_path, "code": code_block})
-                    processed_tests.add(func)
-                    logging.info(f"Found fended unit test for file: {file_path}")
-                    break
-
-    # Extract inline test definitions
-    inline_test_pattern = re.compile(r"^(def (test_[A-Za-z0-9_]+)\(.*?\):.*?)(?=\n\n|\Z)", re.DOTALL | re.MULTILINE)
-    for match in inline_test_pattern.finditer(text):
-        test_code = match.group(1)
-        test_func = match.group(2)
-        if test_func not in processed_tests:
-            file_path = _extract_file_path(text, match.start())
-            unit_tests.append({"file_path": file_path, "code": test_code})
-            processed_tests.add(test_func)
-            logging.info(f"Found inline unit test for file: {file_path}")
-
-    return unit_tests
\ No newline at end of file
+    return result
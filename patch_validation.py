@@ -0,0 +1,382 @@
+import ast
+import bisect
+import builtins
+import hashlib
+import os
+import textwrap
+import threading
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Sequence
+from unified_diff import FileDiff, PatchApplyError, confine_path
+
+
+_BUILTIN_NAMES = frozenset(dir(builtins)) | {"__file__", "__builtins__", "__annotations__", "__path__"}
+_STR_CALLS = frozenset({"str", "repr", "chr", "format", "ascii", "hex", "oct", "bin"})
+_NUMBER_CALLS = frozenset({"int", "float", "len", "ord", "abs", "round", "sum", "hash", "id"})
+_STR_METHODS = frozenset({
+    "capitalize", "casefold", "center", "format", "join", "ljust", "lower", "lstrip", "replace",
+    "rjust", "rstrip", "strip", "swapcase", "title", "upper", "zfill",
+})
+
+
+@dataclass
+class Issue:
+    """
+    A problem found in a patch. Only "error" issues reject it; a "warning"
+    is a likely problem that could not be confirmed.
+    """
+    check: str
+    message: str
+    path: Optional[str] = None
+    line: Optional[int] = None
+    severity: str = "error"
+
+
+@dataclass
+class ParsedSource:
+    """
+    A parsed Python source.
+
+    `full_file` is False when only a hunk fragment could be parsed; checks
+    that need the whole module (such as name resolution) skip fragments.
+    """
+    tree: Optional[ast.AST]
+    error: Optional[SyntaxError] = None
+    full_file: bool = True
+    _bound_names: Optional[frozenset] = field(default=None, repr=False)
+    _star_import: bool = field(default=False, repr=False)
+    _kinds: Optional[Dict[str, str]] = field(default=None, repr=False)
+
+    def bound_names(self) -> frozenset:
+        """Every name bound anywhere in the module (computed once per source)."""
+        if self._bound_names is None:
+            names = set()
+            for node in ast.walk(self.tree):
+                if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+                    names.add(node.id)
+                elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    names.add(node.name)
+                elif isinstance(node, ast.arg):
+                    names.add(node.arg)
+                elif isinstance(node, (ast.Import, ast.ImportFrom)):
+                    for alias in node.names:
+                        if alias.name == "*":
+                            self._star_import = True
+                        names.add(alias.asname or alias.name.split(".")[0])
+                elif isinstance(node, (ast.Global, ast.Nonlocal)):
+                    names.update(node.names)
+                elif isinstance(node, ast.ExceptHandler) and node.name:
+                    names.add(node.name)
+                elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+                    names.add(node.name)
+                elif isinstance(node, ast.MatchMapping) and node.rest:
+                    names.add(node.rest)
+            self._bound_names = frozenset(names)
+        return self._bound_names
+
+    def has_star_import(self) -> bool:
+        self.bound_names()
+        return self._star_import
+
+    def name_kinds(self) -> Dict[str, str]:
+        """
+        Names that are only ever bound to str or only to numbers.
+
+        This is a flow-insensitive approximation from literal assignments and
+        annotations; names bound to both kinds, or to anything else, are left
+        out so they are never flagged.
+        """
+        if self._kinds is None:
+            seen: Dict[str, set] = {}
+            for node in ast.walk(self.tree):
+                if isinstance(node, ast.Assign):
+                    kind = _expression_kind(node.value, {})
+                    for target in node.targets:
+                        if isinstance(target, ast.Name):
+                            seen.setdefault(target.id, set()).add(kind)
+                elif isinstance(node, (ast.AnnAssign, ast.arg)):
+                    target = node.target if isinstance(node, ast.AnnAssign) else node
+                    name = target.id if isinstance(target, ast.Name) else getattr(target, "arg", None)
+                    if name is not None:
+                        seen.setdefault(name, set()).add(_annotation_kind(node.annotation))
+                elif isinstance(node, (ast.For, ast.comprehension)) and isinstance(node.target, ast.Name):
+                    seen.setdefault(node.target.id, set()).add(None)
+            self._kinds = {name: next(iter(kinds)) for name, kinds in seen.items() if len(kinds) == 1 and None not in kinds}
+        return self._kinds
+
+
+def _is_str_literal(node: ast.AST) -> bool:
+    return isinstance(node, ast.JoinedStr) or (isinstance(node, ast.Constant) and isinstance(node.value, str))
+
+
+def _annotation_kind(annotation: Optional[ast.AST]) -> Optional[str]:
+    if isinstance(annotation, ast.Name):
+        if annotation.id == "str":
+            return "str"
+        if annotation.id in ("int", "float"):
+            return "number"
+    return None
+
+
+def _expression_kind(node: ast.AST, kinds: Dict[str, str]) -> Optional[str]:
+    """Returns "str", "number" or None (unknown) for an expression."""
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, str):
+            return "str"
+        if isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            return "number"
+        return None
+    if isinstance(node, ast.JoinedStr):
+        return "str"
+    if isinstance(node, ast.Name):
+        return kinds.get(node.id)
+    if isinstance(node, ast.Call):
+        if isinstance(node.func, ast.Name):
+            if node.func.id in _STR_CALLS:
+                return "str"
+            if node.func.id in _NUMBER_CALLS:
+                return "number"
+        if isinstance(node.func, ast.Attribute) and node.func.attr in _STR_METHODS:
+            if _expression_kind(node.func.value, kinds) == "str":
+                return "str"
+        return None
+    if isinstance(node, ast.BinOp):
+        left = _expression_kind(node.left, kinds)
+        if isinstance(node.op, ast.Mod) and left == "str":
+            return "str"
+        right = _expression_kind(node.right, kinds)
+        return left if left == right else None
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        return _expression_kind(node.operand, kinds)
+    return None
+
+
+def iter_changed_nodes(tree: ast.AST, changed_lines: Sequence[int]) -> Iterator[ast.AST]:
+    """
+    Yields the nodes whose line range overlaps a changed line.
+
+    Subtrees that lie entirely outside the changed lines are pruned, so the
+    walk is proportional to the patch rather than to the file.
+    """
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        for child in ast.iter_child_nodes(node):
+            start = getattr(child, "lineno", None)
+            if start is None:
+                stack.append(child)
+                continue
+            end = getattr(child, "end_lineno", None) or start
+            i = bisect.bisect_left(changed_lines, start)
+            if i < len(changed_lines) and changed_lines[i] <= end:
+                yield child
+                stack.append(child)
+
+
+class Check:
+    """
+    A validation check run on the changed lines of a parsed file.
+
+    Subclasses set `name` and implement `run`. Checks with
+    `requires_full_file` are skipped when only a hunk fragment was parsed.
+    """
+    name = "check"
+    requires_full_file = False
+
+    def run(self, source: ParsedSource, changed_lines: Sequence[int]) -> List[Issue]:
+        raise NotImplementedError
+
+
+class SyntaxCheck(Check):
+    """Reports a syntax error in the patched file."""
+    name = "syntax"
+    requires_full_file = True
+
+    def run(self, source: ParsedSource, changed_lines: Sequence[int]) -> List[Issue]:
+        if source.error is None:
+            return []
+        return [Issue(self.name, f"Syntax error: {source.error.msg}", line=source.error.lineno)]
+
+
+class UndefinedNameCheck(Check):
+    """Reports names read on changed lines that are bound nowhere in the module."""
+    name = "undefined_name"
+    requires_full_file = True
+
+    def run(self, source: ParsedSource, changed_lines: Sequence[int]) -> List[Issue]:
+        if source.tree is None or source.has_star_import():
+            return []
+        bound = source.bound_names()
+        issues = []
+        for node in iter_changed_nodes(source.tree, changed_lines):
+            if (
+                isinstance(node, ast.Name)
+                and isinstance(node.ctx, ast.Load)
+                and node.id not in bound
+                and node.id not in _BUILTIN_NAMES
+            ):
+                issues.append(Issue(self.name, f"Undefined name '{node.id}'", line=node.lineno))
+        return issues
+
+
+class StrIntConcatCheck(Check):
+    """
+    Reports `+` and `+=` between a string and a number on changed lines.
+
+    A name whose kind cannot be inferred, added to a string literal, is
+    reported as a warning.
+    """
+    name = "str_int_concat"
+
+    def run(self, source: ParsedSource, changed_lines: Sequence[int]) -> List[Issue]:
+        if source.tree is None:
+            return []
+        kinds = source.name_kinds()
+        issues = []
+        for node in iter_changed_nodes(source.tree, changed_lines):
+            if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+                left, right = node.left, node.right
+            elif isinstance(node, ast.AugAssign) and isinstance(node.op, ast.Add):
+                left, right = node.target, node.value
+            else:
+                continue
+            pair = {_expression_kind(left, kinds), _expression_kind(right, kinds)}
+            if pair == {"str", "number"}:
+                issues.append(Issue(self.name, "Potential TypeError: str and number concatenated with '+'", line=node.lineno))
+                continue
+            for name, other in ((left, right), (right, left)):
+                if isinstance(name, ast.Name) and name.id not in kinds and _is_str_literal(other):
+                    issues.append(Issue(
+                        self.name,
+                        f"Possible TypeError: '{name.id}' of unknown type concatenated with a string literal",
+                        line=node.lineno,
+                        severity="warning",
+                    ))
+                    break
+        return issues
+
+
+DEFAULT_CHECKS = (SyntaxCheck(), UndefinedNameCheck(), StrIntConcatCheck())
+
+
+class PatchValidator:
+    """
+    Validates Python patches with `ast` instead of regular expressions.
+
+    When the original file is available, the diff is applied in memory and
+    the patched file is parsed; otherwise each hunk's new-side lines are
+    parsed as a fragment. Parse results are cached by content hash, so
+    validating several patches against the same file parses it once. The
+    checks only visit nodes on the changed lines.
+    """
+    def __init__(self, checks: Sequence[Check] = DEFAULT_CHECKS, cache_size: int = 256):
+        """
+        Initializes the PatchValidator.
+
+        Args:
+            checks: The checks to run.
+            cache_size: The number of parsed sources kept.
+        """
+        self.checks = list(checks)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, ParsedSource]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def parse(self, source: str, full_file: bool = True) -> ParsedSource:
+        """Parses `source`, returning the cached result for content seen before."""
+        key = hashlib.sha256(f"{int(full_file)}:{source}".encode("utf-8")).hexdigest()
+        with self._lock:
+            parsed = self._cache.get(key)
+            if parsed is not None:
+                self._cache.move_to_end(key)
+                return parsed
+        try:
+            parsed = ParsedSource(ast.parse(source), full_file=full_file)
+        except SyntaxError as e:
+            parsed = ParsedSource(None, error=e, full_file=full_file)
+        with self._lock:
+            self._cache[key] = parsed
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return parsed
+
+    def _run_checks(self, source: ParsedSource, changed_lines: Sequence[int], path: str, line_offset: int = 0) -> List[Issue]:
+        issues = []
+        for check in self.checks:
+            if check.requires_full_file and not source.full_file:
+                continue
+            for issue in check.run(source, changed_lines):
+                issue.path = path
+                if issue.line is not None:
+                    issue.line += line_offset
+                issues.append(issue)
+        return issues
+
+    def validate(self, file_diff: FileDiff, original: Optional[str] = None) -> List[Issue]:
+        """
+        Validates one file's diff.
+
+        Args:
+            file_diff: The parsed diff.
+            original: The file's current contents, if known. New files are
+                validated as full files even without it.
+
+        Returns:
+            The issues found; a patch without "error" issues looks valid.
+            Non-Python files and deletions are not checked.
+        """
+        path = file_diff.path
+        if not path or not path.endswith(".py") or file_diff.is_deleted_file:
+            return []
+        if original is not None or file_diff.is_new_file:
+            try:
+                patched, added = file_diff.apply_with_changes(original or "")
+            except PatchApplyError as e:
+                return [Issue("apply", str(e), path=path)]
+            return self._run_checks(self.parse(patched), added, path)
+        issues = []
+        for hunk in file_diff.hunks:
+            issues.extend(self._validate_fragment(hunk.lines, path, hunk.new_start))
+        return issues
+
+    def _validate_fragment(self, lines, path: str, new_start: int) -> List[Issue]:
+        new_side = [(kind, text) for kind, text in lines if kind != "-"]
+        added = [i for i, (kind, _) in enumerate(new_side, 1) if kind == "+"]
+        if not added:
+            return []
+        fragment = textwrap.dedent("\n".join(text for _, text in new_side))
+        source = self.parse(fragment, full_file=False)
+        if source.tree is not None:
+            return self._run_checks(source, added, path, line_offset=new_start - 1)
+        # The hunk starts or ends mid-block; check the added lines one by one.
+        issues = []
+        for i in added:
+            text = new_side[i - 1][1].strip()
+            if text.endswith(":"):
+                text += " pass"
+            line_source = self.parse(text, full_file=False)
+            if line_source.tree is not None:
+                issues.extend(self._run_checks(line_source, [1], path, line_offset=new_start + i - 2))
+        return issues
+
+    def validate_patch(self, file_diff: FileDiff, repo_path: str = None) -> List[Issue]:
+        """
+        Validates a diff, reading the original file from `repo_path` when it
+        exists. A diff whose paths leave `repo_path` is rejected unread.
+        """
+        original = None
+        if repo_path:
+            try:
+                for path in (file_diff.old_path, file_diff.new_path):
+                    if path is not None:
+                        confine_path(repo_path, path)
+            except PatchApplyError as e:
+                return [Issue("path", str(e), path=file_diff.path)]
+        if repo_path and file_diff.old_path:
+            file_path = confine_path(repo_path, file_diff.old_path)
+            if os.path.isfile(file_path):
+                with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+                    original = f.read()
+        return self.validate(file_diff, original)
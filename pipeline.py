@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+
+from best_of_n import BestOfNGenerator
+from context_packer import ContextPacker
+from error_fingerprint import fingerprint, normalize_text
+from llm_agent import LLMAgent
+from patch_parser import parse_llm_output
+from retriever import Retriever
+from typing import Dict, List, Tuple
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def build_prompt(error_snippet: str, retrieved_docs: List[Dict]) -> str:
+    """Combines the user's error with the retrieved documents into the LLM context."""
+    context_str = "\n".join([doc['content'] for doc in retrieved_docs])
+    return f"Error and Code:\n{error_snippet}\n\nRetrieved Context:\n{context_str}"
+
+
+class DebugPipeline:
+    """
+    An asyncio-native retrieve -> generate_patch -> parse_llm_output pipeline.
+
+    Every network call is awaited rather than run in a thread. A semaphore
+    bounds how many requests are in flight, and each request has its own
+    timeout. One process can therefore serve many concurrent debug requests.
+    Concurrent requests for the same error (after `normalize_text`, so
+    differing paths, line numbers and addresses do not matter) and the same
+    repo_path share one run.
+    """
+    def __init__(
+        self,
+        retriever: Retriever,
+        llm_agent: LLMAgent,
+        top_k: int = 5,
+        max_concurrency: int = 16,
+        timeout: float = 120.0,
+        best_of_n: BestOfNGenerator = None,
+        context_packer: ContextPacker = None,
+    ):
+        """
+        Initializes the DebugPipeline.
+
+        Args:
+            retriever: The retriever used to find relevant documents.
+            llm_agent: The agent that generates the patch.
+            top_k: The number of documents to retrieve per request.
+            max_concurrency: The maximum number of requests processed at once.
+                Further requests wait for a free slot.
+            timeout: The per-request timeout in seconds, including the time
+                spent waiting for a slot.
+            best_of_n: An optional generator that samples several candidates
+                per request; the best one is returned.
+            context_packer: An optional packer that fits the most relevant
+                passages of the retrieved documents into a token budget.
+                Without one, every document is included in full.
+        """
+        self.retriever = retriever
+        self.llm_agent = llm_agent
+        self.top_k = top_k
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.best_of_n = best_of_n
+        self.context_packer = context_packer
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    async def _run(self, error_snippet: str, repo_path: str = None) -> Dict:
+        async with self._semaphore:
+            start_time = time.time()
+            retrieved_docs = await self.retriever.retrieve_async(error_snippet, top_k=self.top_k)
+            context_docs = retrieved_docs
+            if self.context_packer is not None:
+                context_docs = await self.context_packer.pack_async(error_snippet, retrieved_docs)
+            prompt = build_prompt(error_snippet, context_docs)
+            candidates = None
+            if self.best_of_n is not None:
+                candidates = await self.best_of_n.generate(prompt, file_path=repo_path, repo_path=repo_path)
+            if candidates:
+                llm_response = candidates[0].response
+                parsed_output = candidates[0].parsed_output
+            else:
+                llm_response = await self.llm_agent.generate_patch_async(prompt, file_path=repo_path)
+                parsed_output = parse_llm_output(llm_response, repo_path=repo_path)
+            latency = time.time() - start_time
+        logger.info(f"Debug pipeline latency: {latency:.4f} seconds")
+        result = {
+            "fingerprint": fingerprint(error_snippet),
+            "retrieved_docs": retrieved_docs,
+            "llm_response": llm_response,
+            "parsed_output": parsed_output,
+            "latency": latency,
+        }
+        if candidates is not None:
+            result["candidates"] = candidates
+        return result
+
+    async def run(self, error_snippet: str, repo_path: str = None) -> Dict:
+        """
+        Runs one debug request.
+
+        Args:
+            error_snippet: The pasted error message and code.
+            repo_path: An optional path passed on to the LLM prompt and used
+                to validate patches against the files they modify.
+
+        Returns:
+            A dictionary with the error's "fingerprint" (see
+            `error_fingerprint.fingerprint`), the "retrieved_docs", the raw
+            "llm_response", the "parsed_output" of `parse_llm_output` and the
+            "latency". With
+            `best_of_n`, the response is the best candidate's and the ranked
+            "candidates" are included too.
+
+        Raises:
+            asyncio.TimeoutError: If the request takes longer than `timeout`.
+        """
+        key = (normalize_text(error_snippet), repo_path)
+        shared = self._in_flight.get(key)
+        if shared is None:
+            shared = asyncio.ensure_future(asyncio.wait_for(self._run(error_snippet, repo_path), timeout=self.timeout))
+            self._in_flight[key] = shared
+            shared.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            logger.info("Joining an in-flight request for the same error.")
+        # Shielded, so a caller that gives up does not cancel the run for the others.
+        return dict(await asyncio.shield(shared))
+
+    async def run_many(self, error_snippets: List[str], repo_path: str = None) -> List:
+        """
+        Runs many debug requests concurrently.
+
+        Returns:
+            One entry per snippet, in order: the result dictionary, or the
+            exception (e.g. `asyncio.TimeoutError`) that request raised.
+        """
+        return await asyncio.gather(
+            *(self.run(snippet, repo_path) for snippet in error_snippets),
+            return_exceptions=True,
+        )
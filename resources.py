@@ -0,0 +1,127 @@
+import logging
+import os
+import threading
+
+from bm25 import BM25_FILE
+from chunker import CHUNKS_FILE
+from embedder import BatchEmbedder
+from embedding_cache import EmbeddingCache
+from exact_match import EXACT_MATCH_FILE
+from llm_agent import LLMAgent
+from metadata_store import saved_metadata_path
+from response_cache import ResponseCache
+from retriever import Retriever
+from typing import Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = None
+        self.stamp: Optional[Tuple] = None
+
+
+class ResourceRegistry:
+    """
+    A process-wide registry of long-lived, thread-safe components.
+
+    Each resource is built once and shared by every session. Resources that
+    are backed by files are rebuilt only when one of those files changes
+    (its mtime, or the file a symlinked path resolves to), so a re-indexed
+    corpus is picked up without restarting the app. A replaced resource is
+    closed if it has a `close` method.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[Hashable, _Entry] = {}
+
+    @staticmethod
+    def _stamp(path: str, optional: bool = False) -> Optional[Tuple[str, float]]:
+        try:
+            return os.path.realpath(path), os.path.getmtime(path)
+        except FileNotFoundError:
+            if optional:
+                return None
+            raise
+
+    def get(self, key: Hashable, factory: Callable[[], object], paths: Sequence[str] = (), optional_paths: Sequence[str] = ()):
+        """
+        Returns the resource stored under `key`, building it if needed.
+
+        Args:
+            key: A hashable key identifying the resource.
+            factory: A callable that builds the resource.
+            paths: Files the resource is loaded from. The resource is rebuilt
+                when any of them changes.
+            optional_paths: Files the resource also loads if they exist. The
+                resource is rebuilt when one changes, appears or disappears.
+
+        Returns:
+            The shared resource.
+        """
+        with self._lock:
+            entry = self._entries.setdefault(key, _Entry())
+        # Raises FileNotFoundError if the index has not been built yet.
+        stamp = tuple(self._stamp(path) for path in paths) + tuple(self._stamp(path, optional=True) for path in optional_paths)
+        # Building happens under the per-entry lock so that concurrent
+        # sessions wait for a single load instead of loading in parallel.
+        with entry.lock:
+            if entry.value is None or entry.stamp != stamp:
+                old = entry.value
+                entry.value = factory()
+                entry.stamp = stamp
+                if old is not None:
+                    logger.info(f"Reloaded {key} because its files changed.")
+                    if hasattr(old, "close"):
+                        old.close()
+            return entry.value
+
+    def get_embedder(self, embedding_cache_path: str = None) -> BatchEmbedder:
+        """Returns the shared BatchEmbedder, backed by one EmbeddingCache per path."""
+        def factory():
+            cache = EmbeddingCache(embedding_cache_path) if embedding_cache_path else None
+            return BatchEmbedder(cache=cache)
+        return self.get(("embedder", embedding_cache_path), factory)
+
+    def get_retriever(self, index_path: str, metadata_path: str = None, google_api_key: str = None, embedding_cache_path: str = None) -> Retriever:
+        """
+        Returns the shared Retriever for an index and metadata file; without
+        `metadata_path`, the metadata saved with the index.
+        """
+        def factory():
+            return Retriever(
+                index_path=index_path,
+                metadata_path=metadata_path,
+                google_api_key=google_api_key,
+                embedder=self.get_embedder(embedding_cache_path),
+            )
+        directory = os.path.dirname(index_path)
+        sidecars = [os.path.join(directory, name) for name in (CHUNKS_FILE, BM25_FILE, EXACT_MATCH_FILE)]
+        paths = (index_path, metadata_path or saved_metadata_path(directory))
+        return self.get(("retriever", index_path, metadata_path), factory, paths=paths, optional_paths=sidecars)
+
+    def get_llm_agent(self, api_key: str = None, response_cache_path: str = None, embedding_cache_path: str = None) -> LLMAgent:
+        """Returns the shared LLMAgent, with a ResponseCache if a path is given."""
+        def factory():
+            response_cache = None
+            if response_cache_path:
+                response_cache = ResponseCache(response_cache_path, embedder=self.get_embedder(embedding_cache_path))
+            return LLMAgent(api_key=api_key, response_cache=response_cache)
+        return self.get(("llm_agent", api_key, response_cache_path), factory)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ResourceRegistry:
+    """Returns the process-wide ResourceRegistry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ResourceRegistry()
+        return _registry
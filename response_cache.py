@@ -0,0 +1,233 @@
+import faiss
+import hashlib
+import logging
+import numpy as np
+import os
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
+from embedder import BatchEmbedder
+from error_fingerprint import normalize_text
+from typing import Dict, Optional
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    response TEXT NOT NULL,
+    embedding BLOB,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+)
+"""
+
+
+class ResponseCache:
+    """
+    A persistent two-tier cache for LLM responses.
+
+    The exact tier looks up a SHA-256 hash of the normalized prompt. The
+    semantic tier embeds the prompt and returns the response of the most
+    similar cached prompt if its cosine similarity is at least
+    `similarity_threshold`. This catches the same stack trace pasted with
+    slightly different surroundings. Entries live in SQLite and the
+    semantic vectors are mirrored in an in-memory FAISS index. Entries older
+    than `ttl_seconds` are ignored and purged, and the least recently used
+    entries are evicted beyond `max_entries`.
+    """
+    def __init__(
+        self,
+        path: str,
+        embedder: BatchEmbedder = None,
+        similarity_threshold: float = 0.97,
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_entries: int = 10_000,
+    ):
+        """
+        Initializes the ResponseCache.
+
+        Args:
+            path: The SQLite database file.
+            embedder: The embedder for the semantic tier. Without one, only
+                exact matches are served.
+            similarity_threshold: The minimum cosine similarity for a semantic hit.
+            ttl_seconds: How long an entry stays valid.
+            max_entries: The maximum number of entries kept.
+        """
+        self.path = path
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits_exact = 0
+        self.hits_semantic = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._recent_embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+        self._index = None
+        self._load_index()
+
+    @staticmethod
+    def normalize(prompt: str) -> str:
+        """
+        Collapses whitespace and machine-specific traceback noise (paths, line
+        numbers, addresses) so that neither causes misses.
+        """
+        return normalize_text(prompt)
+
+    @classmethod
+    def make_key(cls, prompt: str) -> str:
+        return hashlib.sha256(cls.normalize(prompt).encode("utf-8")).hexdigest()
+
+    def _load_index(self):
+        rows = self._conn.execute("SELECT id, embedding FROM responses WHERE embedding IS NOT NULL").fetchall()
+        if not rows:
+            return
+        vectors = np.vstack([np.frombuffer(blob, dtype="float32") for _, blob in rows])
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+        self._index.add_with_ids(vectors, np.array([row_id for row_id, _ in rows], dtype="int64"))
+
+    def _recent(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            return self._recent_embeddings.get(key)
+
+    def _remember(self, key: str, embeddings: np.ndarray) -> np.ndarray:
+        """Keeps the last few prompt vectors so `put` can reuse the one `get` computed."""
+        vector = (embeddings[0] / max(np.linalg.norm(embeddings[0]), 1e-12)).astype("float32")
+        with self._lock:
+            self._recent_embeddings[key] = vector
+            while len(self._recent_embeddings) > 128:
+                self._recent_embeddings.popitem(last=False)
+        return vector
+
+    def _embed(self, key: str, prompt: str) -> np.ndarray:
+        vector = self._recent(key)
+        if vector is None:
+            vector = self._remember(key, self.embedder.embed([self.normalize(prompt)], task_type="SEMANTIC_SIMILARITY"))
+        return vector
+
+    def _lookup(self, key: str, vector: Optional[np.ndarray]) -> Optional[str]:
+        now = time.time()
+        cutoff = now - self.ttl_seconds
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, response FROM responses WHERE key = ? AND created_at >= ?", (key, cutoff)
+            ).fetchone()
+            tier = "exact"
+            if row is None and vector is not None and self._index is not None and self._index.ntotal:
+                scores, ids = self._index.search(vector.reshape(1, -1), 1)
+                if ids[0][0] >= 0 and scores[0][0] >= self.similarity_threshold:
+                    row = self._conn.execute(
+                        "SELECT id, response FROM responses WHERE id = ? AND created_at >= ?", (int(ids[0][0]), cutoff)
+                    ).fetchone()
+                    tier = "semantic"
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE id = ?", (now, row[0]))
+            self._conn.commit()
+            if tier == "exact":
+                self.hits_exact += 1
+            else:
+                self.hits_semantic += 1
+        logger.info(f"Response cache {tier} hit.")
+        return row[1]
+
+    def get(self, prompt: str) -> Optional[str]:
+        """
+        Looks up a cached response.
+
+        Args:
+            prompt: The variable part of the LLM prompt (error, context and file path).
+
+        Returns:
+            The cached response, or None on a miss.
+        """
+        key = self.make_key(prompt)
+        vector = self._embed(key, prompt) if self.embedder is not None else None
+        return self._lookup(key, vector)
+
+    async def get_async(self, prompt: str) -> Optional[str]:
+        """The asyncio counterpart of `get`; the embedding request is awaited."""
+        key = self.make_key(prompt)
+        vector = None
+        if self.embedder is not None:
+            vector = self._recent(key)
+            if vector is None:
+                embeddings = await self.embedder.embed_async([self.normalize(prompt)], task_type="SEMANTIC_SIMILARITY")
+                vector = self._remember(key, embeddings)
+        return self._lookup(key, vector)
+
+    def put(self, prompt: str, response: str):
+        """
+        Stores a response and evicts expired and least recently used entries.
+
+        Args:
+            prompt: The variable part of the LLM prompt (error, context and file path).
+            response: The LLM's response.
+        """
+        key = self.make_key(prompt)
+        vector = self._embed(key, prompt) if self.embedder is not None else None
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT id FROM responses WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self._remove_ids([old[0]])
+            cursor = self._conn.execute(
+                "INSERT INTO responses (key, response, embedding, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, response, vector.tobytes() if vector is not None else None, now, now),
+            )
+            if vector is not None:
+                if self._index is None:
+                    self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(len(vector)))
+                self._index.add_with_ids(vector.reshape(1, -1), np.array([cursor.lastrowid], dtype="int64"))
+            self._evict(now)
+            self._conn.commit()
+
+    def _remove_ids(self, ids):
+        if not ids:
+            return
+        self._conn.executemany("DELETE FROM responses WHERE id = ?", [(i,) for i in ids])
+        if self._index is not None:
+            self._index.remove_ids(np.array(ids, dtype="int64"))
+
+    def _evict(self, now: float):
+        expired = self._conn.execute(
+            "SELECT id FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).fetchall()
+        self._remove_ids([row[0] for row in expired])
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if count > self.max_entries:
+            overflow = self._conn.execute(
+                "SELECT id FROM responses ORDER BY last_access ASC LIMIT ?", (count - self.max_entries,)
+            ).fetchall()
+            self._remove_ids([row[0] for row in overflow])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the hit and miss counters and the overall hit rate."""
+        lookups = self.hits_exact + self.hits_semantic + self.misses
+        return {
+            "entries": len(self),
+            "hits_exact": self.hits_exact,
+            "hits_semantic": self.hits_semantic,
+            "misses": self.misses,
+            "hit_rate": (self.hits_exact + self.hits_semantic) / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        self._conn.close()
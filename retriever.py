@@ -1,108 +1,408 @@
+import asyncio
 import faiss
-import json
+import index_factory
 import logging
 import numpy as np
 import os
 import google.generativeai as genai
+import threading
 import time
-from typing import List, Dict
+from bm25 import BM25_FILE, BM25Index, reciprocal_rank_fusion
+from chunker import CHUNKS_FILE, collapse_hits, load_chunks, passage_text
+from embedder import BatchEmbedder
+from error_fingerprint import compact_query
+from exact_match import EXACT_MATCH_FILE, ExactMatch, ExactMatchIndex
+from metadata_store import open_metadata_store, record_content, saved_metadata_path
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Sequence, Tuple
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Fields that hold a record's full text; chunked results carry passages instead.
+_TEXT_FIELDS = ("content", "document", "text")
+
+# Chunk hits fetched per requested document, since several chunks of one
+# document often rank next to each other.
+_CHUNK_OVERSAMPLE = 4
+
 class Retriever:
     """
     A class to retrieve documents from a FAISS index based on a query.
+
+    If the index directory holds a chunk table (see `chunker.Chunker`), the
+    index holds passages rather than whole documents. Hits are then collapsed
+    per parent document, and each result's "content" holds only that
+    document's best passages.
+
+    If it also holds a BM25 index (see `bm25.BM25Index`), every query runs a
+    lexical search alongside the embedding request and the FAISS search, and
+    the two rankings are fused with reciprocal rank fusion; "score" is then
+    the fused score. When the embedding request fails or exceeds
+    `embed_timeout`, the lexical ranking is returned on its own.
+
+    If it holds an exact-match index (see `exact_match.ExactMatchIndex`), each
+    query is first looked up there. A query that repeats an indexed
+    traceback or document is answered without an embedding call: the hit
+    units rank first with the match similarity as "score" and carry
+    "match": "signature" or "near_duplicate". A hit that covers fewer than
+    `top_k` documents is filled from the lexical ranking, if there is one.
+
+    Queries are embedded as their `error_fingerprint.compact_query`: the
+    exception, the message template and the innermost frames, without
+    paths, line numbers or addresses. The lexical search sees the raw query.
     """
-    def __init__(self, index_path: str, metadata_path: str, google_api_key: str = None):
+    def __init__(
+        self,
+        index_path: str,
+        metadata_path: str = None,
+        google_api_key: str = None,
+        embedder: BatchEmbedder = None,
+        passages_per_doc: int = 2,
+        embed_timeout: float = None,
+        rrf_k: int = 60,
+    ):
         """
         Initializes the Retriever with a FAISS index and metadata.
 
         Args:
             index_path: The path to the FAISS index file.
-            metadata_path: The path to the JSONL metadata file.
+            metadata_path: The path to the metadata file. Records are read
+                lazily through a memory-mapped offsets index. Defaults to the
+                metadata the Indexer saved next to the index.
+            embedder: The embedder used for queries. Pass one with an
+                `EmbeddingCache` to reuse embeddings across runs.
+            passages_per_doc: The most passages returned per document when
+                the index is chunked.
+            embed_timeout: How many seconds hybrid retrieval waits for the
+                vector search before answering from the lexical index alone.
+                None waits for as long as the embedder retries.
+            rrf_k: The reciprocal rank fusion constant.
         """
+        # Resolve a versioned index directory (see `Indexer.save_index`) once,
+        # and read the metadata and sidecars saved with the index from the
+        # resolved directory, so that every file comes from the same save.
+        link_directory = os.path.dirname(os.path.abspath(index_path))
+        index_path = os.path.realpath(index_path)
+        directory = os.path.dirname(index_path)
+        if metadata_path is None:
+            metadata_path = saved_metadata_path(directory)
+        elif os.path.dirname(os.path.abspath(metadata_path)) == link_directory:
+            metadata_path = os.path.join(directory, os.path.basename(metadata_path))
         self.index = faiss.read_index(index_path)
-        self.metadata = []
-        with open(metadata_path, "r") as f:
-            for line in f:
-                self.metadata.append(json.loads(line))
+        self.metadata = open_metadata_store(metadata_path)
+        chunks_path = os.path.join(directory, CHUNKS_FILE)
+        self.chunks = load_chunks(chunks_path) if os.path.exists(chunks_path) else None
+        self.passages_per_doc = passages_per_doc
+        bm25_path = os.path.join(directory, BM25_FILE)
+        self.lexical = BM25Index.load(bm25_path) if os.path.exists(bm25_path) else None
+        self.embed_timeout = embed_timeout
+        self.rrf_k = rrf_k
+        exact_match_path = os.path.join(directory, EXACT_MATCH_FILE)
+        self.exact_match = ExactMatchIndex.load(exact_match_path) if os.path.exists(exact_match_path) else None
+        self.exact_hits = 0
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="vector-search") if self.lexical is not None else None
+        self._state_lock = threading.Lock()
+        self._active = 0
+        self._closing = False
         self.google_api_key = google_api_key or os.environ.get("GOOGLE_AI_API_KEY")
         if not self.google_api_key:
             raise ValueError("Google API key not provided. Please set the GOOGLE_AI_API_KEY environment variable.")
         genai.configure(api_key=self.google_api_key)
+        self.embedder = embedder or BatchEmbedder()
+
+    @contextmanager
+    def _in_use(self):
+        """Counts a running query, so that `close` waits for it."""
+        with self._state_lock:
+            if self._closing:
+                raise RuntimeError("The Retriever is closed.")
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._state_lock:
+                self._active -= 1
+                release = self._closing and self._active == 0
+            if release:
+                self._release()
+
+    def _release(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.metadata.close()
+
+    def close(self):
+        """
+        Shuts down the search thread pool and closes the metadata store.
+
+        Queries that are already running finish first; the resources are
+        released when the last one returns.
+        """
+        with self._state_lock:
+            if self._closing:
+                return
+            self._closing = True
+            release = self._active == 0
+        if release:
+            self._release()
+
+    def _embed_many(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeds several strings with batched, concurrent requests.
+
+        Identical strings are embedded once and cached strings are not sent
+        at all (see `BatchEmbedder.embed`).
+
+        Args:
+            texts: The texts to embed.
+
+        Returns:
+            A float32 array of row-normalized embeddings, one row per text.
+        """
+        return self._normalize(self.embedder.embed(texts, task_type="RETRIEVAL_DOCUMENT"))
+
+    @staticmethod
+    def _normalize(embeddings: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return (embeddings / np.where(norms == 0, 1, norms)).astype("float32")
+
+    def _search_k(self, top_k: int) -> int:
+        return top_k * _CHUNK_OVERSAMPLE if self.chunks is not None else top_k
+
+    def _search(self, query_embeddings: np.ndarray, top_k: int, nprobe: int = None, ef_search: int = None):
+        params = index_factory.search_parameters(self.index, nprobe=nprobe, ef_search=ef_search)
+        return self.index.search(query_embeddings, self._search_k(top_k), params=params)
+
+    def _vector_search(self, queries: List[str], top_k: int, nprobe: int = None, ef_search: int = None):
+        return self._search(self._embed_many([compact_query(query) for query in queries]), top_k, nprobe, ef_search)
+
+    def _fuse(self, lexical_ids: Sequence[np.ndarray], vector_ids: Optional[np.ndarray], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Fuses each query's rankings into FAISS-shaped (scores, ids) arrays."""
+        scores, ids = [], []
+        for i, query_lexical_ids in enumerate(lexical_ids):
+            rankings = [query_lexical_ids] if vector_ids is None else [vector_ids[i], query_lexical_ids]
+            fused_scores, fused_ids = reciprocal_rank_fusion(rankings, k, self.rrf_k)
+            scores.append(fused_scores)
+            ids.append(fused_ids)
+        return np.stack(scores), np.stack(ids)
+
+    def _search_all(self, queries: List[str], top_k: int, nprobe: int = None, ef_search: int = None):
+        """
+        Runs the vector search, and with a lexical index fuses it with the
+        lexical rankings; the lexical search runs here while the vector
+        search runs in a worker thread.
+        """
+        if self.lexical is None:
+            return self._vector_search(queries, top_k, nprobe, ef_search)
+        k = self._search_k(top_k)
+        future = self._executor.submit(self._vector_search, queries, top_k, nprobe, ef_search)
+        lexical_ids = [self.lexical.search(query, k)[1] for query in queries]
+        try:
+            _, vector_ids = future.result(timeout=self.embed_timeout)
+        except Exception as e:
+            logger.warning(f"Vector search unavailable ({e!r}); using lexical results only.")
+            vector_ids = None
+        return self._fuse(lexical_ids, vector_ids, k)
+
+    def _documents_in(self, ids: Sequence[int]) -> int:
+        """Counts the documents that index units belong to."""
+        if self.chunks is None:
+            return len(ids)
+        return len({int(self.chunks[i, 0]) for i in ids if 0 <= i < len(self.chunks) and self.chunks[i, 0] >= 0})
+
+    def _exact_results(self, queries: List[str], matches: Sequence[ExactMatch], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Answers queries from their exact-match hits, without an embedding call.
 
-    def _embed(self, text: str) -> np.ndarray:
+        The hit units rank first and score their match similarity. A hit
+        that covers fewer than `top_k` documents is filled from the lexical
+        ranking, whose hits score as in a lexical-only fusion.
         """
-        Embeds a string using Google's embedding-001 model.
+        k = self._search_k(top_k)
+        scores = np.zeros((len(queries), k), dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, (query, match) in enumerate(zip(queries, matches)):
+            hit_ids = np.array(match.ids[:k], dtype=np.int64)
+            scores[row, :len(hit_ids)] = match.similarity
+            ids[row, :len(hit_ids)] = hit_ids
+            if self.lexical is None or len(hit_ids) == k or self._documents_in(match.ids) >= top_k:
+                continue
+            _, lexical_ids = self.lexical.search(query, k)
+            fill_scores, fill_ids = reciprocal_rank_fusion([lexical_ids[~np.isin(lexical_ids, hit_ids)]], k - len(hit_ids), self.rrf_k)
+            scores[row, len(hit_ids):] = fill_scores
+            ids[row, len(hit_ids):] = fill_ids
+        return scores, ids
+
+    def _format_passages(self, distances: np.ndarray, indices: np.ndarray, top_k: int, matches: Sequence[Optional[ExactMatch]]) -> List[List[Dict]]:
+        """
+        Collapses chunk hits per parent document and reads only their passages.
+
+        Each parent record is read once, however many queries and chunks hit it.
+        """
+        hits = [collapse_hits(d, i, self.chunks, top_k, self.passages_per_doc) for d, i in zip(distances, indices)]
+        parent_ids = sorted({parent for query_hits in hits for parent, _, _ in query_hits})
+        records = dict(zip(parent_ids, self.metadata.get_many(parent_ids)))
+        batch_results = []
+        for query_hits, match in zip(hits, matches):
+            results = []
+            for parent, score, chunk_ids in query_hits:
+                record = records[parent]
+                spans = [(int(self.chunks[i, 1]), int(self.chunks[i, 2])) for i in chunk_ids]
+                result = {key: value for key, value in record.items() if key not in _TEXT_FIELDS}
+                result = {**result, "content": passage_text(record_content(record), spans), "score": score}
+                if match is not None and not set(match.ids).isdisjoint(chunk_ids):
+                    result["match"] = match.kind
+                results.append(result)
+            batch_results.append(results)
+        return batch_results
+
+    def _lookup_exact(self, query: str) -> Optional[ExactMatch]:
+        """Looks `query` up in the exact-match index; None on a miss or without one."""
+        if self.exact_match is None:
+            return None
+        match = self.exact_match.lookup(query)
+        if match is not None:
+            with self._state_lock:
+                self.exact_hits += 1
+            logger.info(f"Exact-match hit ({match.kind}) on {len(match.ids)} units.")
+        return match
+
+    def _format_results(self, distances: np.ndarray, indices: np.ndarray, top_k: int = None, matches: Sequence[Optional[ExactMatch]] = None) -> List[List[Dict]]:
+        """
+        Reads the metadata of the hit rows and pairs it with the scores.
+
+        Every distinct row is read from the metadata store once, however many
+        queries it appears in.
 
         Args:
-            text: The text to embed.
+            distances: The (num_queries, top_k) array of scores.
+            indices: The (num_queries, top_k) array of row ids; -1 marks a missing hit.
+            top_k: The number of documents per query, for chunked indexes.
+            matches: Each query's exact-match hit, if any; the results it
+                produced are tagged with "match".
 
         Returns:
-            A normalized NumPy array representing the embedding.
+            One list of result dictionaries per query.
         """
-        response = genai.embed_content(
-            model="models/embedding-001",
-            content=text,
-            task_type="RETRIEVAL_DOCUMENT"
-        )
-        embedding = np.array(response["embedding"])
-        return embedding / np.linalg.norm(embedding)
+        matches = matches if matches is not None else [None] * len(indices)
+        if self.chunks is not None:
+            return self._format_passages(distances, indices, top_k or indices.shape[1], matches)
+        valid = indices >= 0
+        unique_ids, record_positions = np.unique(indices[valid], return_inverse=True)
+        records = []
+        for record in self.metadata.get_many(unique_ids.tolist()):
+            records.append({**record, "content": record_content(record)})
+
+        query_rows, _ = np.nonzero(valid)
+        batch_results = [[] for _ in range(len(indices))]
+        for row, position, unit_id, score in zip(query_rows.tolist(), record_positions.tolist(), indices[valid].tolist(), distances[valid].tolist()):
+            result = {**records[position], "score": score}
+            if matches[row] is not None and unit_id in matches[row].ids:
+                result["match"] = matches[row].kind
+            batch_results[row].append(result)
+        return batch_results
 
-    def retrieve(self, query: str, top_k: int = 5) -> List[Dict]:
+    def retrieve(self, query: str, top_k: int = 5, nprobe: int = None, ef_search: int = None) -> List[Dict]:
         """
         Retrieves the top-k documents for a single query.
 
         Args:
             query: The query string.
             top_k: The number of documents to retrieve.
+            nprobe: The number of IVF lists to visit (IVF indexes only).
+            ef_search: The HNSW candidate list size (HNSW indexes only).
 
         Returns:
             A list of dictionaries, each containing a retrieved document.
         """
         start_time = time.time()
-        query_embedding = self._embed(query)
-        distances, indices = self.index.search(np.array([query_embedding]), top_k)
-        results = []
-        for i, idx in enumerate(indices[0]):
-            metadata = self.metadata[idx]
-            results.append({
-                "content": metadata["content"],
-                "source": metadata["source"],
-                "id": metadata["id"],
-                "score": distances[0][i]
-            })
+        with self._in_use():
+            matches = [self._lookup_exact(query)]
+            if matches[0] is not None:
+                distances, indices = self._exact_results([query], matches, top_k)
+            else:
+                distances, indices = self._search_all([query], top_k, nprobe, ef_search)
+            results = self._format_results(distances, indices, top_k, matches)[0]
         end_time = time.time()
-        logger.info(f"Retrieval latency: {end_time - start_time:.4f} seconds")
+        logger.info(f"Retrieval latency: {end_time - start_time:.4f} seconds{' (exact match)' if matches[0] else ''}")
         return results
 
-    def batch_retrieve(self, queries: List[str], top_k: int = 5) -> List[List[Dict]]:
+    def batch_retrieve(self, queries: List[str], top_k: int = 5, nprobe: int = None, ef_search: int = None) -> List[List[Dict]]:
         """
         Retrieves the top-k documents for a batch of queries.
 
         Args:
             queries: A list of query strings.
             top_k: The number of documents to retrieve for each query.
+            nprobe: The number of IVF lists to visit (IVF indexes only).
+            ef_search: The HNSW candidate list size (HNSW indexes only).
 
         Returns:
             A list of lists of dictionaries, where each inner list contains the retrieved documents for a query.
         """
         start_time = time.time()
-        query_embeddings = np.array([self._embed(q) for q in queries])
-        distances, indices = self.index.search(query_embeddings, top_k)
-        batch_results = []
-        for i, query_indices in enumerate(indices):
-            results = []
-            for j, idx in enumerate(query_indices):
-                metadata = self.metadata[idx]
-                results.append({
-                    "content": metadata["content"],
-                    "source": metadata["source"],
-                    "id": metadata["id"],
-                    "score": distances[i][j]
-                })
-            batch_results.append(results)
+        if not queries:
+            return []
+        with self._in_use():
+            matches = [self._lookup_exact(query) for query in queries]
+            hits = [i for i, match in enumerate(matches) if match is not None]
+            misses = [i for i, match in enumerate(matches) if match is None]
+            k = self._search_k(top_k)
+            distances = np.zeros((len(queries), k), dtype=np.float32)
+            indices = np.full((len(queries), k), -1, dtype=np.int64)
+            if hits:
+                distances[hits], indices[hits] = self._exact_results([queries[i] for i in hits], [matches[i] for i in hits], top_k)
+            if misses:
+                # Only the queries without an exact-match hit are embedded.
+                distances[misses], indices[misses] = self._search_all([queries[i] for i in misses], top_k, nprobe, ef_search)
+            batch_results = self._format_results(distances, indices, top_k, matches)
         end_time = time.time()
         logger.info(f"Batch retrieval latency for {len(queries)} queries: {end_time - start_time:.4f} seconds")
-        return batch_results
\ No newline at end of file
+        return batch_results
+
+    async def retrieve_async(self, query: str, top_k: int = 5, nprobe: int = None, ef_search: int = None) -> List[Dict]:
+        """
+        The asyncio counterpart of `retrieve`.
+
+        Only the embedding request is awaited. The FAISS search and the
+        metadata reads are short, CPU-bound steps and run inline. With a
+        lexical index, the BM25 search runs in a worker thread while the
+        embedding request is in flight.
+
+        Args:
+            query: The query string.
+            top_k: The number of documents to retrieve.
+            nprobe: The number of IVF lists to visit (IVF indexes only).
+            ef_search: The HNSW candidate list size (HNSW indexes only).
+
+        Returns:
+            A list of dictionaries, each containing a retrieved document.
+        """
+        start_time = time.time()
+        with self._in_use():
+            matches = [self._lookup_exact(query)]
+            k = self._search_k(top_k)
+
+            async def vector_search():
+                query_embedding = self._normalize(await self.embedder.embed_async([compact_query(query)], task_type="RETRIEVAL_DOCUMENT"))
+                return self._search(query_embedding, top_k, nprobe, ef_search)
+
+            if matches[0] is not None:
+                distances, indices = self._exact_results([query], matches, top_k)
+            elif self.lexical is None:
+                distances, indices = await vector_search()
+            else:
+                vector_task = asyncio.create_task(asyncio.wait_for(vector_search(), self.embed_timeout))
+                _, lexical_ids = await asyncio.to_thread(self.lexical.search, query, k)
+                try:
+                    _, vector_ids = await vector_task
+                except Exception as e:
+                    logger.warning(f"Vector search unavailable ({e!r}); using lexical results only.")
+                    vector_ids = None
+                distances, indices = self._fuse([lexical_ids], vector_ids, k)
+            results = self._format_results(distances, indices, top_k, matches)[0]
+        end_time = time.time()
+        logger.info(f"Async retrieval latency: {end_time - start_time:.4f} seconds")
+        return results
@@ -0,0 +1,306 @@
+import hashlib
+import importlib.util
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Sequence, Tuple
+from unified_diff import FileDiff, PatchApplyError, apply, confine_path
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; limits are then wall-time only.
+    resource = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# ioctl request that clones a file's extents (copy-on-write) on btrfs/XFS.
+_FICLONE = 0x40049409
+_SKIP_DIRS = {".git", "__pycache__", ".pytest_cache", ".mypy_cache", ".tox", ".venv", "venv", "node_modules"}
+_OUTPUT_LIMIT = 20_000
+# Applies the rlimits inside the child before running the test module. This
+# replaces preexec_fn, which is unsafe when subprocesses start from threads.
+_LAUNCHER = (
+    "import resource, runpy, sys\n"
+    "cpu, memory = int(sys.argv[1]), int(sys.argv[2])\n"
+    "resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))\n"
+    "if memory:\n"
+    "    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))\n"
+    "sys.argv = sys.argv[3:]\n"
+    "runpy.run_module(sys.argv[0], run_name='__main__', alter_sys=True)\n"
+)
+
+
+@dataclass
+class SandboxResult:
+    """The outcome of running one generated test against one candidate patch."""
+    status: str  # "passed", "failed", "error" or "timeout"
+    duration: float
+    output: str = ""
+    cached: bool = False
+
+    @property
+    def passed(self) -> bool:
+        return self.status == "passed"
+
+
+def _hash_patch(file_diffs: Sequence[FileDiff]) -> str:
+    h = hashlib.sha256()
+    for file_diff in file_diffs:
+        h.update(file_diff.text.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _hash_test(test_code: str) -> str:
+    return hashlib.sha256(test_code.encode("utf-8")).hexdigest()
+
+
+class SandboxRunner:
+    """
+    Runs generated unit tests against candidate patches in isolated snapshots.
+
+    Each run gets a snapshot of `repo_path`. Unchanged files are reflinked
+    (copy-on-write) where the filesystem supports it, so a snapshot costs
+    one directory walk rather than a full copy, and copied otherwise. Files
+    are never hardlinked: every snapshot file is its own inode, so neither
+    the patch nor a test that writes to source files can reach the checkout.
+
+    Tests run in a subprocess with a wall-clock timeout and, on Unix, CPU
+    time and memory rlimits. Runs are spread over a thread pool of
+    subprocess launchers, so many candidates use all cores. Results are
+    cached by (patch hash, test hash). A patch whose paths leave the
+    repository is reported as an "error" without touching the disk.
+    """
+    def __init__(
+        self,
+        repo_path: str,
+        max_workers: int = None,
+        timeout: float = 60.0,
+        cpu_seconds: int = None,
+        memory_bytes: int = None,
+        copy_files: bool = False,
+        cache_size: int = 1024,
+    ):
+        """
+        Initializes the SandboxRunner.
+
+        Args:
+            repo_path: The repository checkout the patches apply to.
+            max_workers: The maximum number of tests run at once. Defaults
+                to the number of CPUs.
+            timeout: The wall-clock limit per test run in seconds.
+            cpu_seconds: The CPU time limit per run. Defaults to `timeout`.
+            memory_bytes: An optional address-space limit per run.
+            copy_files: Copy every file into the snapshot without trying a
+                reflink first.
+            cache_size: The number of results kept.
+        """
+        self.repo_path = os.path.abspath(repo_path)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds or max(1, int(timeout))
+        self.memory_bytes = memory_bytes
+        self.copy_files = copy_files
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, str], SandboxResult]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._files: Optional[List[str]] = None
+        self._use_pytest = importlib.util.find_spec("pytest") is not None
+
+    def _repo_files(self) -> List[str]:
+        """Lists the repository's files once; call `refresh` after the checkout changes."""
+        if self._files is None:
+            files = []
+            for root, dirs, names in os.walk(self.repo_path):
+                dirs[:] = [d for d in dirs if d not in _SKIP_DIRS]
+                rel_root = os.path.relpath(root, self.repo_path)
+                for name in names:
+                    files.append(os.path.normpath(os.path.join(rel_root, name)))
+            self._files = files
+        return self._files
+
+    def refresh(self):
+        """Forgets the file list and cached results, e.g. after the checkout changed."""
+        with self._lock:
+            self._files = None
+            self._cache.clear()
+
+    def _clone(self, src: str, dst: str):
+        if not self.copy_files and fcntl is not None:
+            try:
+                with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                    fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+                shutil.copystat(src, dst)
+                return
+            except OSError:
+                os.remove(dst)
+        shutil.copy2(src, dst)
+
+    def _snapshot(self, patched: Dict[str, Optional[str]]) -> str:
+        """Creates a snapshot with `patched` ({path: contents, or None to delete}) applied."""
+        snapshot = tempfile.mkdtemp(prefix="sandbox_")
+        try:
+            created_dirs = set()
+            for rel_path in self._repo_files():
+                if rel_path in patched:
+                    continue
+                dst = os.path.join(snapshot, rel_path)
+                parent = os.path.dirname(dst)
+                if parent not in created_dirs:
+                    os.makedirs(parent, exist_ok=True)
+                    created_dirs.add(parent)
+                self._clone(os.path.join(self.repo_path, rel_path), dst)
+            for rel_path, contents in patched.items():
+                if contents is None:
+                    continue
+                dst = confine_path(snapshot, rel_path)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                with open(dst, "w", encoding="utf-8") as f:
+                    f.write(contents)
+        except BaseException:
+            shutil.rmtree(snapshot, ignore_errors=True)
+            raise
+        return snapshot
+
+    def _patched_files(self, file_diffs: Sequence[FileDiff]) -> Dict[str, Optional[str]]:
+        originals = {}
+        for file_diff in file_diffs:
+            if file_diff.new_path is not None:
+                confine_path(self.repo_path, file_diff.new_path)
+            if file_diff.old_path is None:
+                continue
+            path = confine_path(self.repo_path, file_diff.old_path)
+            if os.path.isfile(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    originals[os.path.normpath(file_diff.old_path)] = f.read()
+        normalized = []
+        for file_diff in file_diffs:
+            normalized.append(replace(
+                file_diff,
+                old_path=os.path.normpath(file_diff.old_path) if file_diff.old_path else None,
+                new_path=os.path.normpath(file_diff.new_path) if file_diff.new_path else None,
+            ))
+        result = apply(normalized, originals)
+        patched: Dict[str, Optional[str]] = {path: None for path in originals}
+        patched.update(result)
+        return patched
+
+    def _command(self, test_file: str) -> List[str]:
+        if self._use_pytest:
+            module_args = ["pytest", "-q", "-p", "no:cacheprovider", test_file]
+        else:
+            module_args = ["unittest", "-q", os.path.splitext(test_file)[0]]
+        if resource is None:
+            return [sys.executable, "-m"] + module_args
+        return [sys.executable, "-c", _LAUNCHER, str(self.cpu_seconds), str(self.memory_bytes or 0)] + module_args
+
+    def _execute(self, file_diffs: Sequence[FileDiff], test_code: str) -> SandboxResult:
+        start = time.perf_counter()
+        try:
+            snapshot = self._snapshot(self._patched_files(file_diffs))
+        except (PatchApplyError, OSError, UnicodeDecodeError) as e:
+            return SandboxResult("error", time.perf_counter() - start, f"Patch does not apply: {e}")
+
+        try:
+            test_file = f"test_sandbox_{_hash_test(test_code)[:12]}.py"
+            with open(os.path.join(snapshot, test_file), "w", encoding="utf-8") as f:
+                f.write(test_code)
+            env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1", PYTHONPATH=snapshot)
+            process = subprocess.Popen(
+                self._command(test_file),
+                cwd=snapshot,
+                env=env,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                stdin=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+            try:
+                output, _ = process.communicate(timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                _kill_group(process)
+                output, _ = process.communicate()
+                status = "timeout"
+            else:
+                if process.returncode == 0:
+                    status = "passed"
+                elif process.returncode < 0 or process.returncode == 5:
+                    # Killed by a signal (e.g. the CPU limit), or no tests collected.
+                    status = "error"
+                else:
+                    status = "failed"
+            text = output.decode("utf-8", errors="replace")[-_OUTPUT_LIMIT:]
+            return SandboxResult(status, time.perf_counter() - start, text)
+        finally:
+            shutil.rmtree(snapshot, ignore_errors=True)
+
+    def run(self, file_diffs: Sequence[FileDiff], test_code: str) -> SandboxResult:
+        """
+        Runs one generated test against a patch.
+
+        Args:
+            file_diffs: The patch, as parsed by `unified_diff`.
+            test_code: The test module's source.
+
+        Returns:
+            The SandboxResult. A patch that does not apply yields "error".
+        """
+        key = (_hash_patch(file_diffs), _hash_test(test_code))
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return replace(cached, cached=True)
+        result = self._execute(file_diffs, test_code)
+        logger.info(f"Sandboxed test {result.status} in {result.duration:.2f}s")
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def run_many(self, jobs: Sequence[Tuple[Sequence[FileDiff], str]]) -> List[SandboxResult]:
+        """
+        Runs many (patch, test) pairs in parallel.
+
+        Returns:
+            One SandboxResult per job, in order.
+        """
+        if not jobs:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as executor:
+            return list(executor.map(lambda job: self.run(*job), jobs))
+
+    def verify(self, parsed_output: Dict) -> List[SandboxResult]:
+        """
+        Runs every unit test from `parse_llm_output` against all of its patches.
+
+        Returns:
+            One SandboxResult per unit test, in order.
+        """
+        file_diffs = [patch["file_diff"] for patch in parsed_output["patches"]]
+        return self.run_many([(file_diffs, test["code"]) for test in parsed_output["unit_tests"]])
+
+
+def _kill_group(process: subprocess.Popen):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, AttributeError):
+        process.kill()
@@ -0,0 +1,100 @@
+import unittest
+from unittest.mock import patch, AsyncMock, MagicMock
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from best_of_n import BestOfNGenerator
+from llm_agent import LLMAgent
+from sandbox_runner import SandboxRunner
+
+
+def response(added_line, context="def average(items):"):
+    return f"""**Patch:**
+```diff
+--- a/calc.py
++++ b/calc.py
+@@ -1,2 +1,2 @@
+ {context}
+-    return sum(items) / len(items)
++{added_line}
+```
+
+**Unit Test:**
+```python
+from calc import average
+
+def test_average_of_empty_list():
+    assert average([]) == 0
+```
+"""
+
+
+GOOD = response("    return sum(items) / max(len(items), 1)")
+GOOD_REFORMATTED = response("    return sum(items)  /  max(len(items), 1)   ", context="def average(items):  ")
+WRONG = response("    return sum(items) / len(items) if items else None")
+INVALID = response("    return \"average: \" + len(items)")
+
+
+class TestBestOfN(unittest.TestCase):
+
+    def make_agent(self, mock_generative_model, responses, delays=None):
+        calls = []
+
+        async def generate(prompt, **kwargs):
+            index = len(calls)
+            calls.append(kwargs)
+            await asyncio.sleep((delays or {}).get(index, 0))
+            return MagicMock(text=responses[index])
+
+        mock_model_instance = MagicMock()
+        mock_model_instance.generate_content_async = AsyncMock(side_effect=generate)
+        mock_generative_model.return_value = mock_model_instance
+        return LLMAgent(api_key="fake_key"), calls
+
+    @patch('llm_agent.genai.GenerativeModel')
+    def test_ranks_and_deduplicates(self, mock_generative_model):
+        agent, calls = self.make_agent(
+            mock_generative_model, [INVALID, GOOD, "no patch here", GOOD_REFORMATTED], delays={3: 0.05}
+        )
+        generator = BestOfNGenerator(agent, n=4, token_budget=4000, early_exit=False)
+        candidates = asyncio.run(generator.generate("ZeroDivisionError in average"))
+
+        # A rejected patch ranks below no patch at all.
+        self.assertEqual([c.index for c in candidates], [1, 2, 0])
+        self.assertTrue(candidates[0].passed)
+        self.assertEqual(candidates[0].duplicates, 1)
+        self.assertEqual(len(candidates[2].rejected), 1)
+        self.assertEqual(len(calls), 4)
+        for kwargs in calls:
+            self.assertEqual(kwargs["generation_config"]["max_output_tokens"], 1000)
+            self.assertEqual(kwargs["generation_config"]["temperature"], 0.8)
+
+    @patch('llm_agent.genai.GenerativeModel')
+    def test_early_exit_on_first_passing_candidate(self, mock_generative_model):
+        agent, _ = self.make_agent(mock_generative_model, [INVALID, GOOD, WRONG], delays={0: 0.01, 1: 0.02, 2: 5})
+        generator = BestOfNGenerator(agent, n=3)
+        start = time.perf_counter()
+        candidates = asyncio.run(generator.generate("ZeroDivisionError in average"))
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertEqual([c.index for c in candidates], [1, 0])
+
+    @patch('llm_agent.genai.GenerativeModel')
+    def test_sandboxed_tests_decide_the_ranking(self, mock_generative_model):
+        repo = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(repo, "calc.py"), "w") as f:
+                f.write("def average(items):\n    return sum(items) / len(items)\n")
+            agent, _ = self.make_agent(mock_generative_model, [WRONG, GOOD])
+            generator = BestOfNGenerator(agent, n=2, sandbox=SandboxRunner(repo, timeout=30), early_exit=False)
+            candidates = asyncio.run(generator.generate("ZeroDivisionError in average", repo_path=repo))
+            self.assertEqual([c.index for c in candidates], [1, 0])
+            self.assertTrue(candidates[0].passed)
+            self.assertEqual([r.status for r in candidates[1].test_results], ["failed"])
+        finally:
+            shutil.rmtree(repo)
+
+
+if __name__ == '__main__':
+    unittest.main()
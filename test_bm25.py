@@ -0,0 +1,101 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from bm25 import BM25_FILE, BM25Index, build_from_metadata, reciprocal_rank_fusion, tokenize
+from corpus import write_corpus
+
+DOCS = [
+    "openai.BadRequestError: Error code: 400 raised by openai._base_client.request",
+    "KeyError: 'choices' when streaming completions",
+    "Installing the package fails on Windows with a compiler error",
+    "Timeouts when the proxy is slow; raise the timeout",
+]
+
+
+class TestBM25(unittest.TestCase):
+    def test_tokenize_keeps_paths_and_their_parts(self):
+        tokens = list(tokenize("File openai._base_client.py, Error code: 400"))
+        self.assertIn("openai._base_client.py", tokens)
+        self.assertIn("_base_client", tokens)
+        self.assertIn("400", tokens)
+
+    def test_exact_tokens_rank_first(self):
+        index = BM25Index.build(DOCS, ids=[10, 11, 12, 13])
+        scores, ids = index.search("Traceback ... openai.BadRequestError: Error code: 400", top_k=3)
+        self.assertEqual(ids[0], 10)
+        self.assertEqual(index.search("KeyError choices", top_k=1)[1].tolist(), [11])
+        self.assertTrue(np.all(np.diff(scores) <= 0))
+
+    def test_unmatched_query_pads_like_faiss(self):
+        scores, ids = BM25Index.build(DOCS).search("zzz", top_k=2)
+        self.assertEqual(ids.tolist(), [-1, -1])
+        self.assertEqual(scores.tolist(), [0.0, 0.0])
+
+    def test_postings_are_compact(self):
+        index = BM25Index.build(DOCS)
+        self.assertEqual(index.postings.dtype, np.int32)
+        self.assertEqual(index.frequencies.dtype, np.uint16)
+        self.assertEqual(index.term_starts[-1], len(index.postings))
+
+    def test_update_matches_a_full_build(self):
+        index = BM25Index.build(DOCS, ids=[10, 11, 12, 13])
+        updated = index.update([11, 13], ["KeyError: 'delta' when streaming completions", "Proxy errors on Windows"], [14, 15])
+        expected = BM25Index.build([DOCS[0], DOCS[2], "KeyError: 'delta' when streaming completions", "Proxy errors on Windows"], ids=[10, 12, 14, 15])
+        for query in ("KeyError streaming", "Windows proxy", "openai 400", "choices"):
+            self.assertEqual(updated.search(query, 4)[1].tolist(), expected.search(query, 4)[1].tolist())
+            np.testing.assert_allclose(updated.search(query, 4)[0], expected.search(query, 4)[0], rtol=1e-6)
+
+    def test_save_and_load_round_trip(self):
+        directory = tempfile.mkdtemp()
+        try:
+            metadata_path = os.path.join(directory, "corpus.jsonl")
+            with open(metadata_path, "w") as f:
+                for i, text in enumerate(DOCS):
+                    f.write(json.dumps({"id": i, "content": text}) + "\n")
+            built = build_from_metadata(metadata_path, directory)
+            loaded = BM25Index.load(os.path.join(directory, BM25_FILE))
+            for query in ("proxy timeout", "compiler error Windows"):
+                self.assertEqual(loaded.search(query, 2)[1].tolist(), built.search(query, 2)[1].tolist())
+        finally:
+            shutil.rmtree(directory)
+
+    def test_build_from_metadata_refuses_a_versioned_index(self):
+        directory = tempfile.mkdtemp()
+        try:
+            version = os.path.join(directory, "index.versions", "1")
+            os.makedirs(version)
+            os.symlink(version, os.path.join(directory, "index"))
+            metadata_path = os.path.join(directory, "corpus.jsonl")
+            with open(metadata_path, "w") as f:
+                f.write(json.dumps({"id": 0, "content": DOCS[0]}) + "\n")
+            with self.assertRaises(ValueError):
+                build_from_metadata(metadata_path, os.path.join(directory, "index") + "/")
+            self.assertEqual(os.listdir(version), [])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_build_from_metadata_uses_the_stores_ids(self):
+        directory = tempfile.mkdtemp()
+        try:
+            records = [{"faiss_id": faiss_id, "document": text} for faiss_id, text in zip([40, 7, 13, 2], DOCS)]
+            write_corpus(os.path.join(directory, "metadata.corpus"), records)
+            with open(os.path.join(directory, "metadata.json"), "w") as f:
+                json.dump(records, f)
+            for name in ("metadata.corpus", "metadata.json"):
+                index = build_from_metadata(os.path.join(directory, name), directory)
+                self.assertEqual(sorted(index.ids.tolist()), [2, 7, 13, 40])
+                self.assertEqual(index.search("KeyError choices", 1)[1].tolist(), [7])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_reciprocal_rank_fusion(self):
+        scores, ids = reciprocal_rank_fusion([np.array([1, 2, 3]), np.array([3, 1, -1])], top_k=4)
+        self.assertEqual(ids.tolist(), [1, 3, 2, -1])
+        self.assertAlmostEqual(scores[0], 1 / 61 + 1 / 62)
+
+
+if __name__ == '__main__':
+    unittest.main()
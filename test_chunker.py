@@ -0,0 +1,80 @@
+import unittest
+import numpy as np
+from chunker import Chunker, collapse_hits, passage_text
+from context_packer import estimate_tokens
+
+TRACEBACK = """Traceback (most recent call last):
+  File "app.py", line 3, in <module>
+    main()
+  File "app.py", line 2, in main
+    return "total: " + 3
+TypeError: can only concatenate str (not "int") to str
+"""
+
+CODE = """```python
+def main():
+    return "total: " + str(3)
+```
+"""
+
+DOCUMENT = "\n\n".join([
+    "Concatenating a count fails when the report is printed.",
+    TRACEBACK,
+    "Wrapping the count in str() fixes it:",
+    CODE,
+    "Thanks, that worked for me.",
+])
+
+
+class TestChunker(unittest.TestCase):
+    def test_code_and_tracebacks_are_not_cut(self):
+        spans = Chunker(chunk_tokens=60, overlap_tokens=0).chunk(DOCUMENT)
+        passages = [DOCUMENT[start:end] for start, end in spans]
+        self.assertGreater(len(passages), 1)
+        self.assertTrue(any(TRACEBACK.strip() in p for p in passages))
+        self.assertTrue(any(CODE.strip() in p for p in passages))
+        for passage in passages:
+            self.assertEqual(passage.count("```") % 2, 0)
+
+    def test_oversized_traceback_splits_between_frames(self):
+        frames = "".join(f'  File "mod{i}.py", line {i}, in f{i}\n    f{i + 1}()\n' for i in range(30))
+        traceback = f"Traceback (most recent call last):\n{frames}RecursionError: maximum recursion depth exceeded\n"
+        spans = Chunker(chunk_tokens=80, overlap_tokens=0).chunk(traceback)
+        self.assertGreater(len(spans), 1)
+        for start, _ in spans[1:]:
+            self.assertTrue(traceback[start:].startswith('  File "'))
+
+    def test_windows_overlap_and_cover_the_text(self):
+        text = " ".join(f"word{i}" for i in range(400))
+        chunker = Chunker(chunk_tokens=64, overlap_tokens=16)
+        spans = chunker.chunk(text)
+        self.assertEqual(spans[0][0], 0)
+        self.assertEqual(spans[-1][1], len(text))
+        for (_, previous_end), (start, _) in zip(spans, spans[1:]):
+            self.assertLess(start, previous_end)
+        self.assertTrue(all(estimate_tokens(text[s:e]) <= 64 for s, e in spans))
+
+    def test_empty_document_has_no_chunks(self):
+        self.assertEqual(Chunker().chunk("  \n\n "), [])
+
+    def test_chunk_documents_table(self):
+        table = Chunker(chunk_tokens=60).chunk_documents([DOCUMENT, "short"], parent_ids=[7, 9])
+        self.assertEqual(table.dtype, np.int32)
+        self.assertEqual(table.shape[1], 3)
+        self.assertEqual(set(table[:, 0].tolist()), {7, 9})
+        self.assertEqual(table[-1].tolist(), [9, 0, 5])
+
+    def test_collapse_hits_per_parent(self):
+        chunks = np.array([[0, 0, 5], [0, 5, 9], [1, 0, 4], [-1, 0, 3], [2, 0, 2]], dtype="int32")
+        distances = np.array([0.9, 0.8, 0.7, 0.6, 0.5])
+        indices = np.array([1, 3, 0, 2, -1])
+        hits = collapse_hits(distances, indices, chunks, top_k=2)
+        self.assertEqual(hits, [(0, 0.9, [1, 0]), (1, 0.6, [2])])
+
+    def test_passage_text_merges_overlaps(self):
+        text = "0123456789"
+        self.assertEqual(passage_text(text, [(6, 8), (0, 3), (2, 5)], separator="|"), "01234|67")
+
+
+if __name__ == '__main__':
+    unittest.main()
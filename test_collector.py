@@ -0,0 +1,398 @@
+import unittest
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from corpus import CorpusStore
+from metadata_store import open_metadata_store
+from data_collector.collector import Collector, merge_shards, shard_name, to_record
+from data_collector.engine import (
+    ApiClient,
+    Checkpoint,
+    Crawler,
+    GitHubIssues,
+    RateLimitBudget,
+    StackOverflowQuestions,
+    github_client,
+    stackexchange_client,
+    upsert_jsonl,
+)
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, data, status=200, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        api = self.server.api
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        with api.lock:
+            api.hits.append(url.path)
+            failure = api.failures.get(url.path + (f"?page={query['page']}" if "page" in query else ""))
+            if failure and failure[0] > 0:
+                failure[0] -= 1
+                self.send_json({"message": "failure"}, failure[1], failure[2])
+                return
+        if url.path == "/repos/o/r/issues":
+            page = int(query.get("page", 1))
+            listed = [issue for issue in api.issues if issue["updated_at"] >= query.get("since", "")]
+            issues = listed[(page - 1) * api.page_size:page * api.page_size]
+            headers = {}
+            if page * api.page_size < len(listed):
+                headers["Link"] = f'<{api.url}/repos/o/r/issues?page={page + 1}>; rel="next"'
+            self.send_json(issues, headers=headers)
+        elif url.path.startswith("/repos/o/r/issues/") and url.path.endswith("/comments"):
+            with api.lock:
+                api.active += 1
+                api.max_active = max(api.max_active, api.active)
+            time.sleep(api.latency)
+            with api.lock:
+                api.active -= 1
+            number = int(url.path.split("/")[-2])
+            self.send_json([{"body": body} for body in api.comments[number]])
+        elif url.path == "/2.3/questions":
+            page = int(query["page"])
+            listed = [q for q in api.questions if q["last_activity_date"] >= int(query.get("min", 0))]
+            questions = listed[(page - 1) * api.page_size:page * api.page_size]
+            self.send_json({"items": questions, "has_more": page * api.page_size < len(listed), "quota_remaining": 9999})
+        elif url.path.startswith("/2.3/answers/"):
+            ids = [int(i) for i in url.path.rsplit("/", 1)[1].split(";")]
+            self.send_json({"items": [{"answer_id": i, "body": f"<p>answer {i}</p>"} for i in ids], "quota_remaining": 9998})
+        else:
+            self.send_json({"message": "Not Found"}, 404)
+
+
+class FakeApi:
+    """A local stand-in for the GitHub and Stack Exchange APIs."""
+    def __init__(self, issues=7, page_size=3, latency=0.05):
+        self.issues = [
+            {"number": n, "title": f"Issue {n}", "body": f"KeyError in step {n}", "comments": n % 3, "updated_at": f"2024-01-{n:02d}T00:00:00Z", "html_url": f"https://github.com/o/r/issues/{n}"}
+            for n in range(issues, 0, -1)
+        ]
+        self.comments = {issue["number"]: [f"comment {c} on {issue['number']}" for c in range(issue["comments"])] for issue in self.issues}
+        self.questions = [
+            {"question_id": 100 + q, "title": f"Question {q}", "body": f"<p>body {q}</p>", "link": f"https://so/q/{100 + q}", "is_answered": q % 4 != 0, "accepted_answer_id": 500 + q, "last_activity_date": 1700000000 + q}
+            for q in range(8)
+        ]
+        self.page_size = page_size
+        self.latency = latency
+        self.failures = {}
+        self.hits = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeApiHandler)
+        self.server.api = self
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def touch(self, number, title=None):
+        """Updates an issue now, adding it if it is new, and moves it to the top of the listing."""
+        issue = next((i for i in self.issues if i["number"] == number), None)
+        if issue is None:
+            issue = {"number": number, "body": f"new issue {number}", "comments": 0, "html_url": f"https://github.com/o/r/issues/{number}"}
+            self.comments[number] = []
+        else:
+            self.issues.remove(issue)
+        issue.update(title=title or f"Issue {number}", updated_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+        self.issues.insert(0, issue)
+
+    def fail(self, path, times, status=500, headers=None):
+        self.failures[path] = [times, status, headers or {}]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeApiTestCase(unittest.TestCase):
+    def setUp(self):
+        self.api = FakeApi()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmp_dir, "issues.jsonl")
+        self.checkpoint_path = os.path.join(self.tmp_dir, "checkpoint.json")
+
+    def tearDown(self):
+        self.api.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def github(self, **kwargs):
+        kwargs.setdefault("backoff", 0.01)
+        return GitHubIssues("o/r", github_client(base_url=self.api.url, max_workers=4, **kwargs), max_workers=4)
+
+    def read_output(self):
+        with open(self.output) as f:
+            return [json.loads(line) for line in f]
+
+
+class TestRateLimitBudget(unittest.TestCase):
+    def test_waits_for_reset_when_exhausted(self):
+        budget = RateLimitBudget(reserve=1)
+        budget.update(2, time.time() + 0.3)
+        start = time.monotonic()
+        budget.acquire()
+        self.assertLess(time.monotonic() - start, 0.1)
+        budget.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertIsNone(budget.remaining)
+
+    def test_pause(self):
+        budget = RateLimitBudget()
+        budget.pause(0.2)
+        start = time.monotonic()
+        budget.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+
+class TestGitHubIssues(FakeApiTestCase):
+    def test_fetches_issues_and_comments_concurrently(self):
+        records = [record for page in self.github().pages() for record in page.records]
+        self.assertEqual([r["id"] for r in records], list(range(7, 0, -1)))
+        by_id = {r["id"]: r for r in records}
+        self.assertEqual(by_id[5]["comments"], "comment 0 on 5\n\ncomment 1 on 5")
+        self.assertEqual(by_id[3]["comments"], "")
+        # Issues without comments cost no request.
+        comment_hits = [h for h in self.api.hits if h.endswith("/comments")]
+        self.assertEqual(len(comment_hits), sum(1 for n in range(1, 8) if n % 3))
+        self.assertGreater(self.api.max_active, 1)
+
+    def test_retries_server_errors_and_rate_limits(self):
+        self.api.fail("/repos/o/r/issues", 1, 503)
+        self.api.fail("/repos/o/r/issues/1/comments", 1, 403, {"X-RateLimit-Remaining": "0", "Retry-After": "0.2"})
+        source = self.github()
+        start = time.monotonic()
+        records = [record for page in source.pages() for record in page.records]
+        self.assertEqual(len(records), 7)
+        self.assertEqual(records[-1]["comments"], "comment 0 on 1")
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_gives_up_after_max_retries(self):
+        self.api.fail("/repos/o/r/issues", 5, 500)
+        with self.assertRaises(Exception):
+            list(self.github(max_retries=2).pages())
+        self.assertEqual(self.api.hits.count("/repos/o/r/issues"), 3)
+
+    def test_client_spends_advertised_budget(self):
+        client = ApiClient(self.api.url)
+        client.budget.update(5, time.time() + 60)
+        client.get("repos/o/r/issues")
+        self.assertEqual(client.budget.remaining, 4)
+        self.assertEqual(client.requests, 1)
+
+
+class TestStackOverflowQuestions(FakeApiTestCase):
+    def test_batches_accepted_answers(self):
+        source = StackOverflowQuestions(["python", "pandas"], stackexchange_client(base_url=self.api.url + "/2.3"))
+        records = [record for page in source.pages() for record in page.records]
+        self.assertEqual([r["id"] for r in records], [101, 102, 103, 105, 106, 107])
+        self.assertEqual(records[0]["accepted_answer"], "<p>answer 501</p>")
+        answer_hits = [h for h in self.api.hits if h.startswith("/2.3/answers/")]
+        self.assertEqual(answer_hits, ["/2.3/answers/501;502", "/2.3/answers/503;505", "/2.3/answers/506;507"])
+        self.assertLessEqual(source.client.budget.remaining, 9998)
+
+    def test_max_pages(self):
+        source = StackOverflowQuestions(["python"], stackexchange_client(base_url=self.api.url + "/2.3"), max_pages=1)
+        pages = list(source.pages())
+        self.assertEqual(len(pages), 1)
+        self.assertIsNone(pages[0].cursor)
+
+
+class TestCrawler(FakeApiTestCase):
+    def test_interrupted_crawl_resumes(self):
+        self.api.fail("/repos/o/r/issues?page=2", 10, 500)
+        crawler = Crawler(Checkpoint(self.checkpoint_path))
+        with self.assertRaises(Exception):
+            crawler.run(self.github(max_retries=1), self.output)
+        self.assertFalse(os.path.exists(self.output))
+        state = Checkpoint(self.checkpoint_path).get("github:o/r")
+        self.assertTrue(state["cursor"].endswith("page=2"))
+
+        self.api.failures.clear()
+        hits_before = len(self.api.hits)
+        written = Crawler(Checkpoint(self.checkpoint_path)).run(self.github(), self.output)
+        self.assertEqual(written, 4)
+        self.assertEqual([r["id"] for r in self.read_output()], list(range(7, 0, -1)))
+        self.assertNotIn("/repos/o/r/issues/7/comments", self.api.hits[hits_before:])
+        self.assertFalse(os.path.exists(self.output + ".partial"))
+
+    def test_unchanged_source_is_not_recrawled(self):
+        crawler = Crawler(Checkpoint(self.checkpoint_path))
+        self.assertEqual(crawler.run(self.github(), self.output, lambda r: {"id": r["id"], "content": r["title"]}), 7)
+        self.assertEqual(self.read_output()[0], {"id": 7, "content": "Issue 7"})
+        hits_before = len(self.api.hits)
+        self.assertEqual(crawler.run(self.github(), self.output), 0)
+        self.assertEqual(self.api.hits[hits_before:], ["/repos/o/r/issues"])
+        self.assertEqual(len(self.read_output()), 7)
+
+        self.api.issues[0]["title"] = "Issue 7 (edited)"
+        self.assertEqual(crawler.run(self.github(), self.output), 7)
+
+
+class TestIncrementalCrawl(FakeApiTestCase):
+    def to_record(self, issue):
+        return {"id": issue["id"], "content": issue["title"], "source": issue["source"]}
+
+    def test_upserts_only_changed_issues(self):
+        crawler = Crawler(Checkpoint(self.checkpoint_path))
+        crawler.run(self.github(), self.output, self.to_record, incremental=True)
+        self.assertEqual(len(self.read_output()), 7)
+        synced_at = Checkpoint(self.checkpoint_path).get("github:o/r")["synced_at"]
+
+        self.api.touch(5, "Issue 5 (edited)")
+        self.api.touch(8)
+        hits_before = len(self.api.hits)
+        self.assertEqual(crawler.run(self.github(), self.output, self.to_record, incremental=True), 2)
+        # Only the changed issues and their comments are fetched.
+        self.assertEqual(self.api.hits[hits_before:], ["/repos/o/r/issues", "/repos/o/r/issues/5/comments"])
+        records = self.read_output()
+        self.assertEqual([r["id"] for r in records], [7, 6, 5, 4, 3, 2, 1, 8])
+        self.assertEqual(records[2]["content"], "Issue 5 (edited)")
+        self.assertFalse(os.path.exists(self.output + ".changes"))
+        self.assertGreater(Checkpoint(self.checkpoint_path).get("github:o/r")["synced_at"], synced_at)
+
+    def test_unchanged_sync_is_one_conditional_request(self):
+        crawler = Crawler(Checkpoint(self.checkpoint_path))
+        crawler.run(self.github(), self.output, self.to_record)
+        crawler.run(self.github(), self.output, self.to_record, incremental=True)
+        hits_before = len(self.api.hits)
+        self.assertEqual(crawler.run(self.github(), self.output, self.to_record, incremental=True), 0)
+        self.assertEqual(self.api.hits[hits_before:], ["/repos/o/r/issues"])
+        self.assertEqual(len(self.read_output()), 7)
+
+    def test_stackoverflow_since_uses_activity(self):
+        source = StackOverflowQuestions(["python"], stackexchange_client(base_url=self.api.url + "/2.3"))
+        records = [record for page in source.pages(since=1700000005) for record in page.records]
+        self.assertEqual([r["id"] for r in records], [105, 106, 107])
+
+    def test_upsert_jsonl(self):
+        with open(self.output, "w") as f:
+            f.write('{"id": 1, "source": "github", "content": "a"}\n{"id": 1, "source": "stackoverflow", "content": "b"}\n')
+        changes = self.output + ".changes"
+        with open(changes, "w") as f:
+            f.write('{"id": 1, "source": "stackoverflow", "content": "c"}\n{"id": 2, "source": "github", "content": "d"}\n')
+        self.assertEqual(upsert_jsonl(self.output, changes), (1, 1))
+        self.assertEqual([r["content"] for r in self.read_output()], ["a", "c", "d"])
+
+
+class TestCollector(FakeApiTestCase):
+    def make_collector(self, sources, **kwargs):
+        local = os.path.join(self.tmp_dir, "local.jsonl")
+        with open(local, "w") as f:
+            f.write(json.dumps({"id": 1, "document": "<b>Exported</b> ValueError thread", "source": "forum"}) + "\n")
+            f.write(json.dumps({"content": "record without id"}) + "\n")
+        specs = [{"type": "jsonl", "path": local} if spec == "jsonl" else spec for spec in sources]
+        return Collector(
+            specs,
+            output_dir=os.path.join(self.tmp_dir, "corpus"),
+            github_base_url=self.api.url,
+            stackexchange_base_url=self.api.url + "/2.3",
+            **kwargs,
+        )
+
+    def test_sources_are_collected_into_shards(self):
+        corpus = os.path.join(self.tmp_dir, "corpus.jsonl")
+        collector = self.make_collector([{"type": "github", "repo": "o/r"}, {"type": "stackoverflow", "tags": ["python"]}, "jsonl"], corpus_path=corpus)
+        written = collector.run()
+        self.assertEqual(written, {"github:o/r": 7, "stackoverflow:python": 6, f"jsonl:{self.tmp_dir}/local.jsonl": 2})
+        shards = sorted(os.listdir(os.path.join(self.tmp_dir, "corpus")))
+        self.assertEqual(shards, ["checkpoint.json", "github-o-r.jsonl", shard_name(f"jsonl:{self.tmp_dir}/local.jsonl"), "stackoverflow-python.jsonl"])
+        with open(os.path.join(self.tmp_dir, "corpus", "stackoverflow-python.jsonl")) as f:
+            question = json.loads(f.readline())
+        self.assertEqual(question["content"], "Question 1 body 1 answer 501")
+        with open(corpus) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 15)
+        self.assertIn({"id": 1, "content": "Exported ValueError thread", "source": "forum", "repo_or_tag": None, "faiss_id": 13}, records)
+        self.assertEqual([record["faiss_id"] for record in records], list(range(15)))
+
+        hits_before = len(self.api.hits)
+        self.assertEqual(sum(collector.run(incremental=True).values()), 0)
+        self.assertEqual(self.api.hits[hits_before:].count("/repos/o/r/issues"), 1)
+
+    def test_shards_merge_into_a_binary_corpus(self):
+        corpus = os.path.join(self.tmp_dir, "corpus.corpus")
+        self.make_collector([{"type": "github", "repo": "o/r"}, "jsonl"], corpus_path=corpus).run()
+        with CorpusStore(corpus) as store:
+            self.assertEqual(len(store), 9)
+            self.assertEqual(store[7], {"id": 1, "source": "forum", "repo_or_tag": None, "content": "Exported ValueError thread", "faiss_id": 7})
+
+    def test_merged_rows_stay_stable_when_an_earlier_shard_grows(self):
+        first, second = (os.path.join(self.tmp_dir, name) for name in ("a.jsonl", "b.jsonl"))
+
+        def write_shard(path, records):
+            with open(path, "w") as f:
+                for source, i, content in records:
+                    f.write(json.dumps({"id": i, "source": source, "content": content}) + "\n")
+
+        for name in ("corpus.jsonl", "corpus.corpus"):
+            with self.subTest(name=name):
+                corpus = os.path.join(self.tmp_dir, name)
+                write_shard(first, [("github", 1, "github 1"), ("github", 2, "github 2")])
+                write_shard(second, [("stackoverflow", 1, "stackoverflow 1")])
+                self.assertEqual(merge_shards([first, second], corpus), 3)
+                write_shard(first, [("github", 1, "github 1 edited"), ("github", 2, "github 2"), ("github", 3, "github 3")])
+                self.assertEqual(merge_shards([first, second], corpus), 4)
+                store = open_metadata_store(corpus)
+                try:
+                    self.assertEqual(store.ids().tolist(), [0, 1, 2, 3])
+                    self.assertEqual([store[i]["content"] for i in range(4)], ["github 1 edited", "github 2", "stackoverflow 1", "github 3"])
+                finally:
+                    store.close()
+
+    def test_exported_github_record_is_passed_through(self):
+        local = os.path.join(self.tmp_dir, "openai_issues.jsonl")
+        with open(local, "w") as f:
+            f.write(json.dumps({"id": 2472, "content": "Upload gives <b>400</b>", "source": "github", "repo_or_tag": "openai/openai-python"}) + "\n")
+        collector = Collector([{"type": "jsonl", "path": local}], output_dir=os.path.join(self.tmp_dir, "corpus"))
+        self.assertEqual(collector.run(), {f"jsonl:{local}": 1})
+        self.assertEqual(
+            to_record({"id": 2472, "content": "Upload gives <b>400</b>", "source": "github", "repo_or_tag": "openai/openai-python"}),
+            {"id": 2472, "content": "Upload gives 400", "source": "github", "repo_or_tag": "openai/openai-python"},
+        )
+
+    def test_failed_source_does_not_stop_the_others(self):
+        collector = self.make_collector([{"type": "github", "repo": "o/missing"}, {"type": "github", "repo": "o/r"}])
+        with self.assertRaises(RuntimeError):
+            collector.run()
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, "corpus", "github-o-r.jsonl")))
+
+    def test_config_validation(self):
+        with self.assertRaises(ValueError):
+            self.make_collector([{"type": "gitlab", "repo": "o/r"}])
+        with self.assertRaises(ValueError):
+            self.make_collector([{"type": "github", "repo": "o/r"}, {"type": "github", "repo": "o/r"}])
+
+    def test_from_config(self):
+        config = os.path.join(self.tmp_dir, "sources.json")
+        with open(config, "w") as f:
+            json.dump({"sources": [{"type": "github", "repo": "o/r"}], "output_dir": os.path.join(self.tmp_dir, "out")}, f)
+        collector = Collector.from_config(config, github_base_url=self.api.url)
+        self.assertEqual(collector.run(), {"github:o/r": 7})
+
+
+if __name__ == '__main__':
+    unittest.main()
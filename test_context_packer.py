@@ -0,0 +1,63 @@
+import unittest
+import asyncio
+from context_packer import ContextPacker, estimate_tokens, split_passages
+from embedder import BatchEmbedder, HashEmbeddingBackend
+
+ERROR = "TypeError: can only concatenate str (not int) to str in format_total"
+
+RELEVANT = "Fix: format_total concatenates str and int. Wrap the count in str() to avoid the TypeError."
+FILLER = "\n\n".join(f"Unrelated discussion paragraph {i} about packaging, wheels and release notes." for i in range(40))
+
+
+class TestContextPacker(unittest.TestCase):
+    def setUp(self):
+        self.embedder = BatchEmbedder(HashEmbeddingBackend(dim=256))
+
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("a + b"), 3)
+        self.assertGreater(estimate_tokens("a_very_long_identifier_name"), 1)
+
+    def test_split_passages_respects_size(self):
+        passages = split_passages(FILLER, max_tokens=40)
+        self.assertGreater(len(passages), 1)
+        self.assertTrue(all(estimate_tokens(p) <= 40 for p in passages))
+        self.assertEqual(" ".join(" ".join(passages).split()), " ".join(FILLER.split()))
+
+    def test_budget_and_relevance(self):
+        docs = [
+            {"id": 1, "source": "github", "content": FILLER},
+            {"id": 2, "source": "stackoverflow", "content": FILLER + "\n\n" + RELEVANT},
+        ]
+        packer = ContextPacker(self.embedder, token_budget=60, passage_tokens=30)
+        packed = packer.pack(ERROR, docs)
+        total = sum(estimate_tokens(doc["content"]) for doc in packed)
+        self.assertLessEqual(total, 60)
+        self.assertIn(RELEVANT, "\n".join(doc["content"] for doc in packed))
+        self.assertEqual(packed[-1]["id"], 2)
+        self.assertEqual(packed[-1]["source"], "stackoverflow")
+
+    def test_duplicate_documents_are_packed_once(self):
+        docs = [{"id": i, "content": RELEVANT} for i in range(3)]
+        packed = ContextPacker(self.embedder, token_budget=1000).pack(ERROR, docs)
+        self.assertEqual(len(packed), 1)
+        self.assertEqual(packed[0]["id"], 0)
+
+    def test_near_duplicates_are_skipped(self):
+        docs = [{"id": 1, "content": RELEVANT}, {"id": 2, "content": RELEVANT + " Thanks!"}]
+        packed = ContextPacker(self.embedder, token_budget=1000, redundancy_threshold=0.9).pack(ERROR, docs)
+        self.assertEqual([doc["id"] for doc in packed], [1])
+
+    def test_without_embedder_keeps_retrieval_order(self):
+        docs = [{"id": 1, "content": "first doc"}, {"id": 2, "content": "second doc"}]
+        packed = ContextPacker(token_budget=2).pack(ERROR, docs)
+        self.assertEqual(packed, [{"id": 1, "content": "first doc"}])
+
+    def test_pack_async_matches_pack(self):
+        docs = [{"id": 1, "content": FILLER + "\n\n" + RELEVANT}]
+        packer = ContextPacker(self.embedder, token_budget=80, passage_tokens=30)
+        self.assertEqual(asyncio.run(packer.pack_async(ERROR, docs)), packer.pack(ERROR, docs))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from corpus import CorpusStore, CorpusWriter, convert, write_corpus
+from metadata_store import open_metadata_store
+
+
+class TestCorpus(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "issues.corpus")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        records = [{"id": i, "content": f"document {i} ✓", "source": "github"} for i in range(100)]
+        records.append({"content": ""})
+        self.assertEqual(write_corpus(self.path, records), 101)
+        with CorpusStore(self.path) as store:
+            self.assertEqual(len(store), 101)
+            self.assertEqual(store[42], records[42])
+            self.assertEqual(store.text(7), "document 7 ✓")
+            self.assertEqual([r["id"] for r in store.get_many([99, 0, 7])], [99, 0, 7])
+            self.assertEqual(store[100], {"content": ""})
+            self.assertEqual(list(store), records)
+            with self.assertRaises(KeyError):
+                store[101]
+
+    def test_reads_are_zero_copy(self):
+        write_corpus(self.path, [{"id": 1, "content": "KeyError: 'x'"}])
+        store = CorpusStore(self.path)
+        self.assertFalse(store.offsets.flags.owndata)
+        view = store.text_view(0)
+        self.assertIsInstance(view, memoryview)
+        self.assertEqual(view.tobytes(), b"KeyError: 'x'")
+        view.release()
+        store.close()
+
+    def test_lookup_by_faiss_id(self):
+        write_corpus(self.path, [{"faiss_id": 9, "document": "b"}, {"faiss_id": 3, "document": "a"}, {"faiss_id": 20, "document": "c"}])
+        with CorpusStore(self.path) as store:
+            self.assertEqual(store[3], {"content": "a", "faiss_id": 3})
+            self.assertEqual([store.text(store.row_of(i)) for i in (20, 9)], ["c", "b"])
+            for missing in (0, 4, 21):
+                with self.assertRaises(KeyError):
+                    store[missing]
+            # Unsorted ids are looked up in a sorted column of the map, not a per-lookup copy.
+            self.assertFalse(store._sorted_ids.flags.writeable)
+            np.testing.assert_array_equal(store._sorted_ids, [3, 9, 20])
+
+    def test_unfinished_or_foreign_files_are_rejected(self):
+        writer = CorpusWriter(self.path)
+        writer.write({"content": "a"})
+        self.assertFalse(os.path.exists(self.path))
+        writer.abort()
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+        with open(self.path, "w") as f:
+            f.write(json.dumps({"content": "a"}) * 10)
+        with self.assertRaises(ValueError):
+            CorpusStore(self.path)
+
+    def test_convert_unifies_schemas(self):
+        metadata = os.path.join(self.tmp_dir, "metadata.json")
+        with open(metadata, "w") as f:
+            json.dump([{"faiss_id": 1, "id": 5, "document": "indexed"}, {"faiss_id": 2, "id": 6, "document": "also"}], f)
+        jsonl = os.path.join(self.tmp_dir, "issues.jsonl")
+        with open(jsonl, "w") as f:
+            f.write(json.dumps({"id": 5, "content": "collected", "code": [{"code": "x()", "language": ""}]}) + "\n\n")
+
+        self.assertEqual(convert(metadata, self.path), 2)
+        store = open_metadata_store(self.path)
+        self.assertIsInstance(store, CorpusStore)
+        self.assertEqual(store[2], {"id": 6, "content": "also", "faiss_id": 2})
+        np.testing.assert_array_equal(store.faiss_ids, [1, 2])
+        store.close()
+
+        self.assertEqual(convert(jsonl, self.path), 1)
+        with CorpusStore(self.path) as store:
+            self.assertEqual(store[0], {"id": 5, "code": [{"code": "x()", "language": ""}], "content": "collected"})
+
+
+if __name__ == '__main__':
+    unittest.main()
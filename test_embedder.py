@@ -0,0 +1,76 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import asyncio
+import numpy as np
+from embedder import BatchEmbedder, EmbeddingBackend, GeminiEmbeddingBackend, HashEmbeddingBackend
+
+
+class FlakyBackend(EmbeddingBackend):
+    """Fails the first `failures` requests with a rate-limit error."""
+    def __init__(self, failures):
+        self.failures = failures
+        self.inner = HashEmbeddingBackend(dim=16)
+
+    def embed_batch(self, texts, task_type):
+        if self.failures > 0:
+            self.failures -= 1
+            raise Exception("429 Resource has been exhausted")
+        return self.inner.embed_batch(texts, task_type)
+
+
+class TestBatchEmbedder(unittest.TestCase):
+
+    def test_batches_preserve_order(self):
+        backend = HashEmbeddingBackend(dim=16)
+        texts = [f"document number {i}" for i in range(25)]
+        embedder = BatchEmbedder(backend, max_batch_size=4, max_concurrency=3)
+        embeddings = embedder.embed(texts)
+        self.assertEqual(embeddings.shape, (25, 16))
+        self.assertEqual(backend.calls, 7)
+        expected = np.array([backend._embed_one(t) for t in texts])
+        np.testing.assert_array_equal(embeddings, expected)
+
+    def test_batches_respect_char_limit(self):
+        embedder = BatchEmbedder(HashEmbeddingBackend(), max_batch_size=100, max_batch_chars=10)
+        batches = embedder._make_batches(["aaaa", "bbbb", "cccc", "dddddddddddd", "e"])
+        self.assertEqual(batches, [[0, 1], [2], [3], [4]])
+
+    def test_retries_on_rate_limit(self):
+        embedder = BatchEmbedder(FlakyBackend(failures=2), max_concurrency=2, initial_backoff=0.01)
+        embeddings = embedder.embed(["a", "b", "c"])
+        self.assertEqual(embeddings.shape, (3, 16))
+        self.assertEqual(embedder.last_stats["retries"], 2)
+        self.assertGreater(embedder.last_stats["texts_per_second"], 0)
+
+    def test_gives_up_after_max_retries(self):
+        embedder = BatchEmbedder(FlakyBackend(failures=5), max_retries=1, initial_backoff=0.01)
+        with self.assertRaises(Exception):
+            embedder.embed(["a"])
+
+    def test_embed_async_matches_sync(self):
+        backend = HashEmbeddingBackend(dim=16)
+        embedder = BatchEmbedder(backend, max_batch_size=3, max_concurrency=2)
+        texts = [f"query {i % 4}" for i in range(10)]
+        embeddings = asyncio.run(embedder.embed_async(texts))
+        np.testing.assert_array_equal(embeddings, embedder.embed(texts))
+        # 4 distinct texts in batches of 3 -> 2 requests each time.
+        self.assertEqual(backend.calls, 4)
+
+    def test_embed_async_retries_on_rate_limit(self):
+        embedder = BatchEmbedder(FlakyBackend(failures=1), initial_backoff=0.01)
+        embeddings = asyncio.run(embedder.embed_async(["a", "b"]))
+        self.assertEqual(embeddings.shape, (2, 16))
+        self.assertEqual(embedder.last_stats["retries"], 1)
+
+    @patch('embedder.genai.embed_content')
+    def test_gemini_backend_batches_requests(self, mock_embed_content):
+        mock_embed_content.return_value = {"embedding": [[0.1, 0.2], [0.3, 0.4]]}
+        embedder = BatchEmbedder(GeminiEmbeddingBackend(), max_batch_size=2)
+        embeddings = embedder.embed(["first", "second"])
+        self.assertEqual(embeddings.shape, (2, 2))
+        mock_embed_content.assert_called_once()
+        self.assertEqual(mock_embed_content.call_args.kwargs["content"], ["first", "second"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+import os
+from unittest.mock import patch
+import shutil
+import tempfile
+import numpy as np
+from embedder import BatchEmbedder, HashEmbeddingBackend
+from embedding_cache import _LOG_RECORD, EmbeddingCache
+from indexer import Indexer
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_round_trip_across_instances(self):
+        cache = EmbeddingCache(self.cache_dir)
+        keys = [EmbeddingCache.make_key("m", "t", text) for text in ["a", "b"]]
+        cache.put_many(keys, np.array([[1, 2], [3, 4]], dtype="float32"))
+        cache.flush()
+
+        reopened = EmbeddingCache(self.cache_dir)
+        results = reopened.get_many(keys + [EmbeddingCache.make_key("m", "t", "c")])
+        np.testing.assert_array_equal(results[0], [1, 2])
+        np.testing.assert_array_equal(results[1], [3, 4])
+        self.assertIsNone(results[2])
+        self.assertEqual(reopened.stats()["hits"], 2)
+        self.assertEqual(reopened.stats()["misses"], 1)
+
+    def test_key_normalizes_whitespace_and_includes_task_type(self):
+        self.assertEqual(EmbeddingCache.make_key("m", "t", "a  b\n"), EmbeddingCache.make_key("m", "t", "a b"))
+        self.assertNotEqual(EmbeddingCache.make_key("m", "t1", "a"), EmbeddingCache.make_key("m", "t2", "a"))
+
+    def test_lru_eviction(self):
+        cache = EmbeddingCache(self.cache_dir, max_entries=2)
+        k1, k2, k3 = (EmbeddingCache.make_key("m", "t", text) for text in ["1", "2", "3"])
+        cache.put_many([k1, k2], np.eye(2, dtype="float32"))
+        cache.get_many([k1])
+        cache.put_many([k3], np.ones((1, 2), dtype="float32"))
+        cache.flush()
+
+        reopened = EmbeddingCache(self.cache_dir)
+        self.assertEqual(len(reopened), 2)
+        hit1, hit2, hit3 = reopened.get_many([k1, k2, k3])
+        np.testing.assert_array_equal(hit1, [1, 0])
+        self.assertIsNone(hit2)
+        np.testing.assert_array_equal(hit3, [1, 1])
+
+    def test_writers_sharing_a_directory_never_swap_vectors(self):
+        first = EmbeddingCache(self.cache_dir, max_entries=3)
+        second = EmbeddingCache(self.cache_dir, max_entries=3)
+        keys = [EmbeddingCache.make_key("m", "t", str(i)) for i in range(6)]
+        vectors = np.arange(12, dtype="float32").reshape(6, 2)
+        for i in range(6):
+            writer = first if i % 2 == 0 else second
+            writer.put_many([keys[i]], vectors[i:i + 1])
+            writer.flush()
+            for reader in (first, second):
+                for key, hit in zip(keys, reader.get_many(keys)):
+                    if hit is not None:
+                        np.testing.assert_array_equal(hit, vectors[keys.index(key)])
+        self.assertEqual(len(EmbeddingCache(self.cache_dir)), 3)
+
+    def test_evicted_key_is_unlinked_before_its_slot_is_reused(self):
+        cache = EmbeddingCache(self.cache_dir, max_entries=1)
+        k1, k2 = (EmbeddingCache.make_key("m", "t", text) for text in ["1", "2"])
+        cache.put_many([k1], np.zeros((1, 2), dtype="float32"))
+        cache.put_many([k2], np.ones((1, 2), dtype="float32"))
+        log = np.fromfile(os.path.join(self.cache_dir, "keys.log"), dtype=_LOG_RECORD)
+        self.assertEqual([(bytes(key), slot) for key, slot in log.tolist()], [(k1, 0), (k1, -1), (k2, 0)])
+
+    def test_reopening_keeps_the_stored_capacity(self):
+        cache = EmbeddingCache(self.cache_dir, max_entries=2)
+        cache.put_many([EmbeddingCache.make_key("m", "t", "a")], np.ones((1, 2), dtype="float32"))
+        with self.assertLogs("embedding_cache", level="WARNING"):
+            reopened = EmbeddingCache(self.cache_dir, max_entries=10)
+        self.assertEqual(reopened.max_entries, 2)
+        self.assertEqual(EmbeddingCache(self.cache_dir).max_entries, 2)
+
+    def test_embedder_only_requests_misses(self):
+        backend = HashEmbeddingBackend(dim=8)
+        embedder = BatchEmbedder(backend, cache=EmbeddingCache(self.cache_dir))
+        first = embedder.embed(["x", "y", "z"])
+        self.assertEqual(backend.calls, 1)
+
+        embedder = BatchEmbedder(backend, max_batch_size=1, cache=EmbeddingCache(self.cache_dir))
+        second = embedder.embed(["x", "y", "changed"])
+        self.assertEqual(backend.calls, 2)
+        self.assertEqual(embedder.last_stats["embedded"], 1)
+        np.testing.assert_array_equal(first[:2], second[:2])
+
+    @patch('indexer.stackapi.StackAPI')
+    @patch('indexer.github.Github')
+    def test_rebuild_after_one_change_makes_one_call(self, mock_github, mock_stackapi):
+        backend = HashEmbeddingBackend(dim=8)
+        documents = [{"source": "github", "url": "", "id": i, "document": f"issue {i}"} for i in range(50)]
+
+        def build(docs):
+            embedder = BatchEmbedder(backend, max_batch_size=1, cache=EmbeddingCache(self.cache_dir))
+            indexer = Indexer("owner/repo", ["python"], github_token="t", google_api_key="k", embedder=embedder)
+            with patch.object(Indexer, "_get_github_issues", return_value=list(docs)), \
+                    patch.object(Indexer, "_get_stackoverflow_questions", return_value=[]):
+                indexer.build_index()
+            return indexer
+
+        build(documents)
+        calls_before = backend.calls
+        documents[7] = {**documents[7], "document": "issue 7 with a new comment"}
+        indexer = build(documents)
+        self.assertEqual(backend.calls - calls_before, 1)
+        self.assertEqual(indexer.index.ntotal, 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
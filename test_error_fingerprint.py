@@ -0,0 +1,81 @@
+import unittest
+from error_fingerprint import compact_query, fingerprint, message_template, normalize_path, normalize_text, parse_traceback
+
+TRACEBACK = '''Traceback (most recent call last):
+  File "/Users/alice/proj/report.py", line 10, in <module>
+    main()
+  File "/Users/alice/proj/report.py", line 7, in main
+    print(format_total(items))
+  File "/Users/alice/.venv/lib/python3.12/site-packages/reports/fmt.py", line 42, in format_total
+    return "total: " + len(items)
+TypeError: can only concatenate str (not "int") to str
+'''
+
+# The same bug on another machine, with edited line numbers.
+SAME_BUG = TRACEBACK.replace("/Users/alice", "/home/bob").replace("line 42", "line 57").replace("line 7,", "line 9,")
+
+CHAINED = '''Traceback (most recent call last):
+  File "loader.py", line 3, in load
+    return cache[key]
+KeyError: 'config'
+
+During handling of the above exception, another exception occurred:
+
+Traceback (most recent call last):
+  File "loader.py", line 5, in load
+    raise LookupError(f"missing {key} at 0x7f3a2c1b9e50")
+LookupError: missing config at 0x7f3a2c1b9e50
+'''
+
+
+class TestErrorFingerprint(unittest.TestCase):
+    def test_parse_traceback(self):
+        parsed = parse_traceback(TRACEBACK)
+        self.assertEqual(parsed.exception_type, "TypeError")
+        self.assertEqual(parsed.message, 'can only concatenate str (not "int") to str')
+        self.assertEqual([frame.signature for frame in parsed.frames], [
+            "report.py:<module>", "report.py:main", "reports/fmt.py:format_total",
+        ])
+        self.assertEqual(parsed.frames[-1].code, 'return "total: " + len(items)')
+        self.assertEqual(parsed.frames[-1].line, 42)
+
+    def test_fingerprint_ignores_machine_noise(self):
+        self.assertEqual(fingerprint(TRACEBACK), fingerprint(SAME_BUG))
+        self.assertEqual(normalize_text(TRACEBACK), normalize_text(SAME_BUG))
+        other_bug = TRACEBACK.replace("(not \"int\")", "(not \"NoneType\")")
+        self.assertNotEqual(fingerprint(TRACEBACK), fingerprint(other_bug))
+
+    def test_chained_exceptions_use_the_last_traceback(self):
+        parsed = parse_traceback(CHAINED)
+        self.assertEqual(parsed.exception_type, "LookupError")
+        self.assertEqual(parsed.message_template, "missing config at 0x?")
+        self.assertEqual(len(parsed.frames), 1)
+
+    def test_message_template(self):
+        self.assertEqual(message_template("KeyError: 'choices'"), "KeyError: 'choices'")
+        self.assertEqual(
+            message_template("Error code: 400 - 'Invalid file data 12 bytes' for /tmp/upload/a.pdf after 1500 ms"),
+            "Error code: 400 - '<str>' for <path> after <n> ms",
+        )
+
+    def test_normalize_path(self):
+        self.assertEqual(normalize_path("C:\\Users\\bob\\venv\\Lib\\site-packages\\numpy\\core\\fromnumeric.py"), "numpy/core/fromnumeric.py")
+        self.assertEqual(normalize_path("/usr/lib/python3.11/json/decoder.py"), "json/decoder.py")
+        self.assertEqual(normalize_path("/home/bob/project/app.py"), "app.py")
+        self.assertEqual(normalize_path("<frozen importlib._bootstrap>"), "<frozen importlib._bootstrap>")
+
+    def test_compact_query(self):
+        query = compact_query(TRACEBACK)
+        self.assertTrue(query.startswith('TypeError: can only concatenate str (not "int") to str\nreports/fmt.py in format_total'))
+        self.assertNotIn("/Users", query)
+        self.assertEqual(compact_query("No module named   foo"), "No module named foo")
+
+    def test_bare_exception_line(self):
+        parsed = parse_traceback("resp = client.get()\nopenai.APITimeoutError: Request timed out.")
+        self.assertEqual(parsed.exception_type, "openai.APITimeoutError")
+        self.assertEqual(parsed.frames, [])
+        self.assertIsNone(parse_traceback("it just hangs"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+from corpus import write_corpus
+from exact_match import EXACT_MATCH_FILE, ExactMatchIndex, MinHasher, build_for_index, build_from_metadata
+
+TRACEBACK = '''Traceback (most recent call last):
+  File "/Users/ann/proj/upload.py", line 12, in main
+    client.files.create(file=handle)
+  File "/Users/ann/.venv/lib/python3.12/site-packages/openai/_base_client.py", line 1584, in request
+    raise self._make_status_error_from_response(err.response) from None
+openai.BadRequestError: Error code: 400 - Invalid file data
+'''
+
+# Collector output flattens whitespace, so indexed tracebacks are often on one line.
+FLATTENED_ISSUE = "Uploading a PDF fails. " + " ".join(TRACEBACK.split()) + " Any ideas?"
+LONG_ISSUE = " ".join(f"Step {i}: the widget renders blank after resizing the panel." for i in range(12))
+DOCS = ["Installing on Windows fails with a compiler error", FLATTENED_ISSUE, LONG_ISSUE]
+
+
+class TestExactMatchIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = ExactMatchIndex.build(DOCS, ids=[10, 11, 12])
+
+    def test_signature_hit_ignores_paths_and_line_numbers(self):
+        query = TRACEBACK.replace("/Users/ann", "/home/bob").replace("line 12", "line 40")
+        match = self.index.lookup("Why does this happen?\n" + query)
+        self.assertEqual(match.ids, [11])
+        self.assertEqual(match.kind, "signature")
+        self.assertEqual(match.similarity, 1.0)
+
+    def test_signature_hit_needs_the_same_message(self):
+        query = TRACEBACK.replace("Error code: 400 - Invalid file data", "Error code: 400 - Unsupported model")
+        self.assertIsNone(self.index.lookup(query))
+
+    def test_near_duplicate_hit(self):
+        match = self.index.lookup(LONG_ISSUE.replace("Step 11", "Step eleven"))
+        self.assertEqual(match.ids, [12])
+        self.assertEqual(match.kind, "near_duplicate")
+        self.assertGreaterEqual(match.similarity, 0.8)
+
+    def test_miss(self):
+        self.assertIsNone(self.index.lookup("ZeroDivisionError: division by zero"))
+        other = TRACEBACK.replace("in request", "in send")
+        self.assertIsNone(self.index.lookup(other.replace("Invalid file data", "timeout while sending the request body")))
+
+    def test_update_drops_and_adds_units(self):
+        updated = self.index.update([11], [TRACEBACK, LONG_ISSUE.replace("widget", "chart")], [20, 21])
+        self.assertEqual(updated.lookup(TRACEBACK).ids, [20])
+        self.assertEqual(updated.lookup(LONG_ISSUE).ids, [12])
+        self.assertEqual(updated.lookup(LONG_ISSUE.replace("widget", "chart")).ids, [21])
+        self.assertNotIn(11, updated.minhash_ids.tolist())
+
+    def test_build_from_metadata_uses_the_stores_ids(self):
+        directory = tempfile.mkdtemp()
+        try:
+            metadata_path = os.path.join(directory, "metadata.corpus")
+            write_corpus(metadata_path, [{"faiss_id": faiss_id, "document": text} for faiss_id, text in zip([30, 5, 8], DOCS)])
+            index = build_from_metadata(metadata_path, directory)
+            self.assertEqual(index.lookup(TRACEBACK).ids, [5])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_build_from_metadata_refuses_a_versioned_index(self):
+        directory = tempfile.mkdtemp()
+        try:
+            version = os.path.join(directory, "index.versions", "1")
+            os.makedirs(version)
+            os.symlink(version, os.path.join(directory, "index"))
+            metadata_path = os.path.join(directory, "metadata.corpus")
+            write_corpus(metadata_path, [{"faiss_id": 0, "document": DOCS[0]}])
+            with self.assertRaises(ValueError):
+                build_from_metadata(metadata_path, os.path.join(directory, "index"))
+            self.assertEqual(os.listdir(version), [])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_minhash_estimates_jaccard(self):
+        hasher = MinHasher(num_perm=128)
+        a = " ".join(f"w{i}" for i in range(200))
+        b = " ".join(f"w{i}" for i in range(100, 300))
+        similarity = float((hasher.signature(a) == hasher.signature(b)).mean())
+        # 98 shared shingles out of 298.
+        self.assertAlmostEqual(similarity, 98 / 298, delta=0.12)
+
+    def test_save_load_and_chunk_ids(self):
+        directory = tempfile.mkdtemp()
+        try:
+            chunks = np.array([[0, 0, 10], [1, 0, 23], [1, 23, len(FLATTENED_ISSUE)], [-1, 0, 5]], dtype="int32")
+            texts = {0: DOCS[0], 1: FLATTENED_ISSUE}
+            index = build_for_index(texts.get, [0, 1], chunks)
+            path = os.path.join(directory, EXACT_MATCH_FILE)
+            index.save(path)
+            loaded = ExactMatchIndex.load(path)
+            self.assertEqual(loaded.lookup(TRACEBACK).ids, [2])
+            self.assertEqual(loaded.hasher.num_perm, index.hasher.num_perm)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
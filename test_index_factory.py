@@ -0,0 +1,53 @@
+import unittest
+import faiss
+import numpy as np
+from index_factory import INDEX_TYPES, build_index, sample_training_set, search_parameters, supports_remove
+
+
+class TestIndexFactory(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.corpus = rng.standard_normal((2000, 32)).astype("float32")
+        faiss.normalize_L2(self.corpus)
+
+    def test_every_index_type_finds_exact_matches(self):
+        for index_type in INDEX_TYPES:
+            with self.subTest(index_type=index_type):
+                index = build_index(self.corpus, index_type, metric="ip")
+                self.assertEqual(index.ntotal, 2000)
+                params = search_parameters(index, nprobe=index.nlist if hasattr(index, "nlist") else None, ef_search=128)
+                _, found = index.search(self.corpus[:20], 1, params=params)
+                if index_type != "ivf_pq":
+                    self.assertEqual(found[:, 0].tolist(), list(range(20)))
+
+    def test_ids_are_preserved(self):
+        ids = np.arange(2000, dtype="int64") * 7
+        index = build_index(self.corpus, "ivf_flat", ids=ids)
+        params = search_parameters(index, nprobe=64)
+        self.assertIsInstance(params, faiss.SearchParametersIVF)
+        _, found = index.search(self.corpus[5:6], 1, params=params)
+        self.assertEqual(found[0, 0], 35)
+
+    def test_search_parameters_only_apply_to_matching_types(self):
+        self.assertIsNone(search_parameters(build_index(self.corpus, "flat"), nprobe=4, ef_search=4))
+        self.assertIsNone(search_parameters(build_index(self.corpus, "hnsw"), nprobe=4))
+        self.assertIsInstance(search_parameters(build_index(self.corpus, "hnsw"), ef_search=4), faiss.SearchParametersHNSW)
+
+    def test_training_sample_is_bounded_and_reproducible(self):
+        first = sample_training_set(self.corpus, 100, seed=1)
+        second = sample_training_set(self.corpus, 100, seed=1)
+        self.assertEqual(first.shape, (100, 32))
+        np.testing.assert_array_equal(first, second)
+
+    def test_supports_remove(self):
+        ids = np.arange(2000, dtype="int64")
+        self.assertTrue(supports_remove(build_index(self.corpus, "ivf_flat", ids=ids)))
+        self.assertFalse(supports_remove(build_index(self.corpus, "hnsw", ids=ids)))
+
+    def test_unknown_index_type(self):
+        with self.assertRaises(ValueError):
+            build_index(self.corpus, "lsh")
+
+
+if __name__ == '__main__':
+    unittest.main()
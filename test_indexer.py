@@ -0,0 +1,231 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import json
+import os
+import shutil
+import tempfile
+import bm25
+import faiss
+import numpy as np
+from chunker import Chunker
+from corpus import CorpusStore
+from embedder import BatchEmbedder, HashEmbeddingBackend
+from indexer import Indexer
+from retriever import Retriever
+
+
+def make_doc(i, text=None):
+    return {"source": "github", "url": f"https://example.com/{i}", "id": i, "document": text or f"issue {i} TypeError"}
+
+
+@patch('indexer.stackapi.StackAPI')
+@patch('indexer.github.Github')
+class TestIncrementalIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index_dir = os.path.join(self.directory, "index")
+        self.backend = HashEmbeddingBackend(dim=16)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_indexer(self, documents, incremental, index_type="flat", chunker=None):
+        embedder = BatchEmbedder(self.backend, max_batch_size=1)
+        indexer = Indexer("owner/repo", ["python"], github_token="t", google_api_key="k", embedder=embedder, index_type=index_type, chunker=chunker)
+        with patch.object(Indexer, "_get_github_issues", return_value=list(documents)), \
+                patch.object(Indexer, "_get_stackoverflow_questions", return_value=[]):
+            if incremental:
+                indexer.update_index(self.index_dir)
+            else:
+                indexer.build_index()
+                indexer.save_index(self.index_dir)
+        return indexer
+
+    def test_update_without_manifest_builds_full_index(self, mock_github, mock_stackapi):
+        indexer = self.run_indexer([make_doc(i) for i in range(5)], incremental=True)
+        self.assertEqual(indexer.index.ntotal, 5)
+        self.assertTrue(os.path.exists(os.path.join(self.index_dir, "manifest.json")))
+
+    def test_update_embeds_only_the_change_set(self, mock_github, mock_stackapi):
+        documents = [make_doc(i) for i in range(10)]
+        self.run_indexer(documents, incremental=False)
+        calls_before = self.backend.calls
+
+        documents[3] = make_doc(3, "issue 3 now has a stack trace")
+        del documents[5]
+        documents.append(make_doc(10))
+        indexer = self.run_indexer(documents, incremental=True)
+
+        self.assertEqual(self.backend.calls - calls_before, 2)
+        self.assertEqual(indexer.index.ntotal, 10)
+        with open(os.path.join(self.index_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+        self.assertNotIn("github:5", manifest["documents"])
+        self.assertEqual(manifest["documents"]["github:10"]["faiss_id"], 10)
+        self.assertEqual(leftover_tmp_files(self.index_dir), [])
+
+        results = indexer.query_index("issue 3 now has a stack trace", top_k=1)
+        self.assertEqual(results[0]["metadata"]["id"], 3)
+
+    def test_update_changes_sidecars_without_rebuilding_them(self, mock_github, mock_stackapi):
+        documents = [make_doc(i) for i in range(6)]
+        self.run_indexer(documents, incremental=False)
+        documents[2] = make_doc(2, "issue 2 raises ZeroDivisionError")
+        del documents[4]
+        with patch("bm25.build_for_index") as build_bm25, patch("exact_match.build_for_index") as build_exact:
+            self.run_indexer(documents, incremental=True)
+        build_bm25.assert_not_called()
+        build_exact.assert_not_called()
+        lexical = bm25.BM25Index.load(os.path.join(self.index_dir, bm25.BM25_FILE))
+        self.assertEqual(sorted(lexical.ids.tolist()), [0, 1, 2, 3, 5])
+        self.assertEqual(lexical.search("ZeroDivisionError", 2)[1].tolist(), [2, -1])
+
+    def test_saves_switch_a_symlink_between_versions(self, mock_github, mock_stackapi):
+        os.makedirs(self.index_dir)
+        with open(os.path.join(self.index_dir, "index.faiss"), "w") as f:
+            f.write("unversioned")
+        documents = [make_doc(i) for i in range(3)]
+        self.run_indexer(documents, incremental=False)
+        self.assertTrue(os.path.islink(self.index_dir))
+        first = os.path.realpath(self.index_dir)
+        self.assertEqual(len(os.listdir(self.index_dir + ".versions")), 2)
+
+        documents.append(make_doc(3))
+        self.run_indexer(documents, incremental=True)
+        versions = os.listdir(self.index_dir + ".versions")
+        self.assertEqual(len(versions), 2)
+        self.assertNotIn("0-unversioned", versions)
+        self.assertNotEqual(os.path.realpath(self.index_dir), first)
+        # The previous version is still whole for readers that resolved it before the switch.
+        with CorpusStore(os.path.join(first, "metadata.corpus")) as previous, CorpusStore(os.path.join(self.index_dir, "metadata.corpus")) as latest:
+            self.assertEqual((len(previous), len(latest)), (3, 4))
+        self.assertEqual([name for name in os.listdir(self.directory) if name.endswith(".link")], [])
+
+    def test_retriever_opened_during_a_save_reads_one_version(self, mock_github, mock_stackapi):
+        self.run_indexer([make_doc(i) for i in range(3)], incremental=False)
+        read_index = faiss.read_index
+
+        def read_then_save(path):
+            index = read_index(path)
+            self.run_indexer([make_doc(i) for i in range(5)], incremental=False)
+            return index
+
+        for metadata_path in (os.path.join(self.index_dir, "metadata.corpus"), None):
+            with patch("retriever.faiss.read_index", side_effect=read_then_save):
+                retriever = Retriever(os.path.join(self.index_dir, "index.faiss"), metadata_path, google_api_key="fake_key", embedder=BatchEmbedder(self.backend))
+            self.assertEqual(len(retriever.metadata), retriever.index.ntotal)
+            retriever.close()
+
+    def test_failed_save_keeps_the_previous_version(self, mock_github, mock_stackapi):
+        indexer = self.run_indexer([make_doc(i) for i in range(3)], incremental=False)
+        current = os.path.realpath(self.index_dir)
+        with patch("indexer.write_corpus", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                indexer.save_index(self.index_dir)
+        self.assertEqual(os.path.realpath(self.index_dir), current)
+        self.assertEqual(os.listdir(self.index_dir + ".versions"), [os.path.basename(current)])
+
+    def test_index_saved_with_legacy_metadata_json_still_loads(self, mock_github, mock_stackapi):
+        self.run_indexer([make_doc(i) for i in range(3)], incremental=False)
+        indexer = Indexer("owner/repo", ["python"], github_token="t", google_api_key="k", embedder=BatchEmbedder(self.backend))
+        indexer.load_index(self.index_dir)
+        self.assertEqual(indexer.metadata[1], {**make_doc(1), "faiss_id": 1})
+
+        os.remove(os.path.join(self.index_dir, "metadata.corpus"))
+        with open(os.path.join(self.index_dir, "metadata.json"), "w") as f:
+            json.dump(indexer.metadata, f)
+        indexer.load_index(self.index_dir)
+        self.assertEqual(indexer.metadata[1]["document"], "issue 1 TypeError")
+        indexer.save_index(self.index_dir)
+        self.assertFalse(os.path.exists(os.path.join(self.index_dir, "metadata.json")))
+
+    def test_unchanged_update_makes_no_calls(self, mock_github, mock_stackapi):
+        documents = [make_doc(i) for i in range(4)]
+        self.run_indexer(documents, incremental=False)
+        calls_before = self.backend.calls
+        indexer = self.run_indexer(documents, incremental=True)
+        self.assertEqual(self.backend.calls, calls_before)
+        self.assertEqual(indexer.index.ntotal, 4)
+
+    def test_hnsw_update_rebuilds_graph_without_reembedding(self, mock_github, mock_stackapi):
+        documents = [make_doc(i) for i in range(6)]
+        self.run_indexer(documents, incremental=False, index_type="hnsw")
+        calls_before = self.backend.calls
+
+        del documents[2]
+        indexer = self.run_indexer(documents, incremental=True)
+        self.assertEqual(self.backend.calls, calls_before)
+        self.assertEqual(indexer.index_type, "hnsw")
+        self.assertEqual(indexer.index.ntotal, 5)
+        results = indexer.query_index("issue 4 TypeError", top_k=1)
+        self.assertEqual(results[0]["metadata"]["id"], 4)
+
+    def test_chunked_index_maps_passages_to_parents(self, mock_github, mock_stackapi):
+        filler = "\n\n".join(f"Paragraph {i} about unrelated release notes." for i in range(12))
+        documents = [make_doc(i, f"{filler}\n\nissue {i} fails with KeyError{i}") for i in range(3)]
+        indexer = self.run_indexer(documents, incremental=False, chunker=Chunker(chunk_tokens=40, overlap_tokens=8))
+        chunks = np.load(os.path.join(self.index_dir, "chunks.npy"))
+        self.assertEqual(indexer.index.ntotal, len(chunks))
+        self.assertGreater(len(chunks), 3)
+        self.assertEqual(sorted(set(chunks[:, 0].tolist())), [0, 1, 2])
+
+        results = indexer.query_index("issue 2 fails with KeyError2", top_k=2)
+        self.assertEqual(results[0]["metadata"]["id"], 2)
+        self.assertIn("KeyError2", results[0]["passage"])
+        self.assertLess(len(results[0]["passage"]), len(documents[2]["document"]))
+        self.assertEqual(len({r["metadata"]["id"] for r in results}), len(results))
+
+    def test_chunked_update_replaces_chunks_of_changed_documents(self, mock_github, mock_stackapi):
+        documents = [make_doc(i, f"issue {i}\n\nTypeError in module{i}") for i in range(3)]
+        self.run_indexer(documents, incremental=False, chunker=Chunker(chunk_tokens=4, overlap_tokens=0))
+        calls_before = self.backend.calls
+
+        documents[1] = make_doc(1, "issue 1\n\nnow a ValueError")
+        del documents[2]
+        indexer = self.run_indexer(documents, incremental=True)
+
+        self.assertEqual(indexer.chunker.chunk_tokens, 4)
+        self.assertEqual(self.backend.calls - calls_before, 2)
+        live = indexer.chunks[indexer.chunks[:, 0] >= 0]
+        self.assertEqual(indexer.index.ntotal, len(live))
+        self.assertEqual(sorted(live[:, 0].tolist()), [0, 0, 1, 1])
+        results = indexer.query_index("now a ValueError", top_k=1)
+        self.assertEqual(results[0]["metadata"]["id"], 1)
+        self.assertIn("now a ValueError", results[0]["passage"])
+        self.assertNotIn("TypeError", results[0]["passage"])
+
+    def test_github_issues_are_keyed_by_number_like_the_collector(self, mock_github, mock_stackapi):
+        issue = MagicMock(state="open", number=42, id=987654, title="t", body="b", html_url="u")
+        issue.get_comments.return_value = []
+        closed = MagicMock(state="closed", number=7, id=123456)
+        mock_github.return_value.get_repo.return_value.get_issues.return_value = [issue, closed]
+        indexer = Indexer("owner/repo", ["python"], github_token="t", google_api_key="k", embedder=BatchEmbedder(self.backend))
+        self.assertEqual([doc["id"] for doc in indexer._get_github_issues()], [42, 7])
+
+    def test_since_last_sync_fetches_only_changes(self, mock_github, mock_stackapi):
+        indexer = self.run_indexer([make_doc(i) for i in range(5)], incremental=False)
+        synced_at = indexer.manifest["synced_at"]
+        calls_before = self.backend.calls
+
+        changes = [make_doc(1, "issue 1 now has a traceback"), make_doc(7), {"source": "github", "id": 3, "state": "closed"}]
+        indexer = Indexer("owner/repo", ["python"], github_token="t", google_api_key="k", embedder=BatchEmbedder(self.backend, max_batch_size=1))
+        with patch.object(Indexer, "_get_github_issues", return_value=changes) as get_issues, \
+                patch.object(Indexer, "_get_stackoverflow_questions", return_value=[]) as get_questions:
+            indexer.update_index(self.index_dir, since_last_sync=True)
+
+        self.assertLess(get_issues.call_args.kwargs["since"], synced_at)
+        self.assertEqual(get_questions.call_args.kwargs["since"], get_issues.call_args.kwargs["since"])
+        self.assertEqual(self.backend.calls - calls_before, 2)
+        self.assertEqual(indexer.index.ntotal, 5)
+        self.assertEqual(sorted(indexer.manifest["documents"]), ["github:0", "github:1", "github:2", "github:4", "github:7"])
+        self.assertGreater(indexer.manifest["synced_at"], synced_at)
+        results = indexer.query_index("issue 1 now has a traceback", top_k=1)
+        self.assertEqual(results[0]["metadata"]["id"], 1)
+
+
+def leftover_tmp_files(directory):
+    return [name for name in os.listdir(directory) if name not in ("index.faiss", "metadata.corpus", "manifest.json", "chunks.npy", "bm25.npz", "exact_match.npz")]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -34,6 +34,8 @@ class TestIntegration(unittest.TestCase):
     def tearDown(self):
         os.remove(self.index_path)
         os.remove(self.metadata_path)
+        if os.path.exists(self.metadata_path + ".offsets.npy"):
+            os.remove(self.metadata_path + ".offsets.npy")
 
     @patch('retriever.genai.embed_content')
     @patch('llm_agent.genai.GenerativeModel')
@@ -58,5 +58,33 @@ class TestLLMAgent(unittest.TestCase):
         # Assert
         self.assertTrue(response.startswith("Error: An error occurred during the API call:"))
 
+class TestLLMAgentStreaming(unittest.TestCase):
+
+    @patch('llm_agent.genai.GenerativeModel')
+    def test_generate_patch_stream_yields_chunks(self, mock_generative_model):
+        mock_model_instance = MagicMock()
+        mock_model_instance.generate_content.return_value = iter([MagicMock(text="first "), MagicMock(text="second")])
+        mock_generative_model.return_value = mock_model_instance
+
+        agent = LLMAgent(api_key="fake_api_key")
+        chunks = list(agent.generate_patch_stream("test prompt"))
+
+        self.assertEqual(chunks, ["first ", "second"])
+        self.assertTrue(mock_model_instance.generate_content.call_args.kwargs["stream"])
+
+    @patch('llm_agent.time.sleep')
+    @patch('llm_agent.genai.GenerativeModel')
+    def test_generate_patch_stream_retries_before_first_chunk(self, mock_generative_model, mock_sleep):
+        mock_model_instance = MagicMock()
+        mock_model_instance.generate_content.side_effect = [Exception("429 Resource has been exhausted"), iter([MagicMock(text="patched")])]
+        mock_generative_model.return_value = mock_model_instance
+
+        agent = LLMAgent(api_key="fake_api_key")
+        chunks = list(agent.generate_patch_stream("test prompt", delay=0))
+
+        self.assertEqual(chunks, ["patched"])
+        mock_sleep.assert_called_once()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import time
+from metadata_store import JsonlMetadataStore, ListMetadataStore, open_metadata_store
+
+
+class TestJsonlMetadataStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "issues.jsonl")
+        self.write_records([{"id": i, "content": f"document {i}", "source": "github"} for i in range(100)])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_records(self, records, trailer="\n"):
+        with open(self.path, "w") as f:
+            f.write("\n".join(json.dumps(record) for record in records) + trailer)
+
+    def test_random_access(self):
+        store = JsonlMetadataStore(self.path)
+        self.assertEqual(len(store), 100)
+        self.assertEqual(store[42]["content"], "document 42")
+        self.assertEqual([r["id"] for r in store.get_many([99, 0, 7])], [99, 0, 7])
+        store.close()
+
+    def test_sidecar_is_reused_and_refreshed(self):
+        JsonlMetadataStore(self.path).close()
+        self.assertTrue(os.path.exists(self.path + ".offsets.npy"))
+
+        time.sleep(0.01)
+        self.write_records([{"id": "new", "content": "only record"}], trailer="\n\n\r\n")
+        store = JsonlMetadataStore(self.path)
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store[0]["id"], "new")
+        store.close()
+
+    def test_empty_file(self):
+        open(self.path, "w").close()
+        store = JsonlMetadataStore(self.path)
+        self.assertEqual(len(store), 0)
+        store.close()
+
+    def test_json_array_lookup_by_faiss_id(self):
+        path = os.path.join(self.tmp_dir, "metadata.json")
+        with open(path, "w") as f:
+            json.dump([{"faiss_id": 3, "document": "a"}, {"faiss_id": 9, "document": "b"}], f)
+        store = open_metadata_store(path)
+        self.assertIsInstance(store, ListMetadataStore)
+        self.assertEqual(store[9]["document"], "b")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
-from patch_parser import parse_llm_output
+import time
+from patch_parser import parse_llm_output, StreamingPatchParser
 
 class TestPatchParser(unittest.TestCase):
 
@@ -109,5 +110,95 @@ def test_windows_path():
         self.assertEqual(len(result["unit_tests"]), 1)
         self.assertEqual(result["unit_tests"][0]["file_path"], "src/main.py")
 
+    def test_most_recent_path_wins(self):
+        text = """
+diff --git a/src/main.py b/src/main.py
+--- a/src/main.py
++++ b/src/main.py
+@@ -1,1 +1,1 @@
+-old_line
++new_line
+
+# File: tests/test_main.py
+def test_main():
+    pass
+"""
+        result = parse_llm_output(text)
+        self.assertEqual(result["patches"][0]["file_path"], "src/main.py")
+        self.assertEqual(result["unit_tests"][0]["file_path"], "tests/test_main.py")
+
+
+STREAMED_RESPONSE = """Here is the fix.
+
+diff --git a/src/calc.py b/src/calc.py
+--- a/src/calc.py
++++ b/src/calc.py
+@@ -1,2 +1,2 @@
+ def average(items):
+-    return sum(items) / len(items)
++    return sum(items) / max(len(items), 1)
+
+**Unit Test:**
+```python
+def test_average_empty():
+    assert average([]) == 0
+```
+
+# File: tests/test_more.py
+def test_inline():
+    assert True
+"""
+
+
+class TestStreamingPatchParser(unittest.TestCase):
+
+    def test_emits_blocks_as_they_complete(self):
+        parser = StreamingPatchParser()
+        head, tail = STREAMED_RESPONSE.split("```python", 1)
+        events = parser.feed(head)
+        self.assertEqual([kind for kind, _ in events], ["patch"])
+        self.assertEqual(events[0][1]["file_path"], "src/calc.py")
+        self.assertTrue(events[0][1]["diff"].endswith("+    return sum(items) / max(len(items), 1)"))
+
+        events = parser.feed("```python" + tail) + parser.close()
+        self.assertEqual([kind for kind, _ in events], ["unit_test", "unit_test"])
+        self.assertEqual(events[0][1]["file_path"], "src/calc.py")
+        self.assertEqual(events[0][1]["code"], "def test_average_empty():\n    assert average([]) == 0")
+        self.assertEqual(events[1][1]["file_path"], "tests/test_more.py")
+
+    def test_chunk_boundaries_do_not_matter(self):
+        whole = StreamingPatchParser()
+        whole.feed(STREAMED_RESPONSE)
+        whole.close()
+        for size in (1, 3, 17):
+            parser = StreamingPatchParser()
+            for i in range(0, len(STREAMED_RESPONSE), size):
+                parser.feed(STREAMED_RESPONSE[i:i + size])
+            parser.close()
+            self.assertEqual(parser.result(), whole.result())
+
+    def test_long_line_streamed_in_small_pieces_is_linear(self):
+        line = "+" + "x" * 2_000_000
+        parser = StreamingPatchParser()
+        start = time.perf_counter()
+        for i in range(0, len(line), 4):
+            parser.feed(line[i:i + 4])
+        parser.feed("\n")
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def test_file_paths_match_parse_llm_output(self):
+        text = """
+# File: tests/test_utils.py
+def test_new_feature():
+    assert True
+
+Some more text.
+"""
+        parser = StreamingPatchParser()
+        parser.feed(text)
+        parser.close()
+        self.assertEqual(parser.result()["unit_tests"][0]["file_path"], parse_llm_output(text)["unit_tests"][0]["file_path"])
+
+
 if __name__ == '__main__':
     unittest.main()
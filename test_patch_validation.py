@@ -0,0 +1,131 @@
+import unittest
+import ast
+import os
+import shutil
+import tempfile
+from patch_parser import StreamingPatchParser, parse_llm_output
+from patch_validation import Check, Issue, PatchValidator, StrIntConcatCheck, iter_changed_nodes
+from unified_diff import parse_unified_diff
+
+ORIGINAL = """import os
+
+
+def describe(items):
+    count = len(items)
+    label = "items"
+    return label
+
+
+def unrelated():
+    return undefined_but_untouched
+"""
+
+
+def make_diff(added_line: str) -> str:
+    return (
+        "--- a/src/app.py\n+++ b/src/app.py\n@@ -5,3 +5,3 @@\n"
+        "     count = len(items)\n"
+        "     label = \"items\"\n"
+        "-    return label\n"
+        f"+{added_line}\n"
+    )
+
+
+class TestPatchValidator(unittest.TestCase):
+    def setUp(self):
+        self.validator = PatchValidator()
+
+    def validate(self, added_line, original=ORIGINAL):
+        return self.validator.validate(parse_unified_diff(make_diff(added_line))[0], original)
+
+    def test_valid_patch(self):
+        self.assertEqual(self.validate("    return f\"{count} {label}\""), [])
+        self.assertEqual(self.validate("    return str(count) + \" \" + label"), [])
+
+    def test_str_int_concatenation(self):
+        issues = self.validate("    return label + count")
+        self.assertEqual([(i.check, i.line, i.path) for i in issues], [("str_int_concat", 7, "src/app.py")])
+        self.assertEqual(len(self.validate("    return \"total: \" + len(items)")), 1)
+
+    def test_unknown_name_plus_str_literal_is_a_warning(self):
+        issues = self.validate("    return items + \"!\"")
+        self.assertEqual([(i.check, i.severity, i.line) for i in issues], [("str_int_concat", "warning", 7)])
+        self.assertEqual([i.severity for i in self.validate("    return f\"{label}: \" + items")], ["warning"])
+        self.assertEqual(self.validate("    return items + items"), [])
+        self.assertEqual(self.validate("    return label + \"!\""), [])
+
+    def test_undefined_name(self):
+        issues = self.validate("    return lable")
+        self.assertEqual([(i.check, i.message) for i in issues], [("undefined_name", "Undefined name 'lable'")])
+
+    def test_only_changed_lines_are_checked(self):
+        # `undefined_but_untouched` is outside the patch and is not reported.
+        self.assertEqual(self.validate("    return os.sep.join([label])"), [])
+
+    def test_syntax_error(self):
+        issues = self.validate("    return label +")
+        self.assertEqual([i.check for i in issues], ["syntax"])
+
+    def test_patch_that_does_not_apply(self):
+        issues = self.validate("    return label", original="something else\n")
+        self.assertEqual([i.check for i in issues], ["apply"])
+
+    def test_fragment_without_original(self):
+        self.assertEqual(self.validate("    return label", original=None), [])
+        issues = self.validate("    return label + count", original=None)
+        self.assertEqual([(i.check, i.line) for i in issues], [("str_int_concat", 7)])
+        # Name resolution needs the whole file.
+        self.assertEqual(self.validate("    return lable", original=None), [])
+
+    def test_parse_trees_are_cached_by_content(self):
+        first = self.validator.parse(ORIGINAL)
+        self.assertIs(self.validator.parse(ORIGINAL), first)
+        self.assertIsNot(self.validator.parse(ORIGINAL + "\n"), first)
+
+    def test_pluggable_checks(self):
+        class NoPrintCheck(Check):
+            name = "no_print"
+
+            def run(self, source, changed_lines):
+                return [
+                    Issue(self.name, "print() call", line=node.lineno)
+                    for node in iter_changed_nodes(source.tree, changed_lines)
+                    if isinstance(node, ast.Call) and getattr(node.func, "id", None) == "print"
+                ]
+
+        validator = PatchValidator(checks=[StrIntConcatCheck(), NoPrintCheck()])
+        issues = validator.validate(parse_unified_diff(make_diff("    print(label + count)"))[0], ORIGINAL)
+        self.assertEqual([i.check for i in issues], ["str_int_concat", "no_print"])
+
+    def test_parse_llm_output_uses_repo_files(self):
+        repo = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(repo, "src"))
+            with open(os.path.join(repo, "src", "app.py"), "w") as f:
+                f.write(ORIGINAL)
+            text = make_diff("    return lable")
+            self.assertEqual(len(parse_llm_output(text)["patches"]), 1)
+            self.assertEqual(parse_llm_output(text, repo_path=repo)["patches"], [])
+        finally:
+            shutil.rmtree(repo)
+
+    def test_paths_outside_the_repo_are_not_read(self):
+        repo = tempfile.mkdtemp()
+        try:
+            diff = parse_unified_diff("--- a/../../etc/passwd\n+++ b/../../etc/passwd\n@@ -1 +1 @@\n-root\n+root\n")[0]
+            issues = PatchValidator().validate_patch(diff, repo)
+            self.assertEqual([i.check for i in issues], ["path"])
+        finally:
+            shutil.rmtree(repo)
+
+    def test_warnings_do_not_reject_the_patch(self):
+        parser = StreamingPatchParser()
+        parser.feed(make_diff("    return items + \"!\""))
+        parser.close()
+        self.assertEqual(len(parser.patches), 1)
+        self.assertEqual(parser.rejected, [])
+        self.assertEqual([issue.severity for _, issues in parser.warnings for issue in issues], ["warning"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+from unittest.mock import patch, AsyncMock, MagicMock
+import asyncio
+import os
+import json
+import faiss
+import numpy as np
+from embedder import BatchEmbedder, HashEmbeddingBackend
+from llm_agent import LLMAgent
+from pipeline import DebugPipeline, build_prompt
+from retriever import Retriever
+
+PATCH_RESPONSE = """
+diff --git a/app.py b/app.py
+--- a/app.py
++++ b/app.py
+@@ -1,1 +1,1 @@
+-total = count / 0
++total = count / max(len(items), 1)
+"""
+
+
+class TestDebugPipeline(unittest.TestCase):
+    def setUp(self):
+        self.index_path = "test_pipeline_index.faiss"
+        self.metadata_path = "test_pipeline_metadata.jsonl"
+        self.backend = HashEmbeddingBackend(dim=32)
+        documents = [f"TypeError number {i}" for i in range(10)]
+        index = faiss.IndexFlatIP(32)
+        index.add(np.array([self.backend._embed_one(doc) for doc in documents]))
+        faiss.write_index(index, self.index_path)
+        with open(self.metadata_path, "w") as f:
+            for i, doc in enumerate(documents):
+                f.write(json.dumps({"id": i, "content": doc, "source": "test"}) + "\n")
+
+    def tearDown(self):
+        for path in (self.index_path, self.metadata_path, self.metadata_path + ".offsets.npy"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def make_pipeline(self, mock_generative_model, generate, **kwargs):
+        mock_model_instance = MagicMock()
+        mock_model_instance.generate_content_async = AsyncMock(side_effect=generate)
+        mock_generative_model.return_value = mock_model_instance
+        retriever = Retriever(
+            self.index_path, self.metadata_path, google_api_key="fake_key", embedder=BatchEmbedder(self.backend)
+        )
+        return DebugPipeline(retriever, LLMAgent(api_key="fake_key"), top_k=3, **kwargs)
+
+    @patch('llm_agent.genai.GenerativeModel')
+    def test_run_end_to_end(self, mock_generative_model):
+        async def generate(prompt, **kwargs):
+            self.assertIn("TypeError number 4", prompt)
+            return MagicMock(text=PATCH_RESPONSE)
+
+        pipeline = self.make_pipeline(mock_generative_model, generate)
+        result = asyncio.run(pipeline.run("TypeError number 4"))
+        self.assertEqual(result["retrieved_docs"][0]["id"], 4)
+        self.assertEqual(len(result["parsed_output"]["patches"]), 1)
+
+    @patch('llm_agent.genai.GenerativeModel')
+    def test_concurrency_is_bounded(self, mock_generative_model):
+        in_flight = []
+        peak = []
+
+        async def generate(prompt, **kwargs):
+            in_flight.append(1)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.pop()
+            return MagicMock(text="no patch")
+
+        pipeline = self.make_pipeline(mock_generative_model, generate, max_concurrency=3)
+        results = asyncio.run(pipeline.run_many([f"error {i}" for i in range(12)]))
+        self.assertEqual(len(results), 12)
+        self.assertTrue(all(isinstance(result, dict) for result in results))
+        self.assertEqual(max(peak), 3)
+
+    @patch('llm_agent.genai.GenerativeModel')
+    def test_identical_errors_share_one_run(self, mock_generative_model):
+        calls = []
+
+        async def generate(prompt, **kwargs):
+            calls.append(prompt)
+            await asyncio.sleep(0.01)
+            return MagicMock(text=PATCH_RESPONSE)
+
+        trace = 'Traceback (most recent call last):\n  File "/home/{}/app.py", line {}, in main\nZeroDivisionError: division by zero'
+        pipeline = self.make_pipeline(mock_generative_model, generate)
+        results = asyncio.run(pipeline.run_many([trace.format("ann", 3), trace.format("bob", 4), "TypeError number 4"]))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(results[0]["fingerprint"], results[1]["fingerprint"])
+        self.assertIsNot(results[0], results[1])
+        self.assertNotEqual(results[0]["fingerprint"], results[2]["fingerprint"])
+
+    @patch('llm_agent.genai.GenerativeModel')
+    def test_per_request_timeout(self, mock_generative_model):
+        async def generate(prompt, **kwargs):
+            await asyncio.sleep(1)
+            return MagicMock(text="too late")
+
+        pipeline = self.make_pipeline(mock_generative_model, generate, timeout=0.05)
+        results = asyncio.run(pipeline.run_many(["slow error"]))
+        self.assertIsInstance(results[0], asyncio.TimeoutError)
+
+    @patch('llm_agent.genai.GenerativeModel')
+    def test_rate_limit_backoff_does_not_block(self, mock_generative_model):
+        calls = []
+
+        async def generate(prompt, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                raise Exception("429 Resource has been exhausted")
+            return MagicMock(text="patched")
+
+        mock_model_instance = MagicMock()
+        mock_model_instance.generate_content_async = AsyncMock(side_effect=generate)
+        mock_generative_model.return_value = mock_model_instance
+        agent = LLMAgent(api_key="fake_key")
+        with patch('llm_agent.time.sleep') as mock_sleep:
+            response = asyncio.run(agent.generate_patch_async("context", delay=0))
+        self.assertEqual(response, "patched")
+        self.assertEqual(len(calls), 2)
+        mock_sleep.assert_not_called()
+
+    def test_build_prompt(self):
+        prompt = build_prompt("boom", [{"content": "doc a"}, {"content": "doc b"}])
+        self.assertEqual(prompt, "Error and Code:\nboom\n\nRetrieved Context:\ndoc a\ndoc b")
+
+
+if __name__ == '__main__':
+    unittest.main()
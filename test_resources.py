@@ -0,0 +1,103 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import os
+import shutil
+import tempfile
+import threading
+import time
+from resources import ResourceRegistry, get_registry
+
+
+class TestResourceRegistry(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.tmp_dir, "index.faiss")
+        self.metadata_path = os.path.join(self.tmp_dir, "metadata.jsonl")
+        for path in (self.index_path, self.metadata_path):
+            with open(path, "w") as f:
+                f.write("x")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_builds_once_and_reloads_on_mtime_change(self):
+        registry = ResourceRegistry()
+        builds = []
+        factory = lambda: builds.append(1) or object()
+        paths = (self.index_path, self.metadata_path)
+
+        first = registry.get("r", factory, paths)
+        self.assertIs(registry.get("r", factory, paths), first)
+        self.assertEqual(len(builds), 1)
+
+        stat = os.stat(self.metadata_path)
+        os.utime(self.metadata_path, (stat.st_atime, stat.st_mtime + 10))
+        self.assertIsNot(registry.get("r", factory, paths), first)
+        self.assertEqual(len(builds), 2)
+
+    def test_sidecar_changes_reload_and_close_the_old_value(self):
+        registry = ResourceRegistry()
+        closed = []
+
+        class Resource:
+            def close(self):
+                closed.append(self)
+
+        sidecar = os.path.join(self.tmp_dir, "bm25.npz")
+        first = registry.get("r", Resource, (self.index_path,), optional_paths=(sidecar,))
+        self.assertIs(registry.get("r", Resource, (self.index_path,), optional_paths=(sidecar,)), first)
+        with open(sidecar, "w") as f:
+            f.write("x")
+        second = registry.get("r", Resource, (self.index_path,), optional_paths=(sidecar,))
+        self.assertIsNot(second, first)
+        self.assertEqual(closed, [first])
+        stat = os.stat(sidecar)
+        os.utime(sidecar, (stat.st_atime, stat.st_mtime + 10))
+        self.assertIsNot(registry.get("r", Resource, (self.index_path,), optional_paths=(sidecar,)), second)
+        self.assertEqual(closed, [first, second])
+
+    def test_concurrent_sessions_share_one_load(self):
+        registry = ResourceRegistry()
+        builds = []
+
+        def slow_factory():
+            builds.append(1)
+            time.sleep(0.05)
+            return object()
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(registry.get("r", slow_factory, (self.index_path,))))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(len({id(result) for result in results}), 1)
+
+    def test_missing_index_raises_file_not_found(self):
+        with self.assertRaises(FileNotFoundError):
+            ResourceRegistry().get("r", object, (os.path.join(self.tmp_dir, "missing"),))
+
+    @patch('resources.Retriever')
+    def test_get_retriever_is_shared(self, mock_retriever):
+        mock_retriever.side_effect = lambda **kwargs: MagicMock()
+        registry = ResourceRegistry()
+        first = registry.get_retriever(self.index_path, self.metadata_path, google_api_key="fake_key")
+        second = registry.get_retriever(self.index_path, self.metadata_path, google_api_key="fake_key")
+        self.assertIs(first, second)
+        mock_retriever.assert_called_once()
+        with open(os.path.join(self.tmp_dir, "exact_match.npz"), "w") as f:
+            f.write("x")
+        registry.get_retriever(self.index_path, self.metadata_path, google_api_key="fake_key")
+        self.assertEqual(mock_retriever.call_count, 2)
+        first.close.assert_called_once()
+
+    def test_get_registry_is_a_singleton(self):
+        self.assertIs(get_registry(), get_registry())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import shutil
+import tempfile
+import time
+from embedder import BatchEmbedder, HashEmbeddingBackend
+from llm_agent import LLMAgent
+from response_cache import ResponseCache
+
+TRACE = "Traceback: File app.py line 3 in main TypeError: can only concatenate str (not int) to str"
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "responses.sqlite")
+        self.embedder = BatchEmbedder(HashEmbeddingBackend(dim=64))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_exact_hit_ignores_whitespace_and_persists(self):
+        cache = ResponseCache(self.path)
+        cache.put("error  text\n", "patch A")
+        cache.close()
+
+        cache = ResponseCache(self.path)
+        self.assertEqual(cache.get("error text"), "patch A")
+        self.assertIsNone(cache.get("other error"))
+        self.assertEqual(cache.stats()["hits_exact"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_exact_hit_ignores_traceback_paths_and_line_numbers(self):
+        cache = ResponseCache(self.path)
+        trace = 'Traceback (most recent call last):\n  File "/home/{}/app.py", line {}, in main\nZeroDivisionError: division by zero'
+        cache.put(trace.format("ann", 3), "patch A")
+        self.assertEqual(cache.get(trace.format("bob", 5)), "patch A")
+
+    def test_semantic_hit_above_threshold(self):
+        cache = ResponseCache(self.path, embedder=self.embedder, similarity_threshold=0.9)
+        cache.put(TRACE, "patch A")
+        self.assertEqual(cache.get(TRACE + " please"), "patch A")
+        self.assertIsNone(cache.get("ZeroDivisionError: division by zero in compute()"))
+        self.assertEqual(cache.stats()["hits_semantic"], 1)
+
+        reopened = ResponseCache(self.path, embedder=self.embedder, similarity_threshold=0.9)
+        self.assertEqual(reopened.get(TRACE + " thanks"), "patch A")
+
+    def test_ttl_expiry(self):
+        cache = ResponseCache(self.path, embedder=self.embedder, ttl_seconds=0.05)
+        cache.put(TRACE, "patch A")
+        time.sleep(0.1)
+        self.assertIsNone(cache.get(TRACE))
+
+    def test_size_bound_evicts_least_recently_used(self):
+        cache = ResponseCache(self.path, max_entries=2)
+        cache.put("one", "1")
+        cache.put("two", "2")
+        cache.get("one")
+        cache.put("three", "3")
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get("one"), "1")
+        self.assertIsNone(cache.get("two"))
+
+    @patch('llm_agent.genai.GenerativeModel')
+    def test_llm_agent_uses_cache(self, mock_generative_model):
+        mock_model_instance = MagicMock()
+        mock_model_instance.generate_content.return_value.text = "generated patch"
+        mock_generative_model.return_value = mock_model_instance
+        agent = LLMAgent(api_key="fake_key", response_cache=ResponseCache(self.path, embedder=self.embedder))
+
+        self.assertEqual(agent.generate_patch(TRACE), "generated patch")
+        self.assertEqual(agent.generate_patch(TRACE), "generated patch")
+        mock_model_instance.generate_content.assert_called_once()
+
+    @patch('llm_agent.genai.GenerativeModel')
+    def test_errors_are_not_cached(self, mock_generative_model):
+        mock_model_instance = MagicMock()
+        mock_model_instance.generate_content.side_effect = Exception("API Error")
+        mock_generative_model.return_value = mock_model_instance
+        cache = ResponseCache(self.path)
+        agent = LLMAgent(api_key="fake_key", response_cache=cache)
+        agent.generate_patch(TRACE)
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
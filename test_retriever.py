@@ -4,6 +4,15 @@ import os
 import json
 import faiss
 import numpy as np
+import asyncio
+import shutil
+import tempfile
+import time
+import bm25
+from concurrent.futures import ThreadPoolExecutor
+import exact_match
+from chunker import CHUNKS_FILE, Chunker, save_chunks
+from embedder import BatchEmbedder, EmbeddingBackend, HashEmbeddingBackend
 from retriever import Retriever
 
 class TestRetriever(unittest.TestCase):
@@ -32,6 +41,8 @@ class TestRetriever(unittest.TestCase):
     def tearDown(self):
         os.remove(self.index_path)
         os.remove(self.metadata_path)
+        if os.path.exists(self.metadata_path + ".offsets.npy"):
+            os.remove(self.metadata_path + ".offsets.npy")
 
     @unittest.mock.patch('retriever.genai.embed_content')
     def test_retriever(self, mock_embed_content):
@@ -47,5 +58,187 @@ class TestRetriever(unittest.TestCase):
         self.assertTrue("id" in results[0])
         self.assertTrue("score" in results[0])
 
+    def test_batch_retrieve_embeds_in_batches(self):
+        backend = HashEmbeddingBackend(dim=self.d)
+        embedder = BatchEmbedder(backend, max_batch_size=4, max_concurrency=2)
+        retriever = Retriever(self.index_path, self.metadata_path, google_api_key="fake_key", embedder=embedder)
+        queries = [f"error {i % 5}" for i in range(20)]
+        batch_results = retriever.batch_retrieve(queries, top_k=3)
+
+        self.assertEqual(len(batch_results), 20)
+        self.assertTrue(all(len(results) == 3 for results in batch_results))
+        # 5 distinct queries in batches of 4 -> 2 requests.
+        self.assertEqual(backend.calls, 2)
+        self.assertEqual(batch_results[0], batch_results[5])
+        single = retriever.retrieve("error 3", top_k=3)
+        self.assertEqual([r["id"] for r in single], [r["id"] for r in batch_results[3]])
+
+
+class TestChunkedRetriever(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        filler = "\n\n".join(f"Paragraph {i} about unrelated release notes." for i in range(10))
+        self.documents = [
+            {"id": i, "source": "github", "content": f"{filler}\n\nKeyError{i} is raised by loader{i}"}
+            for i in range(4)
+        ]
+        self.metadata_path = os.path.join(self.directory, "corpus.jsonl")
+        with open(self.metadata_path, "w") as f:
+            for doc in self.documents:
+                f.write(json.dumps(doc) + "\n")
+        chunks = Chunker(chunk_tokens=30, overlap_tokens=6).chunk_documents(doc["content"] for doc in self.documents)
+        self.backend = HashEmbeddingBackend(dim=64)
+        texts = [self.documents[parent]["content"][start:end] for parent, start, end in chunks]
+        index = faiss.IndexFlatIP(64)
+        index.add(BatchEmbedder(self.backend).embed(texts))
+        self.index_path = os.path.join(self.directory, "index.faiss")
+        faiss.write_index(index, self.index_path)
+        save_chunks(os.path.join(self.directory, CHUNKS_FILE), chunks)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_returns_best_passage_per_document(self):
+        retriever = Retriever(self.index_path, self.metadata_path, google_api_key="fake_key", embedder=BatchEmbedder(self.backend))
+        results = retriever.retrieve("KeyError2 is raised by loader2", top_k=3)
+        self.assertEqual(results[0]["id"], 2)
+        self.assertIn("KeyError2 is raised by loader2", results[0]["content"])
+        self.assertLess(len(results[0]["content"]), len(self.documents[2]["content"]))
+        self.assertEqual(len({r["id"] for r in results}), len(results))
+        self.assertEqual(retriever.batch_retrieve(["KeyError2 is raised by loader2"], top_k=3), [results])
+
+    def test_close_waits_for_running_queries(self):
+        retriever = Retriever(self.index_path, self.metadata_path, google_api_key="fake_key", embedder=BatchEmbedder(self.backend))
+        with retriever._in_use():
+            retriever.close()
+            self.assertEqual(len(retriever.metadata.get_many([1])), 1)
+        with self.assertRaises(RuntimeError):
+            retriever.retrieve("KeyError2", top_k=1)
+
+
+class UnavailableBackend(EmbeddingBackend):
+    def embed_batch(self, texts, task_type):
+        raise ConnectionError("embedding API is down")
+
+
+class TestHybridRetriever(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.documents = [{"id": i, "source": "github", "content": f"Discussion {i} about slow startup and configuration"} for i in range(20)]
+        self.documents[13]["content"] = "openai.BadRequestError: Error code: 400 from openai._base_client"
+        self.metadata_path = os.path.join(self.directory, "corpus.jsonl")
+        with open(self.metadata_path, "w") as f:
+            for doc in self.documents:
+                f.write(json.dumps(doc) + "\n")
+        self.backend = HashEmbeddingBackend(dim=64)
+        index = faiss.IndexFlatIP(64)
+        index.add(BatchEmbedder(self.backend).embed([doc["content"] for doc in self.documents]))
+        self.index_path = os.path.join(self.directory, "index.faiss")
+        faiss.write_index(index, self.index_path)
+        bm25.build_from_metadata(self.metadata_path, self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_retriever(self, backend, **kwargs):
+        return Retriever(self.index_path, self.metadata_path, google_api_key="fake_key", embedder=BatchEmbedder(backend, max_retries=0), **kwargs)
+
+    def test_fuses_lexical_and_vector_rankings(self):
+        retriever = self.make_retriever(self.backend)
+        results = retriever.retrieve("Traceback: openai.BadRequestError: Error code: 400", top_k=3)
+        self.assertEqual(results[0]["id"], 13)
+        self.assertEqual(len({r["id"] for r in results}), 3)
+        self.assertGreater(self.backend.calls, 1)
+        self.assertEqual(retriever.batch_retrieve(["Traceback: openai.BadRequestError: Error code: 400"], top_k=3), [results])
+
+    def test_falls_back_to_lexical_when_embedding_fails(self):
+        retriever = self.make_retriever(UnavailableBackend())
+        results = retriever.retrieve("openai.BadRequestError 400", top_k=3)
+        self.assertEqual(results[0]["id"], 13)
+        async_results = asyncio.run(retriever.retrieve_async("openai.BadRequestError 400", top_k=3))
+        self.assertEqual(async_results, results)
+
+    def test_slow_embedding_times_out_to_lexical(self):
+        retriever = self.make_retriever(HashEmbeddingBackend(dim=64, latency=2), embed_timeout=0.1)
+        start = time.perf_counter()
+        results = retriever.retrieve("openai.BadRequestError 400", top_k=1)
+        async_results = asyncio.run(retriever.retrieve_async("openai.BadRequestError 400", top_k=1))
+        self.assertLess(time.perf_counter() - start, 1.5)
+        self.assertEqual([r["id"] for r in results + async_results], [13, 13])
+
+
+class TestExactMatchRetriever(unittest.TestCase):
+    TRACE = 'Traceback (most recent call last):\n  File "/home/{}/job.py", line {}, in run\n    total = parts / 0\nZeroDivisionError: division by zero\n'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        documents = [{"id": i, "source": "github", "content": f"Discussion {i} about configuration"} for i in range(6)]
+        documents[4]["content"] = "Crash in the nightly job " + " ".join(self.TRACE.format("ci", 7).split())
+        self.metadata_path = os.path.join(self.directory, "corpus.jsonl")
+        with open(self.metadata_path, "w") as f:
+            for doc in documents:
+                f.write(json.dumps(doc) + "\n")
+        index = faiss.IndexFlatIP(32)
+        index.add(BatchEmbedder(HashEmbeddingBackend(dim=32)).embed([doc["content"] for doc in documents]))
+        self.index_path = os.path.join(self.directory, "index.faiss")
+        faiss.write_index(index, self.index_path)
+        exact_match.build_from_metadata(self.metadata_path, self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_exact_hit_skips_the_embedding_call(self):
+        backend = HashEmbeddingBackend(dim=32)
+        retriever = Retriever(self.index_path, self.metadata_path, google_api_key="fake_key", embedder=BatchEmbedder(backend))
+        results = retriever.retrieve(self.TRACE.format("ann", 12), top_k=3)
+        self.assertEqual([r["id"] for r in results], [4])
+        self.assertEqual(results[0]["match"], "signature")
+        self.assertEqual(asyncio.run(retriever.retrieve_async(self.TRACE.format("bob", 3), top_k=3)), results)
+        self.assertEqual(backend.calls, 0)
+        self.assertEqual(retriever.exact_hits, 2)
+
+    def test_exact_hit_is_filled_from_the_lexical_index(self):
+        bm25.build_from_metadata(self.metadata_path, self.directory)
+        backend = HashEmbeddingBackend(dim=32)
+        retriever = Retriever(self.index_path, self.metadata_path, google_api_key="fake_key", embedder=BatchEmbedder(backend))
+        results = retriever.retrieve("Seen after a configuration change:\n" + self.TRACE.format("ann", 12), top_k=3)
+        self.assertEqual(results[0]["id"], 4)
+        self.assertEqual(results[0]["match"], "signature")
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all("match" not in result for result in results[1:]))
+        self.assertEqual(asyncio.run(retriever.retrieve_async("Seen after a configuration change:\n" + self.TRACE.format("ann", 12), top_k=3)), results)
+        self.assertEqual(backend.calls, 0)
+
+    def test_exact_hit_answers_when_embedding_fails(self):
+        retriever = Retriever(self.index_path, self.metadata_path, google_api_key="fake_key", embedder=BatchEmbedder(UnavailableBackend(), max_retries=0))
+        results = retriever.retrieve(self.TRACE.format("ann", 12), top_k=3)
+        self.assertEqual([r["id"] for r in results], [4])
+        self.assertEqual(results[0]["match"], "signature")
+        self.assertEqual(asyncio.run(retriever.retrieve_async(self.TRACE.format("bob", 3), top_k=3)), results)
+
+    def test_concurrent_hits_are_all_counted(self):
+        retriever = Retriever(self.index_path, self.metadata_path, google_api_key="fake_key", embedder=BatchEmbedder(HashEmbeddingBackend(dim=32)))
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda i: retriever.retrieve(self.TRACE.format("ann", i), top_k=1), range(200)))
+        self.assertEqual(retriever.exact_hits, 200)
+
+    def test_other_message_is_not_an_exact_hit(self):
+        retriever = Retriever(self.index_path, self.metadata_path, google_api_key="fake_key", embedder=BatchEmbedder(HashEmbeddingBackend(dim=32)))
+        results = retriever.retrieve(self.TRACE.format("ann", 12).replace("division by zero", "float division by zero"), top_k=3)
+        self.assertTrue(all("match" not in result for result in results))
+        self.assertEqual(retriever.exact_hits, 0)
+
+    def test_batch_tags_exact_hits(self):
+        backend = HashEmbeddingBackend(dim=32)
+        retriever = Retriever(self.index_path, self.metadata_path, google_api_key="fake_key", embedder=BatchEmbedder(backend))
+        queries = [self.TRACE.format("ann", 1), "Discussion 2 about configuration", "configuration is ignored after upgrading"]
+        batch_results = retriever.batch_retrieve(queries, top_k=2)
+        self.assertEqual(batch_results[0][0]["match"], "signature")
+        self.assertEqual(batch_results[1][0]["match"], "near_duplicate")
+        self.assertEqual(batch_results[1][0]["id"], 2)
+        self.assertNotIn("match", batch_results[2][0])
+        self.assertEqual([len(results) for results in batch_results], [1, 1, 2])
+        self.assertEqual(backend.calls, 1)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
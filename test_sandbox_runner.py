@@ -0,0 +1,94 @@
+import unittest
+import os
+import shutil
+import tempfile
+from sandbox_runner import SandboxRunner
+from unified_diff import parse_unified_diff
+
+BUGGY = "def average(items):\n    return sum(items) / len(items)\n"
+
+FIX = """--- a/calc.py
++++ b/calc.py
+@@ -1,2 +1,2 @@
+ def average(items):
+-    return sum(items) / len(items)
++    return sum(items) / max(len(items), 1)
+"""
+
+TEST = """from calc import average
+
+def test_average_of_empty_list():
+    assert average([]) == 0
+"""
+
+
+class TestSandboxRunner(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        with open(os.path.join(self.repo, "calc.py"), "w") as f:
+            f.write(BUGGY)
+        os.makedirs(os.path.join(self.repo, "pkg"))
+        with open(os.path.join(self.repo, "pkg", "data.txt"), "w") as f:
+            f.write("unchanged")
+        self.runner = SandboxRunner(self.repo, timeout=30)
+        self.fix = parse_unified_diff(FIX)
+
+    def tearDown(self):
+        shutil.rmtree(self.repo)
+
+    def test_patch_makes_test_pass_without_touching_repo(self):
+        results = self.runner.run_many([(self.fix, TEST), ([], TEST)])
+        self.assertEqual([r.status for r in results], ["passed", "failed"])
+        self.assertGreater(results[0].duration, 0)
+        with open(os.path.join(self.repo, "calc.py")) as f:
+            self.assertEqual(f.read(), BUGGY)
+        self.assertEqual(os.listdir(self.repo).count("calc.py"), 1)
+        self.assertFalse(any(name.startswith("test_sandbox_") for name in os.listdir(self.repo)))
+
+    def test_test_writing_to_source_files_does_not_touch_repo(self):
+        writer = "def test_write():\n    with open('pkg/data.txt', 'w') as f:\n        f.write('changed')\n"
+        self.assertEqual(self.runner.run([], writer).status, "passed")
+        with open(os.path.join(self.repo, "pkg", "data.txt")) as f:
+            self.assertEqual(f.read(), "unchanged")
+
+    def test_results_are_cached(self):
+        first = self.runner.run(self.fix, TEST)
+        second = self.runner.run(parse_unified_diff(FIX), TEST)
+        self.assertFalse(first.cached)
+        self.assertTrue(second.cached)
+        self.assertEqual(second.status, "passed")
+
+    def test_timeout(self):
+        runner = SandboxRunner(self.repo, timeout=1)
+        result = runner.run([], "def test_forever():\n    while True:\n        pass\n")
+        self.assertEqual(result.status, "timeout")
+        self.assertLess(result.duration, 10)
+
+    def test_patch_that_does_not_apply(self):
+        broken = parse_unified_diff(FIX.replace("len(items)\n+", "count\n+"))
+        result = self.runner.run(broken, TEST)
+        self.assertEqual(result.status, "error")
+        self.assertIn("does not apply", result.output)
+
+    def test_paths_outside_the_snapshot_are_rejected(self):
+        escaped = os.path.join(os.path.dirname(self.repo), os.path.basename(self.repo) + "_escaped.py")
+        for target in ["../" + os.path.basename(escaped), escaped]:
+            with self.subTest(target=target):
+                diff = parse_unified_diff(f"--- /dev/null\n+++ b/{target}\n@@ -0,0 +1 @@\n+ESCAPED = True\n")
+                result = self.runner.run(diff, TEST)
+                self.assertEqual(result.status, "error")
+                self.assertIn("outside the repository", result.output)
+                self.assertFalse(os.path.exists(escaped))
+        reader = parse_unified_diff("--- a/../../etc/passwd\n+++ b/calc.py\n@@ -1 +1 @@\n-root\n+root\n")
+        self.assertEqual(self.runner.run(reader, TEST).status, "error")
+
+    def test_verify_parsed_output(self):
+        parsed_output = {
+            "patches": [{"file_path": "calc.py", "diff": FIX, "file_diff": self.fix[0]}],
+            "unit_tests": [{"file_path": "calc.py", "code": TEST}],
+        }
+        self.assertTrue(self.runner.verify(parsed_output)[0].passed)
+
+
+if __name__ == '__main__':
+    unittest.main()
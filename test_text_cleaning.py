@@ -0,0 +1,69 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+from text_cleaning import CodeBlock, clean, clean_document, clean_jsonl, clean_many, clean_text, strip_html
+
+STACKOVERFLOW = (
+    '<p>I get a <code>KeyError</code> &amp; the loop stops:</p>\n'
+    '<pre class="lang-py prettyprint-override"><code>d = {}\nif a &lt; b:\n    d["x"]\n</code></pre>\n'
+    '<p>Why?</p>'
+)
+GITHUB = "Crash on start\n\nSteps:\n```python\nimport x\nx.run()\n```\nThen it fails when a < b.\n\n\n\nThanks"
+
+
+class TestTextCleaning(unittest.TestCase):
+    def test_strip_html(self):
+        self.assertEqual(strip_html("<p>a</p><p>b &gt; c</p><!-- note -->"), "\na\n\nb > c\n")
+        self.assertEqual(strip_html("if a < b and c > d"), "if a < b and c > d")
+
+    def test_code_blocks_are_kept_separately(self):
+        cleaned = clean(STACKOVERFLOW)
+        self.assertEqual(cleaned.text, "I get a KeyError & the loop stops: Why?")
+        self.assertEqual(cleaned.code, [CodeBlock('d = {}\nif a < b:\n    d["x"]', "py")])
+
+        cleaned = clean(GITHUB)
+        self.assertEqual(cleaned.text, "Crash on start Steps: Then it fails when a < b. Thanks")
+        self.assertEqual(cleaned.code, [CodeBlock("import x\nx.run()", "python")])
+
+    def test_clean_text_matches_legacy_behaviour(self):
+        self.assertEqual(clean_text("Error ```trace``` in <b>module</b>   here"), "Error in module here")
+        self.assertEqual(clean_text(None), "")
+        self.assertEqual(clean_text("unterminated ```fence"), "unterminated ```fence")
+
+    def test_clean_document_keeps_layout(self):
+        self.assertEqual(
+            clean_document(STACKOVERFLOW),
+            'I get a KeyError & the loop stops:\n\n```py\nd = {}\nif a < b:\n    d["x"]\n```\n\nWhy?',
+        )
+        self.assertEqual(
+            clean_document(GITHUB),
+            "Crash on start\n\nSteps:\n\n```python\nimport x\nx.run()\n```\n\nThen it fails when a < b.\n\nThanks",
+        )
+
+    def test_clean_many_preserves_order(self):
+        texts = [f"<p>record {i}</p>" for i in range(50)]
+        self.assertEqual([c.text for c in clean_many(texts, processes=2, chunksize=4)], [f"record {i}" for i in range(50)])
+        self.assertEqual([c.text for c in clean_many(texts[:2], processes=1)], ["record 0", "record 1"])
+
+    def test_clean_jsonl(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            source, target = os.path.join(tmp_dir, "raw.jsonl"), os.path.join(tmp_dir, "clean.jsonl")
+            with open(source, "w") as f:
+                f.write(json.dumps({"id": 1, "document": STACKOVERFLOW}) + "\n\n")
+                f.write(json.dumps({"id": 2, "content": "plain"}) + "\n")
+            self.assertEqual(clean_jsonl(source, target, processes=2), 2)
+            with open(target) as f:
+                records = [json.loads(line) for line in f]
+            self.assertEqual(records[0]["content"], "I get a KeyError & the loop stops: Why?")
+            self.assertEqual(records[0]["code"][0]["language"], "py")
+            self.assertNotIn("document", records[0])
+            self.assertEqual(records[1], {"id": 2, "content": "plain"})
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
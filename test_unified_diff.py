@@ -0,0 +1,123 @@
+import unittest
+from patch_parser import parse_llm_output
+from unified_diff import PatchApplyError, apply, parse_unified_diff
+
+ORIGINAL = "".join(f"line {i}\n" for i in range(1, 21))
+
+MULTI_HUNK = """diff --git a/src/app.py b/src/app.py
+index 83db48f..bf269f4 100644
+--- a/src/app.py
++++ b/src/app.py
+@@ -2,3 +2,3 @@ def main():
+ line 2
+-line 3
++line three
+ line 4
+@@ -15,2 +15,3 @@
+ line 15
++inserted
+ line 16
+diff --git a/src/new.py b/src/new.py
+new file mode 100644
+--- /dev/null
++++ b/src/new.py
+@@ -0,0 +1,2 @@
++def hello():
++    return 1
+"""
+
+
+class TestUnifiedDiff(unittest.TestCase):
+
+    def test_parses_files_and_hunks(self):
+        files = parse_unified_diff(MULTI_HUNK)
+        self.assertEqual([f.path for f in files], ["src/app.py", "src/new.py"])
+        self.assertEqual([f.errors for f in files], [[], []])
+        app, new = files
+        self.assertEqual([(h.old_start, h.old_count, h.new_start, h.new_count) for h in app.hunks], [(2, 3, 2, 3), (15, 2, 15, 3)])
+        self.assertEqual(app.hunks[0].section, "def main():")
+        self.assertEqual(app.hunks[0].lines[1], ("-", "line 3"))
+        self.assertTrue(new.is_new_file)
+        self.assertEqual(new.hunks[0].new_lines, ["def hello():", "    return 1"])
+
+    def test_validates_hunk_line_counts(self):
+        short = "--- a/x.py\n+++ b/x.py\n@@ -1,3 +1,3 @@\n a\n-b\n+c\nSome prose."
+        long = "--- a/x.py\n+++ b/x.py\n@@ -1,1 +1,1 @@\n-b\n+c\n+d"
+        self.assertEqual(parse_unified_diff(short)[0].errors, ["Hunk is shorter than its header says."])
+        self.assertEqual(parse_unified_diff(long)[0].errors, ["Hunk is longer than its header says."])
+
+    def test_diff_ends_with_its_last_hunk(self):
+        text = "--- a/x.py\n+++ b/x.py\n@@ -1 +1 @@\n-b\n+c\n- a bullet point after the diff"
+        files = parse_unified_diff(text)
+        self.assertEqual(files[0].errors, ["Hunk is longer than its header says."])
+        text = "--- a/x.py\n+++ b/x.py\n@@ -1 +1 @@\n-b\n+c\n\n- a bullet point after a blank line"
+        files = parse_unified_diff(text)
+        self.assertEqual(len(files), 1)
+        self.assertEqual(files[0].errors, [])
+
+    def test_dashes_without_plus_header_are_not_a_diff(self):
+        self.assertEqual(parse_unified_diff("--- a/notes.txt\nnot a diff\n"), [])
+
+    def test_apply_in_memory(self):
+        result = apply(parse_unified_diff(MULTI_HUNK), {"src/app.py": ORIGINAL})
+        lines = result["src/app.py"].splitlines()
+        self.assertEqual(lines[2], "line three")
+        self.assertEqual(lines[14:17], ["line 15", "inserted", "line 16"])
+        self.assertEqual(len(lines), 21)
+        self.assertEqual(result["src/new.py"], "def hello():\n    return 1\n")
+
+    def test_apply_tolerates_line_offsets(self):
+        shifted = "header\nheader\n" + ORIGINAL
+        result = apply(parse_unified_diff(MULTI_HUNK)[:1], {"src/app.py": shifted})
+        lines = result["src/app.py"].splitlines()
+        self.assertEqual(lines[4], "line three")
+        self.assertEqual(lines[16:19], ["line 15", "inserted", "line 16"])
+
+    def test_apply_deletes_files(self):
+        text = "--- a/old.py\n+++ /dev/null\n@@ -1,1 +0,0 @@\n-x = 1\n"
+        self.assertEqual(apply(parse_unified_diff(text), {"old.py": "x = 1\n", "keep.py": ""}), {"keep.py": ""})
+
+    def test_apply_errors(self):
+        files = parse_unified_diff(MULTI_HUNK)
+        with self.assertRaises(PatchApplyError):
+            apply(files, {"src/app.py": "something else\n"})
+        with self.assertRaises(PatchApplyError):
+            apply(files, {})
+
+    def test_llm_output_with_fenced_bare_diff(self):
+        text = """**Patch:**
+```diff
+--- a/src/app.py
++++ b/src/app.py
+@@ -2,3 +2,3 @@
+ line 2
+-line 3
++line three
+ line 4
+@@ -16 +16 @@
+-line 16
++line sixteen
+```
+
+**Unit Test:**
+```python
+def test_line_three():
+    pass
+```
+"""
+        result = parse_llm_output(text)
+        self.assertEqual(len(result["patches"]), 1)
+        patch = result["patches"][0]
+        self.assertEqual(patch["file_path"], "src/app.py")
+        self.assertEqual(len(patch["file_diff"].hunks), 2)
+        self.assertEqual(result["unit_tests"][0]["file_path"], "src/app.py")
+        patched = apply([patch["file_diff"]], {"src/app.py": ORIGINAL})["src/app.py"]
+        self.assertIn("line sixteen\n", patched)
+
+    def test_llm_output_skips_miscounted_hunks(self):
+        text = "diff --git a/x.py b/x.py\n--- a/x.py\n+++ b/x.py\n@@ -1,1 +1,1 @@\n-a\n+b\n+c\n"
+        self.assertEqual(parse_llm_output(text)["patches"], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+import html
+import json
+import logging
+import re
+
+from dataclasses import asdict, dataclass, field
+from multiprocessing import Pool
+from typing import Iterable, Iterator, List, Union
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# A fenced Markdown block (```lang ... ``` or ~~~) or an HTML <pre> block,
+# matched in one pass so that code is never mistaken for markup.
+_CODE = re.compile(
+    r"(?P<fence>```|~~~)(?:(?P<language>[\w+#.-]+)?[ \t]*\r?\n)?(?P<code>.*?)(?P=fence)"
+    r"|<pre\b[^>]*>(?P<pre>.*?)</pre\s*>",
+    re.DOTALL | re.IGNORECASE,
+)
+_CODE_LANGUAGE = re.compile(r"\b(?:lang|language)-([\w+#.-]+)")
+_COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+# Tags that start a new line of text; other tags are removed without a trace.
+_BLOCK_TAG = re.compile(r"</?(?:p|div|br|hr|li|ul|ol|h[1-6]|blockquote|table|tr|section|article|pre)\b[^<>]*>", re.IGNORECASE)
+_TAG = re.compile(r"</?[A-Za-z][A-Za-z0-9-]*\b[^<>]*>")
+_SPACES = re.compile(r"[ \t\f\v]+")
+_LINE_END = re.compile(r" *\r?\n *")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+@dataclass
+class CodeBlock:
+    """A code block lifted out of a document."""
+    code: str
+    language: str = ""
+
+
+@dataclass
+class CleanedText:
+    """A document's prose and, separately, its code blocks in document order."""
+    text: str
+    code: List[CodeBlock] = field(default_factory=list)
+
+
+def strip_html(text: str) -> str:
+    """
+    Removes HTML tags and comments and unescapes entities.
+
+    Block-level tags become line breaks so that paragraphs do not run
+    together; inline tags disappear. A lone "<" that starts no tag is kept.
+    """
+    if "<" in text:
+        text = _COMMENT.sub("", text)
+        text = _BLOCK_TAG.sub("\n", text)
+        text = _TAG.sub("", text)
+    return html.unescape(text) if "&" in text else text
+
+
+def _segments(raw: str) -> Iterator[Union[str, CodeBlock]]:
+    """Splits a document into prose strings and code blocks, in order."""
+    if "```" not in raw and "~~~" not in raw and "<pre" not in raw and "<PRE" not in raw:
+        yield raw
+        return
+    position = 0
+    for match in _CODE.finditer(raw):
+        yield raw[position:match.start()]
+        if match.group("fence"):
+            yield CodeBlock(match.group("code").strip("\r\n"), match.group("language") or "")
+        else:
+            language = _CODE_LANGUAGE.search(raw, match.start(), match.start("pre") + 120)
+            yield CodeBlock(strip_html(match.group("pre")).strip("\r\n"), language.group(1) if language else "")
+        position = match.end()
+    yield raw[position:]
+
+
+def clean(raw: str) -> CleanedText:
+    """
+    Cleans a GitHub or Stack Overflow body.
+
+    Markdown fences and HTML <pre> blocks are lifted out as `CodeBlock`s.
+    The remaining prose has its HTML stripped and its whitespace collapsed
+    to single spaces.
+    """
+    if not raw:
+        return CleanedText("")
+    prose, code = [], []
+    for segment in _segments(raw):
+        if isinstance(segment, CodeBlock):
+            code.append(segment)
+            prose.append(" ")
+        else:
+            prose.append(strip_html(segment))
+    return CleanedText(" ".join("".join(prose).split()), code)
+
+
+def clean_text(raw: str) -> str:
+    """Returns the prose of `raw`: HTML and code blocks removed, whitespace collapsed."""
+    return clean(raw).text
+
+
+def clean_document(raw: str) -> str:
+    """
+    Cleans a document but keeps its layout, for chunking.
+
+    HTML is stripped from the prose, which keeps its line breaks (runs of
+    blank lines become one). Code blocks, including HTML <pre> blocks, are
+    kept in place as Markdown fences with their original line breaks.
+    """
+    if not raw:
+        return ""
+    parts = []
+    for segment in _segments(raw):
+        if isinstance(segment, CodeBlock):
+            parts.append(f"\n```{segment.language}\n{segment.code}\n```\n")
+        else:
+            parts.append(_LINE_END.sub("\n", _SPACES.sub(" ", strip_html(segment))))
+    return _BLANK_LINES.sub("\n\n", "".join(parts)).strip()
+
+
+def clean_many(texts: Iterable[str], processes: int = None, chunksize: int = 256) -> Iterator[CleanedText]:
+    """
+    Cleans many texts, in order, on a process pool.
+
+    Args:
+        texts: The raw texts.
+        processes: The number of worker processes; all CPUs if None, and no
+            pool at all if 1.
+        chunksize: The number of texts sent to a worker at a time.
+
+    Returns:
+        The cleaned texts, in input order.
+    """
+    if processes == 1:
+        yield from map(clean, texts)
+        return
+    with Pool(processes) as pool:
+        yield from pool.imap(clean, texts, chunksize)
+
+
+def clean_record(line: bytes) -> bytes:
+    """
+    Cleans one JSONL record: its "content" (or "document"/"text") becomes the
+    cleaned prose in "content", and its code blocks go to a "code" list.
+    """
+    record = json.loads(line)
+    key = next((k for k in ("content", "document", "text") if k in record), "content")
+    cleaned = clean(record.pop(key, ""))
+    record["content"] = cleaned.text
+    if cleaned.code:
+        record["code"] = [asdict(block) for block in cleaned.code]
+    return (json.dumps(record) + "\n").encode("utf-8")
+
+
+def clean_jsonl(input_path: str, output_path: str, processes: int = None, chunksize: int = 256) -> int:
+    """
+    Cleans a JSONL corpus with `clean_record`, on a process pool unless
+    `processes` is 1.
+
+    Workers receive raw lines and return encoded lines, so the parent process
+    only reads and writes. Record order is preserved.
+
+    Returns:
+        The number of records written.
+    """
+    count = 0
+    pool = Pool(processes) if processes != 1 else None
+    try:
+        with open(input_path, "rb") as src, open(output_path, "wb") as dst:
+            lines = (line for line in src if line.strip())
+            for line in pool.imap(clean_record, lines, chunksize) if pool else map(clean_record, lines):
+                dst.write(line)
+                count += 1
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return count
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Clean the records of a JSONL corpus, keeping code blocks in a separate field.")
+    parser.add_argument('--input', type=str, required=True)
+    parser.add_argument('--output', type=str, required=True)
+    parser.add_argument('--processes', type=int, default=None, help='Worker processes; all CPUs by default.')
+    args = parser.parse_args()
+    written = clean_jsonl(args.input, args.output, args.processes)
+    logger.info(f"Cleaned {written} records into {args.output}.")
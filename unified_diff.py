@@ -0,0 +1,370 @@
+import os
+import re
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+_GIT_HEADER = re.compile(r"^diff --git a/(\S+) b/(\S+)")
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@ ?(.*)$")
+# Extended header lines git writes between "diff --git" and the hunks.
+_EXTENDED_HEADERS = (
+    "index ", "new file mode", "deleted file mode", "old mode", "new mode",
+    "similarity index", "dissimilarity index", "rename from", "rename to",
+    "copy from", "copy to", "Binary files",
+)
+
+
+class PatchApplyError(ValueError):
+    """Raised when a hunk's context cannot be found in the file it patches."""
+
+
+@dataclass
+class Hunk:
+    """One `@@ -old_start,old_count +new_start,new_count @@` block."""
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    section: str = ""
+    # (" ", "-" or "+", text) in diff order.
+    lines: List[Tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def old_lines(self) -> List[str]:
+        return [text for kind, text in self.lines if kind != "+"]
+
+    @property
+    def new_lines(self) -> List[str]:
+        return [text for kind, text in self.lines if kind != "-"]
+
+
+@dataclass
+class FileDiff:
+    """The hunks for one file, plus the raw text they were parsed from."""
+    old_path: Optional[str] = None
+    new_path: Optional[str] = None
+    hunks: List[Hunk] = field(default_factory=list)
+    raw_lines: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def path(self) -> Optional[str]:
+        """The patched file's path; the old path for deletions."""
+        return self.new_path or self.old_path
+
+    @property
+    def is_new_file(self) -> bool:
+        return self.old_path is None and self.new_path is not None
+
+    @property
+    def is_deleted_file(self) -> bool:
+        return self.new_path is None and self.old_path is not None
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.raw_lines)
+
+    def apply(self, original: str) -> Optional[str]:
+        """
+        Applies the hunks to the file's original contents.
+
+        Each hunk is first tried at its stated line number, shifted by the
+        drift of the hunks before it, and then at increasing distances from
+        there, like `patch` does. Lines are compared without trailing
+        whitespace. Context lines keep the original text.
+
+        Args:
+            original: The current file contents ("" for a new file).
+
+        Returns:
+            The patched contents, or None if the diff deletes the file.
+
+        Raises:
+            PatchApplyError: If a hunk's context and removed lines are not
+                found in the file.
+        """
+        return self.apply_with_changes(original)[0]
+
+    def apply_with_changes(self, original: str) -> Tuple[Optional[str], List[int]]:
+        """Like `apply`, but also returns the 1-based line numbers of the added lines in the result."""
+        if self.is_deleted_file:
+            return None, []
+        lines = original.splitlines()
+        stripped = [line.rstrip() for line in lines]
+        out: List[str] = []
+        added: List[int] = []
+        pos = 0
+        drift = 0
+        for number, hunk in enumerate(self.hunks, 1):
+            old = [line.rstrip() for line in hunk.old_lines]
+            expected = (hunk.old_start - 1 if hunk.old_count else hunk.old_start) + drift
+            start = _find_block(stripped, old, expected, pos)
+            if start is None:
+                raise PatchApplyError(
+                    f"Hunk {number} (@@ -{hunk.old_start},{hunk.old_count} +{hunk.new_start},{hunk.new_count} @@) "
+                    f"does not apply to {self.path}"
+                )
+            out.extend(lines[pos:start])
+            cursor = start
+            for kind, text in hunk.lines:
+                if kind == " ":
+                    out.append(lines[cursor])
+                    cursor += 1
+                elif kind == "-":
+                    cursor += 1
+                else:
+                    out.append(text)
+                    added.append(len(out))
+            pos = cursor
+            drift = start - (expected - drift)
+        out.extend(lines[pos:])
+        if not out:
+            return "", added
+        trailing_newline = original.endswith("\n") or not original
+        return "\n".join(out) + ("\n" if trailing_newline else ""), added
+
+
+def _find_block(lines: List[str], block: List[str], expected: int, lower: int) -> Optional[int]:
+    """Finds `block` in `lines[lower:]`, trying positions nearest to `expected` first."""
+    upper = len(lines) - len(block)
+    if upper < lower:
+        return None
+    expected = min(max(expected, lower), upper)
+    for delta in range(max(expected - lower, upper - expected) + 1):
+        for start in (expected - delta, expected + delta) if delta else (expected,):
+            if lower <= start <= upper and lines[start:start + len(block)] == block:
+                return start
+    return None
+
+
+def _strip_prefix(path: str, prefix: str) -> Optional[str]:
+    path = path.split("\t")[0].strip()
+    if path == "/dev/null":
+        return None
+    return path[len(prefix):] if path.startswith(prefix) else path
+
+
+class UnifiedDiffParser:
+    """
+    Parses unified diffs one line at a time.
+
+    Both the `diff --git a/x b/x` form and the bare `--- a/x` / `+++ b/x`
+    form are recognized, with any number of files and hunks. Hunk bodies are
+    delimited by the line counts in their `@@` headers, so a diff embedded in
+    prose ends exactly where its last hunk does. A hunk that is shorter or
+    longer than its header says is recorded in the file's `errors`.
+
+    Example:
+        parser = UnifiedDiffParser()
+        for line in text.splitlines():
+            if not parser.feed(line):
+                break  # The line is not part of the diff.
+        files = parser.close()
+    """
+    def __init__(self):
+        self.files: List[FileDiff] = []
+        self.current: Optional[FileDiff] = None
+        self._state = "start"
+        self._hunk: Optional[Hunk] = None
+        self._old_left = 0
+        self._new_left = 0
+
+    @property
+    def active(self) -> bool:
+        """Whether the parser is inside a diff."""
+        return self._state != "start"
+
+    def feed(self, line: str) -> bool:
+        """
+        Consumes one line (without its newline).
+
+        Returns:
+            True if the line belongs to the diff. False if it does not, in
+            which case the diff has ended and the line should be handled by
+            the caller. Completed files are appended to `files`.
+        """
+        if self._state == "hunk":
+            return self._feed_hunk_line(line)
+
+        git_header = _GIT_HEADER.match(line)
+        if git_header:
+            self._start_file(line, old_path=git_header.group(1), new_path=git_header.group(2))
+            self._state = "header"
+            return True
+        if line.startswith("--- ") and self._state in ("start", "header", "between_hunks"):
+            if self._state != "header" or self.current.hunks or any(raw.startswith("--- ") for raw in self.current.raw_lines):
+                self._start_file(line)
+            else:
+                self.current.raw_lines.append(line)
+            self.current.old_path = _strip_prefix(line[4:], "a/")
+            self._state = "plus_header"
+            return True
+        if self._state == "plus_header":
+            if not line.startswith("+++ "):
+                # A "--- " line without "+++ " was not a diff header after all.
+                self._abandon_file()
+                return False
+            self.current.raw_lines.append(line)
+            self.current.new_path = _strip_prefix(line[4:], "b/")
+            self._state = "header"
+            return True
+        if self._state == "start":
+            return False
+
+        if line.startswith("@@"):
+            return self._start_hunk(line)
+        if self._state == "header" and line.startswith(_EXTENDED_HEADERS):
+            self.current.raw_lines.append(line)
+            return True
+        if line.startswith("\\"):
+            self.current.raw_lines.append(line)
+            return True
+        if self._state == "between_hunks" and line.startswith(("+", "-", " ")):
+            self._error("Hunk is longer than its header says.")
+            self.current.raw_lines.append(line)
+            return True
+        self._finish_file()
+        return False
+
+    def close(self) -> List[FileDiff]:
+        """Ends the diff and returns all files parsed."""
+        if self._state == "hunk":
+            self._error("Hunk is shorter than its header says.")
+        if self._state == "plus_header":
+            self._abandon_file()
+        self._finish_file()
+        return self.files
+
+    def _start_file(self, line: str, old_path: str = None, new_path: str = None):
+        self._finish_file()
+        self.current = FileDiff(old_path=old_path, new_path=new_path, raw_lines=[line])
+
+    def _abandon_file(self):
+        self.current = None
+        self._state = "start"
+
+    def _finish_file(self):
+        if self.current is not None:
+            if not self.current.hunks and not self.current.errors:
+                self._error("Diff has no hunks.")
+            self.files.append(self.current)
+        self.current = None
+        self._hunk = None
+        self._state = "start"
+
+    def _error(self, message: str):
+        if message not in self.current.errors:
+            self.current.errors.append(message)
+
+    def _start_hunk(self, line: str) -> bool:
+        self.current.raw_lines.append(line)
+        match = _HUNK_HEADER.match(line)
+        if not match:
+            self._error(f"Malformed hunk header: {line}")
+            self._state = "between_hunks"
+            return True
+        old_start, old_count, new_start, new_count, section = match.groups()
+        self._hunk = Hunk(
+            old_start=int(old_start),
+            old_count=int(old_count) if old_count is not None else 1,
+            new_start=int(new_start),
+            new_count=int(new_count) if new_count is not None else 1,
+            section=section,
+        )
+        self.current.hunks.append(self._hunk)
+        self._old_left = self._hunk.old_count
+        self._new_left = self._hunk.new_count
+        self._state = "hunk" if self._old_left or self._new_left else "between_hunks"
+        return True
+
+    def _feed_hunk_line(self, line: str) -> bool:
+        kind = line[:1] or " "
+        if kind == "\\":
+            self.current.raw_lines.append(line)
+            return True
+        if kind not in (" ", "-", "+"):
+            self._error("Hunk is shorter than its header says.")
+            self._finish_file()
+            return False
+        if (kind != "+" and self._old_left == 0) or (kind != "-" and self._new_left == 0):
+            self._error("Hunk is longer than its header says.")
+        if kind != "+":
+            self._old_left -= 1
+        if kind != "-":
+            self._new_left -= 1
+        self._hunk.lines.append((kind, line[1:]))
+        self.current.raw_lines.append(line)
+        if self._old_left <= 0 and self._new_left <= 0:
+            self._state = "between_hunks"
+        return True
+
+
+def confine_path(root: str, path: str) -> str:
+    """
+    Joins a diff path onto `root`, refusing paths that would leave it.
+
+    Diff paths come from model output, so an absolute path, a ".." component
+    or a symlink that resolves outside `root` is rejected rather than read
+    or written.
+
+    Returns:
+        The resolved path under `root`.
+
+    Raises:
+        PatchApplyError: If `path` is not inside `root`.
+    """
+    parts = path.replace("\\", "/").split("/")
+    if os.path.isabs(path) or path.startswith("/") or ".." in parts:
+        raise PatchApplyError(f"Path is outside the repository: {path}")
+    root = os.path.realpath(root)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise PatchApplyError(f"Path is outside the repository: {path}")
+    return resolved
+
+
+def parse_unified_diff(text: str) -> List[FileDiff]:
+    """
+    Parses every unified diff in `text`, skipping the lines around them.
+
+    Returns:
+        One FileDiff per file, in order, including those with `errors`.
+    """
+    parser = UnifiedDiffParser()
+    for line in text.splitlines():
+        if not parser.feed(line):
+            # The line ended the previous diff; it may start the next one.
+            parser.feed(line)
+    return parser.close()
+
+
+def apply(file_diffs: Iterable[FileDiff], files: Dict[str, str]) -> Dict[str, str]:
+    """
+    Applies diffs to in-memory file contents without touching the disk.
+
+    Args:
+        file_diffs: The parsed diffs.
+        files: The current contents keyed by path. Paths missing from it are
+            only allowed for new files.
+
+    Returns:
+        A new dictionary with the patched contents. Deleted files are removed.
+
+    Raises:
+        PatchApplyError: If a diff has parse errors, targets a missing file
+            or does not apply.
+    """
+    result = dict(files)
+    for file_diff in file_diffs:
+        if file_diff.errors:
+            raise PatchApplyError(f"Diff for {file_diff.path} is invalid: {' '.join(file_diff.errors)}")
+        source = file_diff.old_path
+        if source is not None and source not in result:
+            raise PatchApplyError(f"File not found: {source}")
+        patched = file_diff.apply(result.get(source, "") if source is not None else "")
+        if source is not None and source != file_diff.new_path:
+            del result[source]
+        if patched is not None:
+            result[file_diff.new_path] = patched
+    return result